@@ -0,0 +1,197 @@
+"""Computer drivers that race with the same inputs a player has.
+
+An `AIDriver` owns some of the cars in a Simulation and, once per physics
+step, writes an INPUT_* bitmask for each of them into the inputs list, so
+recordings, replays and the physics see no difference from a keyboard.
+
+Everything expensive is done once up front: the arc-length centreline table
+(`sim.track.line`) and a target speed for every station, from the
+curvature the car can follow at its turn rate and how early it has to brake
+for what comes next. Per tick each car walks its station index forward from
+the last one and does a couple of trig calls, so the cost is O(1) per car.
+Cars in the way are found with one spatial-hash pass over the field per tick;
+other AI cars are followed, and anyone else's car is passed by aiming to one
+side of the line when it is slow or stopped.
+"""
+
+import math
+from array import array
+from time import perf_counter
+
+from profiler import PHASE_AI
+from simulation import (
+    CAR_LENGTH,
+    CAR_WIDTH,
+    FRICTION_REFERENCE_HZ,
+    INPUT_DOWN,
+    INPUT_LEFT,
+    INPUT_RIGHT,
+    INPUT_UP,
+    PHYSICS_DT,
+    collision_pairs,
+)
+
+AI_LOOKAHEAD = 20.0  # pixels ahead of the car's station to steer at...
+AI_LOOKAHEAD_TIME = 0.25  # ...plus this many seconds of travel at its current speed
+AI_CORNER_MARGIN = 0.8  # fraction of the turn-rate-limited corner speed to aim for
+AI_BRAKE_MARGIN = 0.5  # fraction of full braking assumed when planning ahead
+AI_SPEED_BAND = 2.0  # pixels per second either side of the target left to coast
+AI_PACE = (0.92, 1.0)  # range of per-car pace, drawn from the race seed
+AI_AVOID_DIST = 3.0 * CAR_LENGTH  # how far ahead a car counts as in the way
+AI_AVOID_WIDTH = 1.5 * CAR_WIDTH  # ...and how far either side of the nose
+AI_AVOID_OFFSET = 0.38  # sideways shift of the aim point to pass, in track widths
+AI_AVOID_HOLD = 0.5  # seconds to stay on the passing side once clear
+AI_PASS_SPEED = 0.5  # pass other drivers' cars slower than this fraction of our target
+AI_FOLLOW_GAP = 1.5 * CAR_LENGTH  # distance kept to the car ahead when queueing...
+AI_FOLLOW_GAIN = 2.0  # ...closed at this many px/s per pixel of error
+
+
+def top_speed(params: dict, dt: float = PHYSICS_DT) -> float:
+    """Speed at which full throttle exactly balances friction."""
+    friction = params["friction"] ** (dt * FRICTION_REFERENCE_HZ)
+    return params["car_speed"] * dt * friction / (1.0 - friction)
+
+
+def target_speeds(line, params: dict, dt: float = PHYSICS_DT):
+    """Fastest sensible speed at every station of `line` for these handling params."""
+    top = top_speed(params, dt)
+    turn_speed = params["turn_speed"]
+    speeds = []
+    for curvature in line.curvatures:
+        bend = abs(curvature)
+        # Following a radius r at speed v needs a turn rate of v / r.
+        speeds.append(min(top, turn_speed * AI_CORNER_MARGIN / bend) if bend > 0.0 else top)
+
+    # Sweep backwards so every station leaves room to brake for the next one.
+    # Twice round covers the braking zones that wrap past station 0.
+    brake = params["car_speed"] * AI_BRAKE_MARGIN
+    reach = 2.0 * brake * line.spacing
+    count = len(speeds)
+    for _ in range(2):
+        for i in range(count - 1, -1, -1):
+            limit = math.sqrt(speeds[(i + 1) % count] ** 2 + reach)
+            if speeds[i] > limit:
+                speeds[i] = limit
+    return array("d", speeds)
+
+
+class AIDriver:
+    def __init__(self, sim, cars=None) -> None:
+        """Drive the cars at indices `cars` of `sim` (all of them by default)."""
+        self.line = sim.track.line
+        self.avoid_offset = sim.track.width * AI_AVOID_OFFSET
+        self.cars = list(range(len(sim.cars))) if cars is None else list(cars)
+        self.speeds = target_speeds(self.line, sim.params)
+        self.pace = [sim.rng.uniform(*AI_PACE) for _ in self.cars]
+        self.deadband = sim.params["turn_speed"] * PHYSICS_DT * 0.5
+        self.slot_of = [-1] * len(sim.cars)
+        for slot, idx in enumerate(self.cars):
+            self.slot_of[idx] = slot
+        self.index = []
+        self.offset = []  # sideways shift of each car's aim point while passing
+        self.hold = []  # ticks left before the shift is dropped
+        self.limit = [math.inf] * len(self.cars)  # this tick's speed cap behind traffic
+        self.reset(sim)
+
+    def reset(self, sim) -> None:
+        """Find every car on the line again, e.g. after the grid is reset."""
+        line = self.line
+        self.index = [line.nearest(sim.cars[idx]["x"], sim.cars[idx]["y"], sim.cars[idx]["angle"])
+                      for idx in self.cars]
+        self.offset = [0.0] * len(self.cars)
+        self.hold = [0] * len(self.cars)
+
+    def _find_traffic(self, cars) -> None:
+        """Decide how every AI car with another car just ahead deals with it."""
+        xs = [car["x"] for car in cars]
+        ys = [car["y"] for car in cars]
+        slot_of = self.slot_of
+        limit = self.limit
+        for slot in range(len(limit)):
+            limit[slot] = math.inf
+        hold_ticks = int(AI_AVOID_HOLD / PHYSICS_DT)
+        reach2 = AI_AVOID_DIST * AI_AVOID_DIST
+        headings = {}
+        for a, b in collision_pairs(xs, ys, AI_AVOID_DIST):
+            dx = xs[b] - xs[a]
+            dy = ys[b] - ys[a]
+            if dx * dx + dy * dy >= reach2 or cars[a]["on_overpass"] != cars[b]["on_overpass"]:
+                continue
+            for me, other, sign in ((a, b, 1.0), (b, a, -1.0)):
+                slot = slot_of[me]
+                if slot < 0:
+                    continue
+                heading = headings.get(me)
+                if heading is None:
+                    angle = cars[me]["angle"]
+                    heading = headings[me] = (math.cos(angle), math.sin(angle))
+                cos_a, sin_a = heading
+                ahead = sign * (dx * cos_a + dy * sin_a)
+                side = sign * (dy * cos_a - dx * sin_a)
+                if not (0.0 < ahead < AI_AVOID_DIST and abs(side) < AI_AVOID_WIDTH):
+                    continue
+                other_car = cars[other]
+                closing = other_car["vel"] * math.cos(other_car["angle"] - cars[me]["angle"])
+                if (slot_of[other] >= 0
+                        or closing > self.speeds[self.index[slot]] * self.pace[slot] * AI_PASS_SPEED):
+                    # Queue behind; AI cars ahead always get going again.
+                    follow = closing + (ahead - AI_FOLLOW_GAP) * AI_FOLLOW_GAIN
+                    limit[slot] = min(limit[slot], max(0.0, follow))
+                    continue
+                if self.hold[slot] == 0:
+                    # Go round whichever side the other car leaves more room on.
+                    self.offset[slot] = -self.avoid_offset if side > 0.0 else self.avoid_offset
+                self.hold[slot] = hold_ticks
+
+    def update(self, sim, inputs) -> None:
+        """Write this step's input bitmask for each AI car into `inputs`."""
+        prof = sim.profiler
+        if prof is not None:
+            start = perf_counter()
+        line = self.line
+        xs = line.xs
+        ys = line.ys
+        count = line.count
+        spacing = line.spacing
+        speeds = self.speeds
+        deadband = self.deadband
+        cars = sim.cars
+        index = self.index
+        offset = self.offset
+        hold = self.hold
+        limit = self.limit
+        if len(cars) > 1:
+            self._find_traffic(cars)
+        for slot, idx in enumerate(self.cars):
+            car = cars[idx]
+            x = car["x"]
+            y = car["y"]
+            vel = car["vel"]
+            here = index[slot] = line.track(index[slot], x, y)
+
+            ahead = int((AI_LOOKAHEAD + abs(vel) * AI_LOOKAHEAD_TIME) / spacing) + 1
+            aim = (here + ahead) % count
+            aim_x = xs[aim]
+            aim_y = ys[aim]
+            if hold[slot]:
+                hold[slot] -= 1
+                # Positive offsets are to the right of the direction of travel.
+                heading = line.headings[aim]
+                aim_x -= math.sin(heading) * offset[slot]
+                aim_y += math.cos(heading) * offset[slot]
+            error = math.atan2(aim_y - y, aim_x - x) - car["angle"]
+            error = (error + math.pi) % (2 * math.pi) - math.pi
+
+            target = min(speeds[(here + 1) % count] * self.pace[slot], limit[slot])
+            bits = 0
+            if vel < target - AI_SPEED_BAND:
+                bits = INPUT_UP
+            elif vel > target + AI_SPEED_BAND:
+                bits = INPUT_DOWN
+            if error > deadband:
+                bits |= INPUT_RIGHT
+            elif error < -deadband:
+                bits |= INPUT_LEFT
+            inputs[idx] = bits
+        if prof is not None:
+            prof.add(PHASE_AI, start)
@@ -0,0 +1,225 @@
+"""Headless batch races across a process pool, for tuning the handling.
+
+    python3 batch.py --param car_speed=300,340,380 --param friction=0.94,0.95 \
+        --repeats 20 --laps 3 --out results.jsonl
+
+Every combination of the --param values is raced --repeats times with
+different seeds. Each race is independent, so they are spread over a pool of
+worker processes and results stream back as they finish: one JSON line per
+race in --out, plus a per-combination summary at the end (--summary CSV to
+keep it). Every car is an AI driver, so target speeds adapt to the handling
+being tested. Workers load the baked track once and reuse it for every race
+they run.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+from ai import AIDriver
+from simulation import DEFAULT_LAPS, DEFAULT_PARAMS, PHYSICS_DT, Simulation, load_track
+from track import DEFAULT_TRACK
+
+DEFAULT_TIME_LIMIT = 300.0  # simulated seconds before a race is called
+
+
+# Set in each worker by _init_worker (and inherited from the parent on fork).
+_track = None
+_config = None
+
+
+def _init_worker(config: dict) -> None:
+    global _track, _config
+    _config = config
+    if _track is None:
+        _track = load_track(config["track"])
+
+
+def run_race(task):
+    """Race one (race id, params, seed) task to completion; returns a result dict."""
+    race_id, params, seed = task
+    config = _config
+    sim = Simulation(config["cars"], track=_track, seed=seed, params=params)
+    sim.skip_countdown()
+    driver = AIDriver(sim)
+    inputs = [0] * len(sim.cars)
+    laps_target = config["laps"]
+    max_ticks = int(config["time_limit"] / PHYSICS_DT)
+    lap_times = [[] for _ in sim.cars]
+    seen_laps = [0] * len(sim.cars)
+    # Each car's collisions and off-track time at the moment it finished.
+    at_finish = [None] * len(sim.cars)
+    finished = 0
+
+    for _ in range(max_ticks):
+        driver.update(sim, inputs)
+        sim.step(PHYSICS_DT, inputs)
+        for idx, car in enumerate(sim.cars):
+            if car["laps"] != seen_laps[idx]:
+                seen_laps[idx] = car["laps"]
+                # Cars that finish early keep circulating; their extra laps
+                # would weight the averages towards the fastest cars.
+                if car["laps"] <= laps_target:
+                    lap_times[idx].append(car["last_lap_duration"])
+                if car["laps"] == laps_target:
+                    at_finish[idx] = (car["collisions"], car["off_track_time"])
+                    finished += 1
+        if finished == len(sim.cars):
+            break
+
+    for idx, car in enumerate(sim.cars):
+        if at_finish[idx] is None:
+            at_finish[idx] = (car["collisions"], car["off_track_time"])
+    return {
+        "race": race_id,
+        "seed": seed,
+        "params": params,
+        "time": sim.time,
+        "cars": [
+            {
+                "name": car["name"],
+                "laps": car["laps"],
+                "lap_times": lap_times[idx],
+                "best_lap": min(lap_times[idx]) if lap_times[idx] else None,
+                "finished": car["laps"] >= laps_target,
+                "collisions": at_finish[idx][0],
+                "off_track_time": at_finish[idx][1],
+            }
+            for idx, car in enumerate(sim.cars)
+        ],
+    }
+
+
+def parse_param(text: str):
+    """'car_speed=300,340' -> ('car_speed', [300.0, 340.0])"""
+    name, _, values = text.partition("=")
+    if name not in DEFAULT_PARAMS or not values:
+        raise argparse.ArgumentTypeError(
+            f"expected NAME=V1,V2,... with NAME one of {', '.join(DEFAULT_PARAMS)}")
+    try:
+        return name, [float(value) for value in values.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad value list: {values}") from None
+
+
+def param_grid(axes):
+    """Every combination of the swept values, as params dicts."""
+    if not axes:
+        return [{}]
+    names = [name for name, _ in axes]
+    return [dict(zip(names, values)) for values in itertools.product(*(values for _, values in axes))]
+
+
+class Summary:
+    """Running per-combination aggregates, updated as race results arrive."""
+
+    def __init__(self) -> None:
+        self.rows = {}
+
+    def add(self, result: dict) -> None:
+        key = tuple(sorted(result["params"].items()))
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = {"races": 0, "cars": 0, "finished": 0, "laps": 0, "lap_time": 0.0,
+                                    "best_lap": math.inf, "collisions": 0, "off_track_time": 0.0}
+        row["races"] += 1
+        for car in result["cars"]:
+            row["cars"] += 1
+            row["laps"] += len(car["lap_times"])
+            row["lap_time"] += sum(car["lap_times"])
+            row["collisions"] += car["collisions"]
+            row["off_track_time"] += car["off_track_time"]
+            row["finished"] += car["finished"]
+            if car["best_lap"] is not None:
+                row["best_lap"] = min(row["best_lap"], car["best_lap"])
+
+    def table(self):
+        """Rows of (params, races, finish rate, mean lap, best lap, collisions/car, off-track s/car)."""
+        out = []
+        for key, row in sorted(self.rows.items()):
+            mean_lap = row["lap_time"] / row["laps"] if row["laps"] else None
+            best_lap = row["best_lap"] if row["best_lap"] < math.inf else None
+            out.append((dict(key), row["races"], row["finished"] / row["cars"], mean_lap, best_lap,
+                        row["collisions"] / row["cars"], row["off_track_time"] / row["cars"]))
+        return out
+
+
+def format_time(value) -> str:
+    return f"{value:.3f}" if value is not None else "--"
+
+
+def main(argv=None) -> None:
+    global _track
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--param", type=parse_param, action="append", default=[], metavar="NAME=V1,V2",
+                        help="sweep a handling parameter over these values (repeatable)")
+    parser.add_argument("--repeats", type=int, default=10, help="races per parameter combination")
+    parser.add_argument("--cars", type=int, default=4)
+    parser.add_argument("--track", default=DEFAULT_TRACK, help="track name under tracks/, or a path")
+    parser.add_argument("--laps", type=int, default=DEFAULT_LAPS)
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT,
+                        help="simulated seconds before an unfinished race is stopped")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first race")
+    parser.add_argument("--out", metavar="JSONL", help="stream one JSON line per race here")
+    parser.add_argument("--summary", metavar="CSV", help="write the per-combination summary here")
+    args = parser.parse_args(argv)
+
+    tasks = []
+    for params in param_grid(args.param):
+        for _ in range(args.repeats):
+            tasks.append((len(tasks), params, args.seed + len(tasks)))
+    config = {"cars": args.cars, "laps": args.laps, "time_limit": args.time_limit, "track": args.track}
+
+    # Load (or bake) the track before the pool starts so forked workers inherit it.
+    try:
+        _track = load_track(args.track)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+    workers = max(1, min(args.workers, len(tasks)))
+    chunksize = max(1, len(tasks) // (workers * 8))
+    summary = Summary()
+    out = open(args.out, "w") if args.out else None
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(config,)) as pool:
+            for done, result in enumerate(pool.imap_unordered(run_race, tasks, chunksize), 1):
+                summary.add(result)
+                if out is not None:
+                    out.write(json.dumps(result) + "\n")
+                if done % max(1, len(tasks) // 20) == 0 or done == len(tasks):
+                    rate = done / (time.perf_counter() - start)
+                    print(f"\r{done}/{len(tasks)} races, {rate:.1f}/s", end="", file=sys.stderr, flush=True)
+    finally:
+        if out is not None:
+            out.close()
+    print(file=sys.stderr)
+
+    names = [name for name, _ in args.param]
+    header = names + ["races", "finish_rate", "mean_lap", "best_lap", "collisions_per_car", "off_track_s_per_car"]
+    print("  ".join(f"{name:>12}" for name in header))
+    rows = summary.table()
+    for params, races, finish_rate, mean_lap, best_lap, collisions, off_track in rows:
+        cells = [f"{params[name]:g}" for name in names]
+        cells += [str(races), f"{finish_rate:.0%}", format_time(mean_lap), format_time(best_lap),
+                  f"{collisions:.2f}", f"{off_track:.2f}"]
+        print("  ".join(f"{cell:>12}" for cell in cells))
+
+    if args.summary:
+        with open(args.summary, "w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(header)
+            for params, races, finish_rate, mean_lap, best_lap, collisions, off_track in rows:
+                writer.writerow([params[name] for name in names]
+                                + [races, finish_rate, mean_lap, best_lap, collisions, off_track])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""Benchmarks for the simulation and rendering hot paths.
+
+    python3 bench.py                              # run the suite, print results
+    python3 bench.py --json results.json          # ...and save them
+    python3 bench.py --compare baseline.json      # fail on regressions vs a saved run
+    python3 bench.py --sweep --cars 2 40 200      # ticks/sec against car count
+
+The Tk render case needs a display. It uses $DISPLAY when set, otherwise it
+starts a private Xvfb if one is installed, and is skipped if neither works.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from simulation import BARRIER_RADIUS, COLLISION_DIST, INPUT_LEFT, INPUT_UP, PHYSICS_DT, Simulation
+from vectorized import ArraySimulation, np
+
+BENCH_DT = PHYSICS_DT
+MIN_SECONDS = 0.25  # minimum wall time per measurement
+REPEATS = 3  # best of
+DEFAULT_TOLERANCE = 0.15  # allowed fractional slowdown before --compare fails
+
+
+def ticks_per_second(sim, ticks: int) -> float:
+    # Half the field turns so cars spread out instead of driving in a line.
+    inputs = [INPUT_UP | (INPUT_LEFT if i % 2 else 0) for i in range(len(sim.cars))]
+    sim.skip_countdown()
+    start = time.perf_counter()
+    for _ in range(ticks):
+        sim.step(BENCH_DT, inputs)
+    return ticks / (time.perf_counter() - start)
+
+
+def bench_car_counts(counts, ticks: int) -> None:
+    paths = [("dict", Simulation)]
+    if np is not None:
+        paths.append(("array", ArraySimulation))
+    else:
+        print("numpy not installed: skipping the array path")
+
+    print(f"{'cars':>6}" + "".join(f"{name + ' ticks/s':>18}" for name, _ in paths))
+    for count in counts:
+        row = f"{count:>6}"
+        for _, sim_cls in paths:
+            row += f"{ticks_per_second(sim_cls(count), ticks):>18.0f}"
+        print(row)
+
+
+def measure(fn, ops_per_call: int = 1) -> float:
+    """Best-of-REPEATS operations per second for `fn`."""
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS / 4:
+            break
+        calls *= 2
+    calls = max(1, int(calls * MIN_SECONDS / elapsed))
+
+    best = 0.0
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        best = max(best, calls * ops_per_call / elapsed)
+    return best
+
+
+def rate(value: float, unit: str) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": True}
+
+
+def cost(value: float, unit: str) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": False}
+
+
+def bench_on_track(sim) -> dict:
+    rng = random.Random(1)
+    points = [(rng.uniform(0, 900), rng.uniform(0, 600)) for _ in range(1000)]
+    is_on_track = sim._is_on_track
+
+    def run():
+        for x, y in points:
+            is_on_track(x, y)
+
+    return rate(measure(run, len(points)), "calls/s")
+
+
+def bench_barriers(sim) -> dict:
+    # Cars scraping the barriers, so every call finds segments to test.
+    rng = random.Random(3)
+    line = sim.line
+    offset = sim.track.width / 2 + sim.track.runoff - BARRIER_RADIUS * 0.5
+    points = []
+    for _ in range(1000):
+        i = rng.randrange(line.count)
+        side = rng.choice((-1.0, 1.0)) * offset
+        points.append((line.xs[i] - math.sin(line.headings[i]) * side, line.ys[i] + math.cos(line.headings[i]) * side))
+    push_out = sim.barriers.push_out
+
+    def run():
+        for x, y in points:
+            push_out(x, y, BARRIER_RADIUS, False)
+
+    return rate(measure(run, len(points)), "calls/s")
+
+
+def bench_car_shapes(simple: bool = False) -> dict:
+    # Importing game pulls in tkinter, but shape maths never touches a display.
+    from game import FULL_PARTS, SIMPLE_PARTS, Game
+
+    game = Game.__new__(Game)
+    parts = SIMPLE_PARTS if simple else FULL_PARTS
+    poses = [(450.0 + i, 300.0 - i, i * 0.1) for i in range(100)]
+
+    def run():
+        for x, y, angle in poses:
+            game._car_shape_points(x, y, angle, parts)
+
+    return rate(measure(run, len(poses)), "cars/s")
+
+
+def bench_check_timing(sim) -> dict:
+    car = sim.cars[0]
+    timing = sim.timing
+    x = timing.xs[0]
+    y = timing.ys[0] + 20
+    station = timing.stations[0]
+
+    def run():
+        # A finish crossing that times a sector and a lap, the costliest path.
+        for _ in range(100):
+            car["prev_x"] = x - 3
+            car["prev_y"] = y
+            car["x"] = x + 3
+            car["y"] = y
+            car["station"] = station
+            car["next_line"] = 0
+            car["timed_lap"] = True
+            car["line_time"] = 5.0
+            sim._check_timing(car, 10.0, BENCH_DT)
+
+    return rate(measure(run, 100), "calls/s")
+
+
+def bench_collisions(num_cars: int) -> dict:
+    sim = Simulation(num_cars)
+    rng = random.Random(2)
+    # Pack the field into a loose jam so the narrow phase has real work.
+    side = math.sqrt(num_cars) * COLLISION_DIST * 1.2
+    start = [(200 + rng.uniform(0, side), 200 + rng.uniform(0, side)) for _ in range(num_cars)]
+
+    def run():
+        for car, (x, y) in zip(sim.cars, start):
+            car["x"] = x
+            car["y"] = y
+            car["vel"] = 50.0
+        sim._resolve_collisions()
+
+    return rate(measure(run), "calls/s")
+
+
+def bench_full_tick(sim_cls, num_cars: int) -> dict:
+    sim = sim_cls(num_cars)
+    inputs = [INPUT_UP | (INPUT_LEFT if i % 2 else 0) for i in range(num_cars)]
+    sim.skip_countdown()
+    for _ in range(240):  # let the field spread out first
+        sim.step(BENCH_DT, inputs)
+    return rate(measure(lambda: sim.step(BENCH_DT, inputs)), "ticks/s")
+
+
+def bench_env_steps(num_envs: int) -> dict:
+    from env import RaceEnv
+
+    env = RaceEnv(num_envs)
+    env.reset()
+    actions = np.array([INPUT_UP | (INPUT_LEFT if i % 2 else 0) for i in range(num_envs)])
+    return rate(measure(lambda: env.step(actions), num_envs), "env-steps/s")
+
+
+def bench_snapshots(num_cars: int) -> dict:
+    from rollback import SnapshotRing
+
+    sim = Simulation(num_cars)
+    ring = SnapshotRing(sim)
+    inputs = [INPUT_UP] * num_cars
+
+    def run():
+        ring.save(sim, inputs)
+        ring.restore(sim, sim.ticks)
+
+    return rate(measure(run), "save+restore/s")
+
+
+def start_virtual_display():
+    """Start Xvfb on a free display number; returns the process or None."""
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return None
+    for number in range(99, 120):
+        if os.path.exists(f"/tmp/.X{number}-lock"):
+            continue
+        proc = subprocess.Popen([xvfb, f":{number}", "-screen", "0", "1024x768x24", "-nolisten", "tcp"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(0.5)
+        if proc.poll() is None:
+            os.environ["DISPLAY"] = f":{number}"
+            return proc
+    return None
+
+
+def bench_tk_render(num_cars: int, frames: int = 300, simple_cars: bool = None):
+    """Milliseconds of Python + Tk work per rendered frame, or None without a display."""
+    xvfb = None
+    if not os.environ.get("DISPLAY"):
+        xvfb = start_virtual_display()
+        if xvfb is None:
+            return None
+    try:
+        import tkinter as tk
+        from game import Game
+
+        try:
+            root = tk.Tk()
+        except tk.TclError:
+            return None
+        sim = Simulation(num_cars)
+        sim.skip_countdown()
+        game = Game(root, sim, simple_cars=simple_cars)
+        for keysym in ("w", "up"):
+            game.inputs.press(keysym, 0.0)
+        root.update()
+
+        best = float("inf")
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            for _ in range(frames):
+                root.after_cancel(game.after_id)
+                game.last_time -= 1.0 / 60.0  # one 60 Hz frame of physics each time
+                game._tick()
+                root.update_idletasks()
+            best = min(best, (time.perf_counter() - start) / frames * 1000.0)
+        root.after_cancel(game.after_id)
+        root.destroy()
+        return cost(best, "ms/frame")
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+            del os.environ["DISPLAY"]
+
+
+def run_suite() -> dict:
+    sim = Simulation()
+    sim.skip_countdown()
+    results = {
+        "is_on_track": bench_on_track(sim),
+        "barrier_push_out": bench_barriers(sim),
+        "car_shape_points": bench_car_shapes(),
+        "car_outline_points": bench_car_shapes(simple=True),
+        "check_timing": bench_check_timing(sim),
+        "resolve_collisions_2": bench_collisions(2),
+        "resolve_collisions_200": bench_collisions(200),
+        "snapshot_restore_20": bench_snapshots(20),
+    }
+    for count in (2, 20, 200):
+        results[f"tick_dict_{count}"] = bench_full_tick(Simulation, count)
+        if np is not None:
+            results[f"tick_array_{count}"] = bench_full_tick(ArraySimulation, count)
+    if np is not None:
+        results["env_steps_256"] = bench_env_steps(256)
+    for name, count, simple in (("tk_render_2", 2, False), ("tk_render_20", 20, False),
+                                ("tk_render_20_simple", 20, True)):
+        render = bench_tk_render(count, simple_cars=simple)
+        if render is None:
+            print(f"no display or Xvfb: skipping {name}")
+        else:
+            results[name] = render
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print a comparison against a baseline; False if anything regressed."""
+    ok = True
+    print(f"\n{'benchmark':<26}{'baseline':>14}{'current':>14}{'change':>9}")
+    for name, base in baseline["results"].items():
+        current = results.get(name)
+        if current is None:
+            print(f"{name:<26}{base['value']:>14.4g}{'missing':>14}")
+            continue
+        change = current["value"] / base["value"] - 1.0 if base["value"] else 0.0
+        # Normalise so positive always means slower.
+        slowdown = -change if base["higher_is_better"] else change
+        flag = ""
+        if slowdown > tolerance:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:<26}{base['value']:>14.4g}{current['value']:>14.4g}{change:>+9.1%}{flag}")
+    return ok
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a saved JSON run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed fractional slowdown per benchmark (default %(default)s)")
+    parser.add_argument("--sweep", action="store_true", help="print ticks/sec against car count instead")
+    parser.add_argument("--cars", type=int, nargs="+", default=[2, 10, 40, 100, 200])
+    parser.add_argument("--ticks", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        bench_car_counts(args.cars, args.ticks)
+        return
+
+    results = run_suite()
+    for name, result in results.items():
+        print(f"{name:<26}{result['value']:>14.4g} {result['unit']}")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
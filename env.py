@@ -0,0 +1,340 @@
+"""Batched training environment: many independent one-car races stepped in lockstep.
+
+    env = RaceEnv(256, seed=1)
+    obs = env.reset()                                   # (256, env.observation_size)
+    obs, rewards, terminated, truncated, info = env.step(actions)
+
+Actions are the INPUT_* bitmasks Simulation.step takes, one per race. Every
+race is a single car on the same track, so the whole batch is a handful of
+NumPy operations per physics tick: the handling of Simulation.step (the same
+`vectorized.drive` ArraySimulation steps with), on-track tests against the
+baked distance field, and arc-length progress tracked station by station as in
+ArraySimulation, plus the barriers for the cars out by them. Races that finish
+or run out of steps are reset in place, and the observation returned for them
+is the first of the next episode (as gym vector environments do).
+
+Rewards are lap progress (PROGRESS_REWARD per lap, negative when going the
+wrong way) less OFF_TRACK_PENALTY per second off the road. Observations are
+speed, heading and lateral offset relative to the centreline, curvature ahead,
+the off-track flag, and distances to the road edge along rays fanned out
+from the nose. Rays are sphere-traced through the distance field: each march
+moves by the field value, the distance to the nearest edge, so a ray needs a
+few lookups rather than a sample every pixel.
+
+`python3 env.py` (or `bench.py`) measures env-steps per second.
+"""
+
+import argparse
+import time
+
+from ai import top_speed
+from simulation import (
+    BARRIER_RADIUS,
+    CAR_WIDTH,
+    DEFAULT_PARAMS,
+    INPUT_DOWN,
+    INPUT_LEFT,
+    INPUT_RIGHT,
+    INPUT_UP,
+    PHYSICS_DT,
+    SAFE_TRAVEL,
+    grid_slot,
+    load_track,
+)
+from track import BARRIER_TOLERANCE, FIELD_CELL
+from vectorized import drive, field_distance, np, push_off_barriers, require_numpy, walk_stations
+
+ACTION_REPEAT = 4  # physics ticks per env step: decisions at 30 Hz
+DEFAULT_LAPS = 1  # an episode ends after this many laps from wherever it started...
+DEFAULT_MAX_STEPS = 3000  # ...or after this many env steps
+PROGRESS_REWARD = 100.0  # per lap of progress
+OFF_TRACK_PENALTY = 2.0  # per second off the road
+RAY_ANGLES = (-90, -60, -30, -15, 0, 15, 30, 60, 90)  # degrees either side of the heading
+RAY_RANGE = 300.0  # pixels; longer rays read as this
+RAY_MARCHES = 16  # sphere-tracing iterations per ray
+RAY_HIT = 1.0  # a ray stops this close to the edge
+LOOKAHEAD = (20.0, 60.0, 120.0)  # pixels ahead at which the curvature is observed
+
+
+class RaceEnv:
+    """`num_envs` independent races of one car each, stepped together.
+
+    `params` overrides DEFAULT_PARAMS as in Simulation. With `random_starts`
+    every episode begins at a random point of the lap, facing along it,
+    instead of on pole.
+    """
+
+    def __init__(self, num_envs: int, track=None, params: dict = None, seed: int = 0,
+                 laps: int = DEFAULT_LAPS, max_steps: int = DEFAULT_MAX_STEPS,
+                 action_repeat: int = ACTION_REPEAT, random_starts: bool = False) -> None:
+        require_numpy()
+        if track is None:
+            track = load_track()
+        self.track = track
+        self.field = track.field
+        self.barriers = track.barriers
+        self.barrier_clear = track.runoff - BARRIER_RADIUS - BARRIER_TOLERANCE - FIELD_CELL
+        self.params = dict(DEFAULT_PARAMS)
+        if params:
+            unknown = set(params) - set(DEFAULT_PARAMS)
+            if unknown:
+                raise ValueError(f"unknown physics parameters: {', '.join(sorted(unknown))}")
+            self.params.update(params)
+        self.num_envs = num_envs
+        self.laps = laps
+        self.max_steps = max_steps
+        self.action_repeat = action_repeat
+        self.random_starts = random_starts
+        self.rng = np.random.default_rng(seed)
+        self.world_w, self.world_h = track.size
+        self._top_speed = top_speed(self.params)
+
+        line = track.line
+        self.line = line
+        self._line_x = np.asarray(line.xs)
+        self._line_y = np.asarray(line.ys)
+        self._line_heading = np.asarray(line.headings)
+        self._line_cos = np.cos(self._line_heading)
+        self._line_sin = np.sin(self._line_heading)
+        self._line_curvature = np.asarray(line.curvatures)
+        self._line_bridge = np.frombuffer(track.on_bridge, dtype=np.uint8).astype(bool)
+        self._lookahead = np.array([int(round(d / line.spacing)) for d in LOOKAHEAD])
+        self._rows = np.arange(num_envs)
+        self._ray_angles = np.radians(np.array(RAY_ANGLES, dtype=float))
+        finish_x, finish_y = track.finish
+        self._finish_station = line.nearest(finish_x, finish_y, 0.0)
+        pole_x, pole_y, pole_angle, self._pole_overpass = grid_slot(track, 0, 1)
+        self._pole = (pole_x, pole_y, pole_angle, line.nearest(pole_x, pole_y, pole_angle))
+
+        self.x = np.zeros(num_envs)
+        self.y = np.zeros(num_envs)
+        self.angle = np.zeros(num_envs)
+        self.vel = np.zeros(num_envs)
+        self.off_track = np.zeros(num_envs, dtype=bool)
+        self.on_overpass = np.zeros(num_envs, dtype=bool)
+        self.station = np.zeros(num_envs, dtype=np.int64)
+        self.stations = np.zeros(num_envs, dtype=np.int64)
+        self.progress = np.zeros(num_envs)
+        self.start_progress = np.zeros(num_envs)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self._bits = np.zeros(num_envs, dtype=np.int64)
+
+    @property
+    def observation_size(self) -> int:
+        return 5 + len(LOOKAHEAD) + len(RAY_ANGLES)
+
+    def reset(self):
+        """Start every race afresh; returns the first observations."""
+        self._reset_envs(self._rows)
+        return self._observe()
+
+    def step(self, actions):
+        """Apply one INPUT_* bitmask per race for `action_repeat` physics ticks.
+
+        Returns (observations, rewards, terminated, truncated, info); races
+        that ended are already reset, and info["final_progress"] holds the
+        laps they covered.
+        """
+        bits = self._bits
+        bits[:] = actions
+        throttle = (bits & INPUT_UP != 0).astype(float) - (bits & INPUT_DOWN != 0)
+        steer = (bits & INPUT_RIGHT != 0).astype(float) - (bits & INPUT_LEFT != 0)
+        start = self.progress.copy()
+        off_time = np.zeros(self.num_envs)
+        for _ in range(self.action_repeat):
+            self._tick(throttle, steer, off_time)
+
+        self.steps += 1
+        covered = self.progress - self.start_progress
+        rewards = (self.progress - start) * PROGRESS_REWARD - off_time * OFF_TRACK_PENALTY
+        terminated = covered >= self.laps
+        truncated = ~terminated & (self.steps >= self.max_steps)
+        info = {"final_progress": covered}
+        ended = np.flatnonzero(terminated | truncated)
+        if len(ended):
+            self._reset_envs(ended)
+        return self._observe(), rewards, terminated, truncated, info
+
+    def _tick(self, throttle, steer, off_time) -> None:
+        """One physics tick of Simulation.step for every race, with no other cars to hit.
+
+        As in ArraySimulation.step, the whole batch takes one step and the
+        races moving too fast for it are redone in substeps, so they don't
+        hold back the rest.
+        """
+        fast = np.flatnonzero(np.abs(self.vel) * PHYSICS_DT > SAFE_TRAVEL)
+        if len(fast):
+            start_state = (self.x[fast], self.y[fast], self.angle[fast], self.vel[fast], off_time[fast])
+        distance = drive(self.field, self.params, PHYSICS_DT, self.x, self.y, self.angle, self.vel,
+                         throttle, steer, self.off_track, off_time)
+        self._clamp(self.x, self.y)
+        near = self._near_barriers(self.x, self.y, distance)
+        near[fast] = False
+        self._hit_barriers(near, self.x, self.y, self.angle, self.vel, self.on_overpass)
+        if len(fast):
+            self._substep(fast, start_state, throttle, steer, off_time)
+        self._update_progress()
+
+    def _substep(self, fast, start_state, throttle, steer, off_time) -> None:
+        """Integrate the races at indices `fast` again from `start_state`, in short substeps.
+
+        Races needing the same number of substeps take them together.
+        """
+        x, y, angle, vel, off = start_state
+        substeps = np.ceil(np.abs(vel) * PHYSICS_DT / SAFE_TRAVEL).astype(np.int64)
+        for count in np.unique(substeps).tolist():
+            group = substeps == count
+            rows = fast[group]
+            gx, gy, gangle, gvel, goff = x[group], y[group], angle[group], vel[group], off[group]
+            gthrottle = throttle[rows]
+            gsteer = steer[rows]
+            overpass = self.on_overpass[rows]
+            off_track = np.zeros(len(rows), dtype=bool)
+            dt = PHYSICS_DT / count
+            for _ in range(count):
+                distance = drive(self.field, self.params, dt, gx, gy, gangle, gvel, gthrottle, gsteer,
+                                 off_track, goff)
+                self._clamp(gx, gy)
+                self._hit_barriers(self._near_barriers(gx, gy, distance), gx, gy, gangle, gvel, overpass)
+            self.x[rows] = gx
+            self.y[rows] = gy
+            self.angle[rows] = gangle
+            self.vel[rows] = gvel
+            self.off_track[rows] = off_track
+            off_time[rows] = goff
+
+    def _clamp(self, x, y) -> None:
+        np.clip(x, CAR_WIDTH, self.world_w - CAR_WIDTH, out=x)
+        np.clip(y, CAR_WIDTH, self.world_h - CAR_WIDTH, out=y)
+
+    def _near_barriers(self, x, y, distance):
+        """Which of the cars at (x, y) may touch a barrier: far enough off the road, or at a crossing."""
+        near = distance >= self.barrier_clear
+        for cx, cy, zone in self.track.crossings:
+            near |= (np.abs(x - cx) < zone) & (np.abs(y - cy) < zone)
+        return near
+
+    def _hit_barriers(self, near, x, y, angle, vel, overpass) -> None:
+        """Simulation._hit_barriers for the cars flagged in `near`, in place."""
+        near = np.flatnonzero(near)
+        if len(near):
+            x[near], y[near], vel[near] = push_off_barriers(
+                self.barriers, x[near], y[near], overpass[near], angle[near], vel[near], BARRIER_RADIUS)
+
+    def _update_progress(self) -> None:
+        """Follow each car's station, as ArraySimulation._update_progress does.
+
+        There is no full search for cars far from the line: with nothing to
+        teleport a car, walking from the last station is always continuous,
+        and a car lost in the infield of the figure of eight can't have its
+        progress jump to the other branch and collect half a lap of reward.
+        """
+        count = self.line.count
+        station, _ = walk_stations(self._line_x, self._line_y, self.station, self.x, self.y)
+
+        half = count // 2
+        self.stations += (station - self.station + half) % count - half
+        self.station[:] = station
+        self.progress[:] = self._progress(self._rows)
+
+        # Cars keep the level they arrived on through a crossing, as in Simulation._update_car_path.
+        away = np.ones(self.num_envs, dtype=bool)
+        for cx, cy, zone in self.track.crossings:
+            away &= (np.abs(self.x - cx) >= zone) | (np.abs(self.y - cy) >= zone)
+        self.on_overpass[away] = self._line_bridge[station[away]]
+
+    def _progress(self, envs):
+        station = self.station[envs]
+        along = (self.x[envs] - self._line_x[station]) * self._line_cos[station]
+        along += (self.y[envs] - self._line_y[station]) * self._line_sin[station]
+        return (self.stations[envs] + along / self.line.spacing) / self.line.count
+
+    def _reset_envs(self, envs) -> None:
+        count = self.line.count
+        if self.random_starts:
+            station = self.rng.integers(0, count, len(envs))
+            self.x[envs] = self._line_x[station]
+            self.y[envs] = self._line_y[station]
+            self.angle[envs] = self._line_heading[station]
+            self.on_overpass[envs] = self._line_bridge[station]
+        else:
+            x, y, angle, station = self._pole
+            self.x[envs] = x
+            self.y[envs] = y
+            self.angle[envs] = angle
+            self.on_overpass[envs] = self._pole_overpass
+        self.vel[envs] = 0.0
+        self.off_track[envs] = False
+        self.steps[envs] = 0
+        half = count // 2
+        self.station[envs] = station
+        self.stations[envs] = (station - self._finish_station + half) % count - half
+        self.progress[envs] = self._progress(envs)
+        self.start_progress[envs] = self.progress[envs]
+
+    def _observe(self):
+        line = self.line
+        station = self.station
+        heading = self._line_heading[station]
+        error = self.angle - heading
+        # Positive offsets are to the right of the direction of travel.
+        offset = (self.y - self._line_y[station]) * self._line_cos[station]
+        offset -= (self.x - self._line_x[station]) * self._line_sin[station]
+        ahead = (station[:, None] + self._lookahead) % line.count
+
+        obs = np.empty((self.num_envs, self.observation_size), dtype=np.float32)
+        obs[:, 0] = self.vel / self._top_speed
+        obs[:, 1] = np.sin(error)
+        obs[:, 2] = np.cos(error)
+        obs[:, 3] = offset / self.field.half_width
+        obs[:, 4] = self.off_track
+        obs[:, 5:5 + len(LOOKAHEAD)] = self._line_curvature[ahead] * self.field.half_width
+        obs[:, 5 + len(LOOKAHEAD):] = self.raycast() / RAY_RANGE
+        return obs
+
+    def raycast(self):
+        """(num_envs, len(RAY_ANGLES)) distances to the road edge, capped at RAY_RANGE.
+
+        From on the road a ray stops where it leaves it, and from off the
+        road where it reaches it; the field value is a safe step either way.
+        """
+        field = self.field
+        angles = self.angle[:, None] + self._ray_angles
+        dx = np.cos(angles)
+        dy = np.sin(angles)
+        x0 = self.x[:, None]
+        y0 = self.y[:, None]
+        side = np.where(field_distance(field, self.x, self.y) > 0.0, 1.0, -1.0)[:, None]
+        t = np.zeros(angles.shape)
+        for _ in range(RAY_MARCHES):
+            gap = field_distance(field, x0 + dx * t, y0 + dy * t) * side
+            # Rays that have hit the edge (or crossed it) stop moving.
+            t += np.where(gap > RAY_HIT, gap, 0.0)
+            np.minimum(t, RAY_RANGE, out=t)
+        return t
+
+
+def env_steps_per_second(num_envs: int = 256, steps: int = 200, seed: int = 0) -> float:
+    """Env steps per second with random throttle-and-steer actions."""
+    env = RaceEnv(num_envs, seed=seed)
+    env.reset()
+    rng = np.random.default_rng(seed)
+    actions = INPUT_UP | rng.choice([0, INPUT_LEFT, INPUT_RIGHT], size=(steps, num_envs))
+    start = time.perf_counter()
+    for step in range(steps):
+        env.step(actions[step])
+    return steps * num_envs / (time.perf_counter() - start)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Measure RaceEnv throughput")
+    parser.add_argument("--envs", type=int, nargs="+", default=[1, 16, 64, 256, 1024])
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args(argv)
+    print(f"{'envs':>6}{'env-steps/s':>16}")
+    for num_envs in args.envs:
+        print(f"{num_envs:>6}{env_steps_per_second(num_envs, args.steps):>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
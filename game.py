@@ -0,0 +1,677 @@
+import functools
+import math
+import time
+import tkinter as tk
+from collections import deque
+
+from simulation import (
+    CAR_LENGTH,
+    CAR_WIDTH,
+    DEFAULT_LAPS,
+    HOLD_STEPS,
+    INPUT_DOWN,
+    INPUT_LEFT,
+    INPUT_RIGHT,
+    INPUT_UP,
+    PHYSICS_DT,
+    WINDOW_H,
+    WINDOW_W,
+    Simulation,
+)
+from ai import AIDriver
+from profiler import PHASE_CROWD, PHASE_FRAME, PHASE_HUD, PHASE_SHAPES, PHASE_START, FrameProfiler
+from render import Viewport
+from replay import Recording, ReplayInputs
+from rollback import SnapshotRing
+from telemetry import TelemetryWriter
+from scenery import CROWD_GROUPS, CROWD_PHASES, crowd_color, load_scenery_frames, static_track_items
+
+DEFAULT_FPS = 60
+PROFILE_OVERLAY_REFRESH = 0.5  # seconds between profiler overlay updates
+HUD_ROWS = 10  # running positions listed in the top-left corner
+HEADING_STEPS = 256  # car geometry is cached at this many headings (about 1.4 degrees apart)
+SIMPLE_CARS_OVER = 12  # by default, fields bigger than this draw each car as one polygon
+
+# Car outlines in car-local coordinates (x forward, y to the right), centred on the car.
+_HALF_L = CAR_LENGTH / 2
+_HALF_W = CAR_WIDTH / 2
+CAR_PARTS = {
+    "body": (
+        (-_HALF_L * 0.8, -_HALF_W * 0.6),
+        (_HALF_L * 0.2, -_HALF_W * 0.45),
+        (_HALF_L * 0.6, -_HALF_W * 0.25),
+        (_HALF_L * 0.85, 0),
+        (_HALF_L * 0.6, _HALF_W * 0.25),
+        (_HALF_L * 0.2, _HALF_W * 0.45),
+        (-_HALF_L * 0.8, _HALF_W * 0.6),
+        (-_HALF_L * 1.0, _HALF_W * 0.4),
+        (-_HALF_L * 1.0, -_HALF_W * 0.4),
+    ),
+    "nose": (
+        (_HALF_L * 0.6, -_HALF_W * 0.22),
+        (_HALF_L * 1.15, 0),
+        (_HALF_L * 0.6, _HALF_W * 0.22),
+    ),
+    "rear_wing": (
+        (-_HALF_L * 1.2, -_HALF_W * 0.8),
+        (-_HALF_L * 0.7, -_HALF_W * 0.8),
+        (-_HALF_L * 0.7, _HALF_W * 0.8),
+        (-_HALF_L * 1.2, _HALF_W * 0.8),
+    ),
+    "front_wing": (
+        (_HALF_L * 0.9, -_HALF_W * 0.65),
+        (_HALF_L * 1.25, -_HALF_W * 0.65),
+        (_HALF_L * 1.25, _HALF_W * 0.65),
+        (_HALF_L * 0.9, _HALF_W * 0.65),
+    ),
+    # The four parts above merged into one silhouette, for simple cars.
+    "outline": (
+        (_HALF_L * 1.25, -_HALF_W * 0.65),
+        (_HALF_L * 1.25, _HALF_W * 0.65),
+        (_HALF_L * 0.9, _HALF_W * 0.65),
+        (_HALF_L * 0.9, _HALF_W * 0.1),
+        (_HALF_L * 0.6, _HALF_W * 0.25),
+        (_HALF_L * 0.2, _HALF_W * 0.45),
+        (-_HALF_L * 0.7, _HALF_W * 0.58),
+        (-_HALF_L * 0.7, _HALF_W * 0.8),
+        (-_HALF_L * 1.2, _HALF_W * 0.8),
+        (-_HALF_L * 1.2, -_HALF_W * 0.8),
+        (-_HALF_L * 0.7, -_HALF_W * 0.8),
+        (-_HALF_L * 0.7, -_HALF_W * 0.58),
+        (_HALF_L * 0.2, -_HALF_W * 0.45),
+        (_HALF_L * 0.6, -_HALF_W * 0.25),
+        (_HALF_L * 0.9, -_HALF_W * 0.1),
+        (_HALF_L * 0.9, -_HALF_W * 0.65),
+    ),
+}
+FULL_PARTS = ("body", "nose", "rear_wing", "front_wing")  # canvas stacking order, bottom first
+SIMPLE_PARTS = ("outline",)
+
+
+@functools.lru_cache(maxsize=None)
+def car_geometry(step: int):
+    """{part: ((dx, dy), ...)} of every car part rotated to heading `step` of HEADING_STEPS."""
+    angle = 2 * math.pi * step / HEADING_STEPS
+    sin_a = math.sin(angle)
+    cos_a = math.cos(angle)
+    return {
+        part: tuple((x * cos_a - y * sin_a, x * sin_a + y * cos_a) for x, y in pts)
+        for part, pts in CAR_PARTS.items()
+    }
+
+
+class InputQueue:
+    """Key events stamped with their arrival time, replayed one physics step at a time.
+
+    Sampling the held keys once a frame loses taps shorter than a frame and
+    holds every press back to the next frame. Instead each event keeps its
+    perf_counter() time, and `take(start, end)` rolls the events before `end`
+    into the INPUT_* bitmasks for the physics step covering [start, end). A
+    control counts for a step when it was down for at least half of it, so
+    its onset and length land on the nearest step, and a tap that starts and
+    ends inside one step still gets that step. For the physics, a control
+    that was down for only part of the step also reports how much of it, in
+    HOLD_STEPS-ths, so a press isn't rounded to a whole step either way.
+    """
+
+    def __init__(self, cars) -> None:
+        self.bindings = {}  # keysym -> [(car index, INPUT_* bit)], resolved once
+        for idx, car in enumerate(cars):
+            controls = car["controls"]
+            if controls is None:
+                continue
+            for name, bit in (("up", INPUT_UP), ("down", INPUT_DOWN),
+                              ("left", INPUT_LEFT), ("right", INPUT_RIGHT)):
+                self.bindings.setdefault(controls[name], []).append((idx, bit))
+        self.events = deque()  # (time, keysym, pressed)
+        self.down = set()  # bound keysyms held after the last event taken
+        self.held = [0] * len(cars)
+
+    def press(self, keysym: str, when: float) -> None:
+        if keysym in self.bindings:
+            self.events.append((when, keysym, True))
+
+    def release(self, keysym: str, when: float) -> None:
+        if keysym in self.bindings:
+            self.events.append((when, keysym, False))
+
+    def take(self, start: float, end: float):
+        """(one bitmask per car, partial holds) for the step [start, end); later events stay queued.
+
+        The partial holds are what Simulation.step takes: None, or (throttle,
+        steer) in HOLD_STEPS-ths for each car that held a control for only
+        part of the step.
+        """
+        held = self.held
+        events = self.events
+        if not events or events[0][0] >= end:
+            return list(held), None
+
+        inputs = list(held)
+        changed = {}  # (car, bit) -> [seconds down in this step, down since, pressed in this step]
+        while events and events[0][0] < end:
+            when, keysym, pressed = events.popleft()
+            if pressed == (keysym in self.down):
+                continue  # auto-repeat
+            if pressed:
+                self.down.add(keysym)
+            else:
+                self.down.discard(keysym)
+            when = max(when, start)
+            for idx, bit in self.bindings[keysym]:
+                entry = changed.get((idx, bit))
+                if entry is None:
+                    entry = changed[idx, bit] = [0.0, start if held[idx] & bit else None, False]
+                if pressed:
+                    held[idx] |= bit
+                    entry[1] = when
+                    entry[2] = True
+                else:
+                    held[idx] &= ~bit
+                    entry[0] += when - entry[1]
+                    entry[1] = None
+
+        length = end - start
+        shares = {}  # car -> {bit: HOLD_STEPS-ths of the step down} for the controls that changed
+        for (idx, bit), (down, since, pressed) in changed.items():
+            if since is not None:
+                down += end - since
+            if down >= length / 2 or (pressed and since is None):
+                inputs[idx] |= bit
+            else:
+                inputs[idx] &= ~bit
+            share = min(HOLD_STEPS, round(down / length * HOLD_STEPS))
+            shares.setdefault(idx, {})[bit] = max(share, 1) if pressed else share
+
+        partial = None
+        for idx, car_shares in shares.items():
+            if all(share in (0, HOLD_STEPS) for share in car_shares.values()):
+                continue
+            up, down, left, right = (car_shares.get(bit, HOLD_STEPS if inputs[idx] & bit else 0)
+                                     for bit in (INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT))
+            if partial is None:
+                partial = {}
+            partial[idx] = (up - down, right - left)
+        return inputs, partial
+
+
+class Game:
+    def __init__(self, root: tk.Tk, sim: Simulation = None, target_fps: float = DEFAULT_FPS,
+                 profiler: FrameProfiler = None, record: bool = False, replay: Recording = None,
+                 telemetry: TelemetryWriter = None, ai: AIDriver = None, net=None,
+                 simple_cars: bool = None, follow: int = None, split: bool = False,
+                 season=None, laps: int = DEFAULT_LAPS) -> None:
+        self.root = root
+
+        if replay is not None:
+            sim = replay.new_simulation()
+        self.sim = sim if sim is not None else Simulation()
+        self.cars = self.sim.cars
+        # Either feed a recording's inputs instead of the keyboard, or record ours.
+        self.replay = ReplayInputs(replay) if replay is not None else None
+        self.recording = Recording.start(self.sim) if record else None
+        self.telemetry = telemetry
+        self.ai = ai if replay is None else None  # a replay already holds the AI's inputs
+        self.ai_cars = set(self.ai.cars) if self.ai is not None else set()
+        # A netplay.ThreadedClient: the server runs the race and `sim` only mirrors it.
+        self.net = net
+        self.profiler = profiler
+        self.sim.profiler = profiler
+        # A season.SeasonWriter: each round runs to `laps` and is saved off the render thread.
+        self.season = season
+        self.race_log = None
+        if season is not None:
+            from season import RaceLog
+
+            self.race_log = RaceLog(self.sim, laps)
+        # The last few seconds of every step, for Backspace to rewind to (not online or in a season).
+        self.snapshots = SnapshotRing(self.sim) if net is None and season is None else None
+        # One merged polygon per car instead of four: a quarter of the Tk calls, less detail.
+        if simple_cars is None:
+            simple_cars = len(self.cars) > SIMPLE_CARS_OVER
+        self.car_parts = SIMPLE_PARTS if simple_cars else FULL_PARTS
+        self.profile_overlay_visible = False
+        self.profile_timer = 0.0
+
+        # One camera following `follow` (our own car online, else car 0), or
+        # side-by-side halves following the two keyboard cars.
+        if split:
+            followed = [0, 1]
+        elif follow is not None:
+            followed = [follow]
+        else:
+            followed = [net.car if net is not None else 0]
+        pane_w = WINDOW_W // len(followed)
+        world_w, world_h = self.sim.track.size
+        self.panes = []
+        for car in followed:
+            canvas = tk.Canvas(root, width=pane_w, height=WINDOW_H, bg="#1b1f24", highlightthickness=0)
+            canvas.pack(side="left")
+            self.panes.append(Viewport(canvas, pane_w, WINDOW_H, world_w, world_h, car))
+        # The HUD and profile overlay live in the first pane, the info text and button in the last.
+        self.canvas = self.panes[0].canvas
+        self.view = self.panes[0].view
+        last = self.panes[-1]
+
+        self.inputs = InputQueue(self.cars)
+        self.last_time = time.perf_counter()
+        self.accumulator = 0.0
+        self.frame_period = 1.0 / target_fps
+        self.next_frame_time = self.last_time
+        self.skipped_frames = 0
+        self.after_id = None
+        self.crowd_timer = 0.0
+        self.crowd_phase = 0
+
+        self._bind_events()
+        # Preferred: the whole scenery as one pre-rendered image per crowd frame,
+        # shared by every pane.
+        paths = load_scenery_frames(self.sim.track)
+        self.scenery_frames = [tk.PhotoImage(file=path) for path in paths] if paths is not None else None
+        self.scenery_ids = []
+        self.car_ids = []  # per pane, per car
+        self.countdown_ids = []
+        for pane in self.panes:
+            self._draw_static_track(pane)
+            self.car_ids.append([self._draw_car(pane.canvas, idx, car) for idx, car in enumerate(self.cars)])
+            self.countdown_ids.append(pane.canvas.create_text(
+                pane.width / 2,
+                pane.height / 2,
+                anchor="center",
+                fill="#ffffff",
+                font=("Helvetica", 72, "bold"),
+                text="",
+                tags="overlay"
+            ))
+            self._create_flag(pane)
+        self._show_flag(False)
+        self.info_id = last.canvas.create_text(
+            last.width - 10, 10,
+            anchor="ne",
+            fill="#9aa6b2",
+            font=("Helvetica", 11),
+            text="WASD (blue) and Arrow keys (yellow)" if net is None
+            else f"Online as {self.cars[net.car]['name']}: WASD or Arrow keys",
+            tags="overlay"
+        )
+        self.reset_button = tk.Button(
+            root, text="Reset Race", command=self._reset_race, bg="#30363d", fg="#e6edf3",
+            activebackground="#3a4149", activeforeground="#ffffff", relief="flat", padx=8, pady=2
+        )
+        last.canvas.create_window(last.width - 80, 36, window=self.reset_button, tags="overlay")
+        # One row per running position, so large fields only show the front.
+        self.hud_ids = [
+            self.canvas.create_text(
+                12, 12 + i * 18,
+                anchor="nw",
+                fill=car["fill"],
+                font=("Helvetica", 11),
+                text="",
+                tags="overlay"
+            )
+            for i, car in enumerate(self.cars[:HUD_ROWS])
+        ]
+        self.profile_id = self.canvas.create_text(
+            12, WINDOW_H - 12,
+            anchor="sw",
+            fill="#e6edf3",
+            font=("Courier", 10),
+            text="",
+            state="hidden",
+            tags="overlay",
+        )
+
+        self._tick()
+
+    def _bind_events(self) -> None:
+        self.root.bind("<KeyPress>", self._on_key_press)
+        self.root.bind("<KeyRelease>", self._on_key_release)
+        self.root.bind("<F3>", self._toggle_profile_overlay)
+        self.root.bind("<BackSpace>", self._rewind)
+
+    def _on_key_press(self, event) -> None:
+        self.inputs.press(event.keysym.lower(), time.perf_counter())
+
+    def _on_key_release(self, event) -> None:
+        self.inputs.release(event.keysym.lower(), time.perf_counter())
+
+    def _draw_static_track(self, pane: Viewport) -> None:
+        canvas = pane.canvas
+        canvas.delete("track")
+
+        if self.scenery_frames is not None:
+            self.scenery_ids.append(canvas.create_image(
+                0, 0, anchor="nw", image=self.scenery_frames[0], tags="track"
+            ))
+        else:
+            for kind, coords, options in static_track_items(self.sim.track):
+                options = dict(options)
+                group = options.pop("crowd", None)
+                # Crowd members are grouped by index mod 3 so each animation
+                # step recolours the whole stand with three tag updates.
+                tags = "track" if group is None else ("track", f"crowd{group}")
+                if kind == "rect":
+                    canvas.create_rectangle(*coords, tags=tags, **options)
+                elif kind == "line":
+                    canvas.create_line(*coords, tags=tags, **options)
+                else:
+                    canvas.create_text(*coords, tags=tags, **options)
+
+        canvas.tag_raise("track")
+
+    def _create_flag(self, pane: Viewport):
+        canvas = pane.canvas
+        cx = pane.width / 2
+        cy = pane.height / 2
+        w = 120
+        h = 80
+        block = 20
+        ids = []
+        for r in range(0, h, block):
+            for c in range(0, w, block):
+                color = "#ffffff" if (r // block + c // block) % 2 == 0 else "#1b1f24"
+                x0 = cx - w / 2 + c
+                y0 = cy - h / 2 + r
+                rect = canvas.create_rectangle(x0, y0, x0 + block, y0 + block,
+                                               fill=color, outline="", tags=self._flag_tags(len(ids)))
+                ids.append(rect)
+        pole = canvas.create_line(cx - w / 2 - 10, cy - h / 2, cx - w / 2 - 10, cy + h / 2,
+                                       fill="#cfd4da", width=4, tags=self._flag_tags(len(ids)))
+        ids.append(pole)
+        return ids
+
+    @staticmethod
+    def _flag_tags(idx: int):
+        # _wave_flag alternates items 0 and 1 (mod 3); item 2 keeps its colour.
+        if idx % 3 == 0:
+            return ("overlay", "flag", "flag_a")
+        if idx % 3 == 1:
+            return ("overlay", "flag", "flag_b")
+        return ("overlay", "flag")
+
+    def _show_flag(self, show: bool) -> None:
+        state = "normal" if show else "hidden"
+        for pane in self.panes:
+            pane.view.itemconfig("flag", state=state)
+
+    def _draw_car(self, canvas, idx: int, car):
+        shapes = self._car_shape_points(car["x"], car["y"], car["angle"], self.car_parts)
+        tags = ("car", f"car{idx}")
+        ids = {"tag": f"car{idx}"}
+        for part in self.car_parts:
+            wing = part.endswith("_wing")
+            ids[part] = canvas.create_polygon(
+                shapes[part], fill=car["wing"] if wing else car["fill"], outline=car["outline"],
+                width=1 if wing or part == "outline" else 2, tags=tags
+            )
+        return ids
+
+    @staticmethod
+    def _car_shape_points(x: float, y: float, angle: float, parts=FULL_PARTS):
+        """Flat canvas coords of each part in `parts` for a car at (x, y) facing `angle`.
+
+        The rotation comes from the per-heading cache, so this only translates.
+        """
+        geometry = car_geometry(round(angle * (HEADING_STEPS / (2 * math.pi))) % HEADING_STEPS)
+        shapes = {}
+        for part in parts:
+            flat = shapes[part] = []
+            append = flat.append
+            for dx, dy in geometry[part]:
+                append(x + dx)
+                append(y + dy)
+        return shapes
+
+    def _tick(self) -> None:
+        now = time.perf_counter()
+        dt = now - self.last_time
+        self.last_time = now
+        prof = self.profiler
+
+        # Physics runs in fixed steps; a slow frame just runs more of them.
+        self.accumulator += dt
+        if self.net is not None:
+            # Either set of keys drives our car; the server does the physics.
+            bits = 0
+            for car_bits in self.inputs.take(now - dt, now)[0]:
+                bits |= car_bits
+            self.net.update(self.sim, bits)
+            self.accumulator = 0.0
+        # The physics clock trails the wall clock by what is left in the
+        # accumulator, so each step takes the key events from its own slice of time.
+        step_start = now - self.accumulator
+        while self.accumulator >= PHYSICS_DT:
+            inputs, partial = self.inputs.take(step_start, step_start + PHYSICS_DT)
+            step_start += PHYSICS_DT
+            if self.replay is not None:
+                inputs = self.replay.next()
+                partial = self.replay.partial
+            elif self.ai is not None:
+                self.ai.update(self.sim, inputs)
+                if partial:
+                    partial = {idx: hold for idx, hold in partial.items() if idx not in self.ai_cars} or None
+            if self.recording is not None:
+                self.recording.append(inputs, partial)
+            if self.snapshots is not None:
+                self.snapshots.save(self.sim, inputs, partial)
+            self.sim.step(PHYSICS_DT, inputs, partial)
+            if self.telemetry is not None:
+                self.telemetry.record(self.sim)
+            self.accumulator -= PHYSICS_DT
+            if self.race_log is not None and self.race_log.update(self.sim):
+                self._reset_race(finished=True)
+                break
+        alpha = self.accumulator / PHYSICS_DT
+
+        if prof is not None:
+            start = time.perf_counter()
+        self._update_start_sequence()
+        if prof is not None:
+            prof.add(PHASE_START, start)
+            start = time.perf_counter()
+
+        # Draw between the last two physics states so motion stays smooth
+        # when the refresh rate and PHYSICS_HZ don't line up.
+        poses = []
+        for car in self.cars:
+            poses.append((car["prev_x"] + (car["x"] - car["prev_x"]) * alpha,
+                          car["prev_y"] + (car["y"] - car["prev_y"]) * alpha,
+                          car["prev_angle"] + (car["angle"] - car["prev_angle"]) * alpha))
+        for pane in self.panes:
+            x, y, _ = poses[pane.car]
+            pane.follow(x, y)
+
+        car_shape_points = self._car_shape_points
+        parts = self.car_parts
+        should_hide_car = self.sim.should_hide_car
+        shapes = [None] * len(poses)  # built at most once a frame, for cars some pane can see
+        for pane, car_ids in zip(self.panes, self.car_ids):
+            view = pane.view
+            visible = pane.visible
+            for idx, (x, y, angle) in enumerate(poses):
+                ids = car_ids[idx]
+                if not visible(x, y, CAR_LENGTH):
+                    # Off screen: hidden once, then no Tk calls until it comes back.
+                    view.itemconfig(ids["tag"], state="hidden")
+                    continue
+                self._set_car_visibility(view, ids, not should_hide_car(self.cars[idx]))
+                car_shapes = shapes[idx]
+                if car_shapes is None:
+                    car_shapes = shapes[idx] = car_shape_points(x, y, angle, parts)
+                for part in parts:
+                    view.coords(ids[part], car_shapes[part])
+
+        if prof is not None:
+            prof.add(PHASE_SHAPES, start)
+            start = time.perf_counter()
+        self._update_hud()
+        if prof is not None:
+            prof.add(PHASE_HUD, start)
+            start = time.perf_counter()
+        self._animate_crowd(dt)
+        if prof is not None:
+            prof.add(PHASE_CROWD, start)
+            self._update_profile_overlay(dt)
+            prof.add(PHASE_FRAME, now)
+            prof.end_frame()
+        for pane in self.panes:
+            pane.view.end_frame()
+        self._schedule_next_frame()
+
+    def _toggle_profile_overlay(self, event=None) -> None:
+        if self.profiler is None:
+            return
+        self.profile_overlay_visible = not self.profile_overlay_visible
+        self.profile_timer = PROFILE_OVERLAY_REFRESH  # refresh on the next frame
+        state = "normal" if self.profile_overlay_visible else "hidden"
+        self.view.itemconfig(self.profile_id, state=state)
+
+    def _update_profile_overlay(self, dt: float) -> None:
+        if not self.profile_overlay_visible:
+            return
+        self.profile_timer += dt
+        if self.profile_timer < PROFILE_OVERLAY_REFRESH:
+            return
+        self.profile_timer = 0.0
+        calls = sum(pane.view.frame_calls for pane in self.panes)
+        text = self.profiler.summary() + f"\nTk calls/frame {calls}"
+        self.view.itemconfig(self.profile_id, text=text)
+
+    def _schedule_next_frame(self) -> None:
+        """Schedule the next frame against an absolute deadline.
+
+        after() only guarantees a minimum delay, so each frame aims at the
+        next multiple of the frame period instead of "now + period"; lateness
+        is absorbed rather than accumulated. If we have fallen more than a
+        frame behind, the missed render frames are dropped; the accumulator
+        still runs every physics step they covered.
+        """
+        self.next_frame_time += self.frame_period
+        now = time.perf_counter()
+        if now > self.next_frame_time:
+            missed = int((now - self.next_frame_time) / self.frame_period) + 1
+            self.next_frame_time += missed * self.frame_period
+            self.skipped_frames += missed
+        delay_ms = max(0, round((self.next_frame_time - now) * 1000))
+        self.after_id = self.root.after(delay_ms, self._tick)
+
+    def _update_start_sequence(self) -> None:
+        count = self.sim.countdown_value()
+        if count is not None:
+            self._show_countdown(str(count))
+            self._show_flag(False)
+            return
+
+        self._show_countdown(None)
+        flag_time = self.sim.flag_time()
+        if flag_time is not None:
+            self._show_flag(True)
+            self._wave_flag(flag_time)
+        else:
+            self._show_flag(False)
+
+    def _show_countdown(self, text) -> None:
+        """Show `text` big in the middle of every pane, or hide it for None."""
+        for pane, countdown_id in zip(self.panes, self.countdown_ids):
+            if text is None:
+                pane.view.itemconfig(countdown_id, text="", state="hidden")
+            else:
+                pane.view.itemconfig(countdown_id, text=text, state="normal")
+
+    def _wave_flag(self, phase_time: float) -> None:
+        phase = int(phase_time * 6) % 2
+        white, dark = ("flag_a", "flag_b") if phase == 0 else ("flag_b", "flag_a")
+        for pane in self.panes:
+            pane.view.itemconfig(white, fill="#ffffff")
+            pane.view.itemconfig(dark, fill="#1b1f24")
+
+    @staticmethod
+    def _set_car_visibility(view, ids, visible: bool) -> None:
+        state = "normal" if visible else "hidden"
+        view.itemconfig(ids["tag"], state=state)
+
+    def _animate_crowd(self, dt: float) -> None:
+        self.crowd_timer += dt
+        if self.crowd_timer < 0.25:
+            return
+        self.crowd_timer = 0.0
+        self.crowd_phase = (self.crowd_phase + 1) % CROWD_PHASES
+        if self.scenery_frames is not None:
+            image = self.scenery_frames[1 + self.crowd_phase]
+            for pane, scenery_id in zip(self.panes, self.scenery_ids):
+                pane.view.itemconfig(scenery_id, image=image)
+            return
+        for pane in self.panes:
+            for group in range(CROWD_GROUPS):
+                pane.view.itemconfig(f"crowd{group}", fill=crowd_color(group, self.crowd_phase))
+
+    def _update_hud(self) -> None:
+        order = self.sim.standings()
+        leader = self.cars[order[0]]
+        for row, hud_id in enumerate(self.hud_ids):
+            car = self.cars[order[row]]
+            current_lap = self.sim.current_lap_time(car)
+            last_lap = car["last_lap_duration"]
+            last_text = f"{last_lap:.2f}s" if last_lap is not None else "--"
+            if row == 0:
+                gap_text = "Leader"
+            else:
+                laps_down = int(leader["progress"] - car["progress"])
+                gap_text = f"+{laps_down} lap{'s' if laps_down > 1 else ''}" if laps_down else f"+{car['gap']:.2f}s"
+            text = (f"P{row + 1} {car['name']}: Laps {car['laps']} | Lap {current_lap:.2f}s"
+                    f" | Last {last_text} | {gap_text}")
+            if car["last_sector"] >= 0:
+                text += f" | S{car['last_sector'] + 1} {car['last_sector_duration']:.2f}s"
+            self.view.itemconfig(hud_id, text=text, fill=car["fill"])
+
+    def save_round(self, finished: bool = False) -> None:
+        """Hand the round so far to the season writer and start a fresh log."""
+        from season import RaceLog
+
+        if finished or self.race_log.laps:
+            self.season.submit(self.race_log.result(self.sim, finished))
+        self.race_log = RaceLog(self.sim, self.race_log.target)
+
+    def _rewind(self, event=None) -> None:
+        """Put the race back as far as the snapshots go (ROLLBACK_SECONDS) and carry on."""
+        snapshots = self.snapshots
+        if snapshots is None:
+            return
+        tick = snapshots.oldest()
+        if tick < 0:
+            return
+        back = self.sim.ticks - tick
+        snapshots.restore(self.sim, tick)
+        if self.replay is not None:
+            self.replay.tick = max(0, self.replay.tick - back)
+        if self.recording is not None:
+            self.recording.truncate(len(self.recording) - back)
+        if self.ai is not None:
+            self.ai.reset(self.sim)
+        self.accumulator = 0.0
+
+    def _reset_race(self, finished: bool = False) -> None:
+        if self.net is not None:
+            return  # only the server can restart a networked race
+        if self.race_log is not None:
+            # Restarted rounds are kept too, as not finished.
+            self.save_round(finished)
+        self.last_time = time.perf_counter()
+        self.accumulator = 0.0
+        if self.snapshots is not None:
+            self.snapshots.clear()
+        if self.replay is not None:
+            # Restart the replay from the top rather than racing without inputs.
+            self.replay.recording.rewind(self.sim)
+            self.replay = ReplayInputs(self.replay.recording)
+        else:
+            self.sim.reset()
+            if self.ai is not None:
+                self.ai.reset(self.sim)
+            if self.recording is not None:
+                self.recording = Recording.start(self.sim)
+        self._show_countdown(None)
+        self._show_flag(False)
+        for pane, car_ids in zip(self.panes, self.car_ids):
+            for ids in car_ids:
+                self._set_car_visibility(pane.view, ids, True)
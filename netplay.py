@@ -0,0 +1,577 @@
+"""Networked races: an authoritative asyncio server and thin clients.
+
+The server owns the only Simulation and steps it at PHYSICS_HZ. Clients send
+nothing but their INPUT_* bitmask (whenever it changes) together with the
+last snapshot they received; the server broadcasts the race SNAPSHOT_HZ
+times a second. Each snapshot is delta-compressed against the one that
+client last acknowledged: car state is quantised to integers and only the
+fields that changed are sent, as zigzag varint differences, so a car sitting
+still costs one byte. Clients draw the race a little in the past,
+interpolating between the two snapshots either side of their render time.
+
+    python3 main.py --serve 7777 --cars 4 --ai 4        # four player slots plus four AI cars
+    python3 main.py --connect 127.0.0.1:7777            # join in a window
+    python3 netplay.py --players 2 8 32                 # loopback load test
+
+Wire format, little-endian:
+
+    client -> server   ack tick (u32), input bits (u8)
+    server -> client   payload length (u32), then a payload that is one of
+      welcome          type 1, version, car index, cars, physics Hz, ticks per snapshot, track
+                       kind, then to the end of the payload either the name of a track under
+                       tracks/ (UTF-8) or, for a track file of the server's own, its JSON text
+      snapshot         type 2, tick, base tick, race time, countdown start, race active,
+                       then per car a varint field mask and one varint per set field
+"""
+
+import argparse
+import asyncio
+import math
+import statistics
+import struct
+import threading
+import time
+from collections import deque
+
+from simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_UP, PHYSICS_DT, PHYSICS_HZ, Simulation, load_track
+from track import builtin_name, track_path
+
+NET_VERSION = 4
+SNAPSHOT_HZ = 30
+SNAPSHOT_EVERY = PHYSICS_HZ // SNAPSHOT_HZ  # physics ticks between snapshots
+SNAPSHOT_HISTORY = 32  # snapshots kept on both ends to delta against
+INTERP_DELAY = 2.0 / SNAPSHOT_HZ  # how far behind the newest snapshot clients draw
+CLOCK_SMOOTHING = 0.1  # weight of each new sample in the client's server-clock estimate
+MAX_WRITE_BUFFER = 64 * 1024  # a client with more unsent bytes than this skips snapshots
+NO_BASE = 0xFFFFFFFF  # base tick of a full snapshot (and the ack before the first one)
+TICK_STATS_SECONDS = 60  # server tick times kept for stats()
+
+MSG_WELCOME = 1
+MSG_SNAPSHOT = 2
+TRACK_BY_NAME = 0
+TRACK_BY_SOURCE = 1
+_FRAME = struct.Struct("<I")
+_WELCOME = struct.Struct("<BBHHHHB")
+_SNAPSHOT = struct.Struct("<BIIddB")
+_INPUT = struct.Struct("<IB")
+
+ANGLE_STEPS = 65536
+# (car key, quantisation steps per unit), in field-mask bit order. The fields
+# that change every snapshot come first so the mask of a moving car fits in
+# one varint byte.
+FIELDS = (
+    ("x", 64),
+    ("y", 64),
+    ("angle", ANGLE_STEPS / (2 * math.pi)),
+    ("progress", 65536),
+    ("gap", 1000),
+    ("flags", 1),  # on_overpass | off_track << 1
+    ("laps", 1),
+    ("last_lap_duration", 1000),  # -1 before the first lap
+    ("last_lap_time", 1000),
+    ("last_sector", 1),  # -1 before the first timed sector
+    ("last_sector_duration", 1000),
+)
+FIELD_COUNT = len(FIELDS)
+
+
+def quantize(cars):
+    """Flat list of FIELD_COUNT integers per car."""
+    out = []
+    for car in cars:
+        last_lap = car["last_lap_duration"]
+        out += (
+            round(car["x"] * 64),
+            round(car["y"] * 64),
+            round(car["angle"] % (2 * math.pi) * FIELDS[2][1]) % ANGLE_STEPS,
+            round(car["progress"] * 65536),
+            round(car["gap"] * 1000),
+            car["on_overpass"] | (car["off_track"] << 1),
+            car["laps"],
+            -1 if last_lap is None else round(last_lap * 1000),
+            round(car["last_lap_time"] * 1000),
+            car["last_sector"],
+            round(car["last_sector_duration"] * 1000),
+        )
+    return out
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_snapshot(tick: int, base_tick: int, race_time: float, countdown_start: float,
+                    race_active: bool, state, base) -> bytes:
+    """A framed snapshot of `state`, as differences from `base` (all zeros for a full one)."""
+    out = bytearray(_FRAME.size)
+    out += _SNAPSHOT.pack(MSG_SNAPSHOT, tick, base_tick, race_time, countdown_start, race_active)
+    for at in range(0, len(state), FIELD_COUNT):
+        mask = 0
+        diffs = []
+        for field in range(FIELD_COUNT):
+            diff = state[at + field] - base[at + field]
+            if diff:
+                mask |= 1 << field
+                diffs.append(diff * 2 if diff > 0 else -diff * 2 - 1)  # zigzag
+        _put_varint(out, mask)
+        for value in diffs:
+            _put_varint(out, value)
+    _FRAME.pack_into(out, 0, len(out) - _FRAME.size)
+    return bytes(out)
+
+
+def decode_snapshot(payload, bases: dict):
+    """(tick, race time, countdown start, race active, state) from a snapshot payload.
+
+    `bases` maps earlier ticks to their decoded state; raises ValueError if
+    the snapshot was encoded against one we no longer have, or is malformed.
+    """
+    if len(payload) < _SNAPSHOT.size or payload[0] != MSG_SNAPSHOT:
+        raise ValueError("not a snapshot")
+    _, tick, base_tick, race_time, countdown_start, race_active = _SNAPSHOT.unpack_from(payload)
+    if base_tick == NO_BASE:
+        base = None
+    else:
+        base = bases.get(base_tick)
+        if base is None:
+            raise ValueError(f"snapshot {tick} is a delta against unknown tick {base_tick}")
+    state = []
+    pos = _SNAPSHOT.size
+    try:
+        while pos < len(payload):
+            at = len(state)
+            mask, pos = _get_varint(payload, pos)
+            for field in range(FIELD_COUNT):
+                value = base[at + field] if base is not None else 0
+                if mask & (1 << field):
+                    diff, pos = _get_varint(payload, pos)
+                    value += (diff >> 1) ^ -(diff & 1)
+                state.append(value)
+    except IndexError:
+        raise ValueError(f"snapshot {tick} is truncated or has more cars than its base") from None
+    return tick, race_time, countdown_start, bool(race_active), state
+
+
+async def _read_frame(reader) -> bytes:
+    (length,) = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    return await reader.readexactly(length)
+
+
+class _Player:
+    def __init__(self, car: int, writer) -> None:
+        self.car = car
+        self.writer = writer
+        self.acked = NO_BASE
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class RaceServer:
+    def __init__(self, sim: Simulation, player_slots: int = None, ai=None) -> None:
+        """Serve `sim`; players take cars 0..player_slots-1 and `ai` drives any of the rest."""
+        self.sim = sim
+        self.ai = ai
+        self.player_slots = len(sim.cars) if player_slots is None else player_slots
+        self.inputs = [0] * len(sim.cars)
+        self.players = {}  # car index -> _Player
+        self.handlers = set()  # running _serve_client tasks
+        self.history = {}  # snapshot tick -> quantised state
+        self.tick_times = deque(maxlen=PHYSICS_HZ * TICK_STATS_SECONDS)
+        self.server = None
+        self.port = None
+        self.running = False
+        # Clients have the built-in tracks; any other file goes out with the welcome.
+        name = builtin_name(sim.track.ref)
+        if name is not None:
+            self.track_kind, self.track_data = TRACK_BY_NAME, name.encode()
+        else:
+            with open(track_path(sim.track.ref), "rb") as fh:
+                self.track_kind, self.track_data = TRACK_BY_SOURCE, fh.read()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Listen for clients; returns the bound port (useful with port 0)."""
+        self.server = await asyncio.start_server(self._serve_client, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def run(self, seconds: float = None) -> None:
+        """Step the race in real time until stop() is called or `seconds` pass."""
+        loop = asyncio.get_running_loop()
+        self.running = True
+        next_tick = loop.time()
+        end = None if seconds is None else next_tick + seconds
+        while self.running and (end is None or next_tick < end):
+            self.tick()
+            next_tick += PHYSICS_DT
+            lag = loop.time() - next_tick
+            if lag > 0.25:
+                next_tick += lag  # far behind (e.g. suspended): drop the backlog
+            # Always yield, even when behind, so clients' inputs keep flowing.
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    def stop(self) -> None:
+        self.running = False
+
+    def tick(self) -> None:
+        start = time.perf_counter()
+        sim = self.sim
+        if self.ai is not None:
+            self.ai.update(sim, self.inputs)
+        sim.step(PHYSICS_DT, self.inputs)
+        if sim.ticks % SNAPSHOT_EVERY == 0:
+            self._broadcast()
+        self.tick_times.append(time.perf_counter() - start)
+
+    def _broadcast(self) -> None:
+        sim = self.sim
+        tick = sim.ticks
+        state = self.history[tick] = quantize(sim.cars)
+        self.history.pop(tick - SNAPSHOT_HISTORY * SNAPSHOT_EVERY, None)
+        # Clients that acked the same snapshot share one encoding.
+        frames = {}
+        for player in self.players.values():
+            transport = player.writer.transport
+            if transport.is_closing() or transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                continue  # it will catch up from an older base (or a full snapshot) later
+            base_tick = player.acked if player.acked in self.history else NO_BASE
+            frame = frames.get(base_tick)
+            if frame is None:
+                base = self.history[base_tick] if base_tick != NO_BASE else [0] * len(state)
+                frame = frames[base_tick] = encode_snapshot(tick, base_tick, sim.time, sim.countdown_start,
+                                                            sim.race_active, state, base)
+            player.writer.write(frame)
+            player.bytes_sent += len(frame)
+
+    async def _serve_client(self, reader, writer) -> None:
+        car = next((idx for idx in range(self.player_slots) if idx not in self.players), None)
+        if car is None:
+            writer.close()  # full
+            return
+        if not self.players:
+            # First driver in: start the countdown now rather than mid-way through.
+            self.sim.reset()
+            if self.ai is not None:
+                self.ai.reset(self.sim)
+        player = self.players[car] = _Player(car, writer)
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        welcome = (_WELCOME.pack(MSG_WELCOME, NET_VERSION, car, len(self.sim.cars), PHYSICS_HZ, SNAPSHOT_EVERY,
+                                 self.track_kind) + self.track_data)
+        writer.write(_FRAME.pack(len(welcome)) + welcome)
+        try:
+            while True:
+                ack, bits = _INPUT.unpack(await reader.readexactly(_INPUT.size))
+                player.bytes_received += _INPUT.size
+                player.acked = ack
+                self.inputs[car] = bits & 0xF
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.players[car]
+            self.handlers.discard(task)
+            self.inputs[car] = 0
+            writer.close()
+
+    def stats(self) -> dict:
+        """Server tick times (ms) over the last TICK_STATS_SECONDS and per-client byte counts."""
+        times = sorted(self.tick_times)
+        if not times:
+            return {"ticks": 0}
+        return {
+            "ticks": len(times),
+            "tick_mean_ms": statistics.fmean(times) * 1000.0,
+            "tick_p99_ms": times[min(len(times) - 1, int(len(times) * 0.99))] * 1000.0,
+            "tick_max_ms": times[-1] * 1000.0,
+            "bytes_sent": {car: player.bytes_sent for car, player in self.players.items()},
+            "bytes_received": {car: player.bytes_received for car, player in self.players.items()},
+        }
+
+    async def close(self) -> None:
+        self.stop()
+        if self.server is not None:
+            self.server.close()
+        for player in list(self.players.values()):
+            player.writer.close()
+        # Let each connection's handler see its socket close and tidy up.
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+
+
+class RaceClient:
+    """One player's connection: sends inputs, decodes snapshots, interpolates them."""
+
+    def __init__(self) -> None:
+        self.car = None
+        self.num_cars = 0
+        self.track = None  # the server's track name, or None when it sent the track file instead
+        self.track_source = None  # the JSON text of that file
+        self.snapshot_every = SNAPSHOT_EVERY
+        self.reader = None
+        self.writer = None
+        self.task = None
+        self.bits = 0
+        self.acked = NO_BASE
+        self.states = {}  # tick -> quantised state, for decoding deltas
+        # (race time, countdown start, race active, state), newest last. The
+        # list is replaced rather than appended to, so another thread can read it.
+        self.snapshots = []
+        self.clock_offset = None  # server race time minus local perf_counter()
+        self.on_snapshot = None  # called with the client after each snapshot
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.dropped = 0  # snapshots that failed to decode
+
+    async def connect(self, host: str, port: int) -> None:
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        try:
+            payload = await _read_frame(self.reader)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError(f"{host}:{port} has no free car") from None
+        kind, version, car, num_cars, physics_hz, snapshot_every, track_kind = _WELCOME.unpack_from(payload)
+        if kind != MSG_WELCOME or version != NET_VERSION:
+            raise ConnectionError(f"{host}:{port} speaks an unsupported protocol")
+        if physics_hz != PHYSICS_HZ:
+            raise ConnectionError(f"server physics runs at {physics_hz} Hz, ours at {PHYSICS_HZ} Hz")
+        self.car = car
+        self.num_cars = num_cars
+        if track_kind == TRACK_BY_NAME:
+            self.track = payload[_WELCOME.size:].decode()
+        else:
+            self.track_source = payload[_WELCOME.size:]
+        self.snapshot_every = snapshot_every
+        self.bytes_received += _FRAME.size + len(payload)
+        self.task = asyncio.ensure_future(self._receive())
+
+    def load_track(self):
+        """The server's track, from tracks/ or from the file it sent."""
+        if self.track_source is not None:
+            return load_track("server", self.track_source)
+        return load_track(self.track)
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                payload = await _read_frame(self.reader)
+                self.bytes_received += _FRAME.size + len(payload)
+                try:
+                    tick, race_time, countdown_start, race_active, state = decode_snapshot(payload, self.states)
+                except ValueError:
+                    state = None
+                if state is None or len(state) != self.num_cars * FIELD_COUNT:
+                    # Leave it unacked: the server keeps sending deltas against
+                    # the last snapshot we did take, or a full one once that ages out.
+                    self.dropped += 1
+                    continue
+                self.states[tick] = state
+                self.states.pop(tick - SNAPSHOT_HISTORY * self.snapshot_every, None)
+                sample = race_time - time.perf_counter()
+                if self.clock_offset is None or abs(sample - self.clock_offset) > 1.0:
+                    self.clock_offset = sample  # first snapshot, or the server jumped
+                else:
+                    self.clock_offset += (sample - self.clock_offset) * CLOCK_SMOOTHING
+                self.snapshots = self.snapshots[-3:] + [(race_time, countdown_start, race_active, state)]
+                self.acked = tick
+                self._send()
+                if self.on_snapshot is not None:
+                    self.on_snapshot(self)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def send_input(self, bits: int) -> None:
+        if bits != self.bits:
+            self.bits = bits
+            self._send()
+
+    def _send(self) -> None:
+        if not self.writer.transport.is_closing():
+            self.writer.write(_INPUT.pack(self.acked, self.bits))
+            self.bytes_sent += _INPUT.size
+
+    def car_state(self, car: int):
+        """(x, y, angle) of `car` in the newest snapshot, or None before the first."""
+        if not self.snapshots:
+            return None
+        state = self.snapshots[-1][3]
+        at = car * FIELD_COUNT
+        return state[at] / 64, state[at + 1] / 64, state[at + 2] / FIELDS[2][1]
+
+    def apply(self, sim: Simulation, now: float = None) -> None:
+        """Write the race as it stood INTERP_DELAY ago into `sim`, a display-only mirror."""
+        snapshots = self.snapshots
+        if not snapshots:
+            return
+        if now is None:
+            now = time.perf_counter()
+        render_time = now + self.clock_offset - INTERP_DELAY
+        older = newer = snapshots[-1]
+        for snapshot in reversed(snapshots):
+            if snapshot[0] <= render_time:
+                older = snapshot
+                break
+            newer = snapshot
+            older = snapshot
+        alpha = 0.0
+        if newer[0] > older[0]:
+            alpha = min(1.0, max(0.0, (render_time - older[0]) / (newer[0] - older[0])))
+
+        sim.time = older[0] + (newer[0] - older[0]) * alpha
+        sim.countdown_start = older[1]
+        sim.race_active = older[2]
+        a = older[3]
+        b = newer[3]
+        angle_scale = FIELDS[2][1]
+        for idx, car in enumerate(sim.cars):
+            at = idx * FIELD_COUNT
+            turn = (b[at + 2] - a[at + 2] + ANGLE_STEPS // 2) % ANGLE_STEPS - ANGLE_STEPS // 2
+            car["x"] = car["prev_x"] = (a[at] + (b[at] - a[at]) * alpha) / 64
+            car["y"] = car["prev_y"] = (a[at + 1] + (b[at + 1] - a[at + 1]) * alpha) / 64
+            car["angle"] = car["prev_angle"] = (a[at + 2] + turn * alpha) / angle_scale
+            car["progress"] = (a[at + 3] + (b[at + 3] - a[at + 3]) * alpha) / 65536
+            car["gap"] = a[at + 4] / 1000
+            car["on_overpass"] = bool(a[at + 5] & 1)
+            car["off_track"] = bool(a[at + 5] & 2)
+            car["laps"] = a[at + 6]
+            car["last_lap_duration"] = a[at + 7] / 1000 if a[at + 7] >= 0 else None
+            car["last_lap_time"] = a[at + 8] / 1000
+            car["last_sector"] = a[at + 9]
+            car["last_sector_duration"] = a[at + 10] / 1000
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+class ThreadedClient:
+    """A RaceClient running on its own event loop thread, for the Tk window."""
+
+    def __init__(self, host: str, port: int, timeout: float = 5.0) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = RaceClient()
+        self.bits = 0
+        try:
+            asyncio.run_coroutine_threadsafe(self.client.connect(host, port), self.loop).result(timeout)
+        except BaseException:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            raise
+
+    @property
+    def car(self) -> int:
+        return self.client.car
+
+    def new_simulation(self) -> Simulation:
+        """A Simulation with the server's track and field of cars, to mirror the race into."""
+        return Simulation(self.client.num_cars, track=self.client.load_track())
+
+    def update(self, sim: Simulation, bits: int) -> None:
+        """Send our input if it changed, then mirror the race into `sim`."""
+        if bits != self.bits:
+            self.bits = bits
+            self.loop.call_soon_threadsafe(self.client.send_input, bits)
+        self.client.apply(sim)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result(5.0)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5.0)
+
+
+class LineBot:
+    """Load-test driver that follows the centreline using only what its client sees."""
+
+    def __init__(self, line) -> None:
+        self.line = line  # the track's CentreLine
+        self.index = None
+
+    def update(self, client: RaceClient) -> None:
+        x, y, angle = client.car_state(client.car)
+        line = self.line
+        self.index = line.nearest(x, y, angle) if self.index is None else line.track(self.index, x, y)
+        aim = (self.index + 8) % line.count
+        error = math.atan2(line.ys[aim] - y, line.xs[aim] - x) - angle
+        error = (error + math.pi) % (2 * math.pi) - math.pi
+        bits = INPUT_UP if abs(error) < 0.6 else 0
+        if error > 0.05:
+            bits |= INPUT_RIGHT
+        elif error < -0.05:
+            bits |= INPUT_LEFT
+        client.send_input(bits)
+
+
+async def load_test(players: int, seconds: float) -> dict:
+    """Race `players` bot clients over loopback for `seconds`; returns server tick and traffic stats."""
+    server = RaceServer(Simulation(players))
+    port = await server.start("127.0.0.1", 0)
+    clients = []
+    try:
+        for _ in range(players):
+            client = RaceClient()
+            await client.connect("127.0.0.1", port)
+            client.on_snapshot = LineBot(server.sim.track.line).update
+            clients.append(client)
+        server.sim.skip_countdown()
+        await server.run(1.0)  # let the field spread out before measuring
+        server.tick_times.clear()
+        sent = {car: player.bytes_sent for car, player in server.players.items()}
+        received = {car: player.bytes_received for car, player in server.players.items()}
+        start = time.perf_counter()
+        await server.run(seconds)
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+    finally:
+        for client in clients:
+            await client.close()
+        await server.close()
+    down = [stats["bytes_sent"][car] - sent[car] for car in sent]
+    up = [stats["bytes_received"][car] - received[car] for car in received]
+    return {
+        "players": players,
+        "tick_mean_ms": stats["tick_mean_ms"],
+        "tick_p99_ms": stats["tick_p99_ms"],
+        "tick_max_ms": stats["tick_max_ms"],
+        "ticks_per_s": stats["ticks"] / elapsed,
+        "down_bytes_per_s": statistics.fmean(down) / elapsed,
+        "up_bytes_per_s": statistics.fmean(up) / elapsed,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Loopback load test of the race server with bot clients")
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--seconds", type=float, default=5.0, help="measured seconds per player count")
+    args = parser.parse_args(argv)
+
+    print(f"{'players':>8}{'tick mean ms':>14}{'tick p99 ms':>13}{'tick max ms':>13}{'ticks/s':>9}"
+          f"{'down B/s/client':>17}{'up B/s/client':>15}")
+    for players in args.players:
+        result = asyncio.run(load_test(players, args.seconds))
+        print(f"{players:>8}{result['tick_mean_ms']:>14.3f}{result['tick_p99_ms']:>13.3f}"
+              f"{result['tick_max_ms']:>13.3f}{result['ticks_per_s']:>9.1f}"
+              f"{result['down_bytes_per_s']:>17.0f}{result['up_bytes_per_s']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Opt-in per-phase frame timing.
+
+Code being measured takes a start time and reports it back:
+
+    if prof is not None:
+        start = perf_counter()
+    ...
+    if prof is not None:
+        prof.add(PHASE_LAPS, start)
+
+Time is summed per phase until `end_frame()` copies the totals into a
+preallocated ring buffer, so recording never allocates. With no profiler
+attached the only cost is the `is not None` checks.
+"""
+
+import csv
+from array import array
+from time import perf_counter
+
+
+PHASES = (
+    "frame",
+    "start",
+    "physics",
+    "on_track",
+    "laps",
+    "collisions",
+    "shapes",
+    "hud",
+    "crowd",
+    "ai",
+    "progress",
+)
+PHASE_FRAME = 0
+PHASE_START = 1
+PHASE_PHYSICS = 2  # whole car loop, including on_track
+PHASE_ON_TRACK = 3
+PHASE_LAPS = 4  # lap and sector timing, after the car loop
+PHASE_COLLISIONS = 5
+PHASE_SHAPES = 6  # shape transforms and coords calls
+PHASE_HUD = 7
+PHASE_CROWD = 8
+PHASE_AI = 9
+PHASE_PROGRESS = 10  # track progress and gaps, after the car loop
+
+DEFAULT_CAPACITY = 1024  # frames kept for percentiles and the CSV dump
+
+
+class FrameProfiler:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        width = len(PHASES)
+        self.ring = array("d", bytes(8 * width * capacity))  # seconds, frame-major
+        self.current = [0.0] * width
+        self.frames = 0
+
+    def add(self, phase: int, start: float) -> None:
+        self.current[phase] += perf_counter() - start
+
+    def end_frame(self) -> None:
+        width = len(PHASES)
+        base = (self.frames % self.capacity) * width
+        current = self.current
+        ring = self.ring
+        for phase in range(width):
+            ring[base + phase] = current[phase]
+            current[phase] = 0.0
+        self.frames += 1
+
+    def _recent(self, phase: int):
+        width = len(PHASES)
+        count = min(self.frames, self.capacity)
+        return [self.ring[slot * width + phase] for slot in range(count)]
+
+    def percentiles(self):
+        """Return {phase: (p50, p95, p99)} in milliseconds over the buffered frames."""
+        out = {}
+        for phase, name in enumerate(PHASES):
+            values = sorted(self._recent(phase))
+            if not values:
+                out[name] = (0.0, 0.0, 0.0)
+                continue
+            last = len(values) - 1
+            out[name] = tuple(values[round(last * q)] * 1000.0 for q in (0.50, 0.95, 0.99))
+        return out
+
+    def summary(self) -> str:
+        lines = [f"{'phase':<11}{'p50':>7}{'p95':>7}{'p99':>7}  ms"]
+        for name, (p50, p95, p99) in self.percentiles().items():
+            lines.append(f"{name:<11}{p50:>7.2f}{p95:>7.2f}{p99:>7.2f}")
+        return "\n".join(lines)
+
+    def write_csv(self, path: str) -> None:
+        """Dump the buffered frames, oldest first, one row per frame in ms."""
+        width = len(PHASES)
+        count = min(self.frames, self.capacity)
+        first = self.frames - count
+        with open(path, "w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["frame"] + [f"{name}_ms" for name in PHASES])
+            for frame in range(first, self.frames):
+                base = (frame % self.capacity) * width
+                writer.writerow([frame] + [f"{self.ring[base + p] * 1000.0:.4f}" for p in range(width)])
@@ -0,0 +1,93 @@
+class RetainedCanvas:
+    """Diffing front-end for a tk.Canvas.
+
+    Every `coords`/`itemconfig` call goes through here. The last value sent
+    for each item (or tag) is remembered, and anything identical is dropped
+    before it becomes a Tcl round-trip. `frame_calls` holds the number of Tk
+    calls the previous frame actually issued, which makes the savings easy
+    to check.
+
+    All updates to an item must go through the same instance, and an item
+    must always be addressed the same way (by id or by one tag), otherwise
+    the cache no longer reflects what Tk is showing.
+    """
+
+    def __init__(self, canvas) -> None:
+        self.canvas = canvas
+        self._coords = {}
+        self._options = {}
+        self.calls = 0
+        self.frame_calls = 0
+        self.total_calls = 0
+
+    def coords(self, item, points) -> None:
+        if self._coords.get(item) == points:
+            return
+        self._coords[item] = points
+        self.canvas.coords(item, *points)
+        self.calls += 1
+
+    def itemconfig(self, item, **options) -> None:
+        known = self._options.get(item)
+        if known is None:
+            known = self._options[item] = {}
+        changed = {key: value for key, value in options.items() if known.get(key) != value}
+        if not changed:
+            return
+        known.update(changed)
+        self.canvas.itemconfig(item, **changed)
+        self.calls += 1
+
+    def forget(self, item) -> None:
+        """Drop cached state for an item changed or deleted behind our back."""
+        self._coords.pop(item, None)
+        self._options.pop(item, None)
+
+    def end_frame(self) -> int:
+        """Close the frame's call count and start a new one."""
+        self.frame_calls = self.calls
+        self.total_calls += self.calls
+        self.calls = 0
+        return self.frame_calls
+
+
+class Viewport:
+    """A camera onto the world: one scrolling tk.Canvas that follows a car.
+
+    The canvas scroll region covers the whole world, so following a car is
+    a scroll and the static scenery never has to be touched. Items tagged
+    "overlay" (HUD text, countdown, buttons) are shifted with the camera by a
+    single `move` call, which keeps them fixed on screen. Callers cull
+    everything `visible()` rejects instead of updating it.
+    """
+
+    def __init__(self, canvas, width: int, height: int, world_w: float, world_h: float, car: int = 0) -> None:
+        self.canvas = canvas
+        self.view = RetainedCanvas(canvas)
+        self.width = width
+        self.height = height
+        self.world_w = world_w
+        self.world_h = world_h
+        self.car = car  # index of the car the camera follows
+        self.left = 0
+        self.top = 0
+        # Scroll in whole pixels, so a camera position maps exactly onto the canvas.
+        canvas.configure(scrollregion=(0, 0, world_w, world_h), xscrollincrement=1, yscrollincrement=1)
+
+    def follow(self, x: float, y: float) -> None:
+        """Centre the camera on (x, y), stopping at the edges of the world."""
+        left = int(min(max(x - self.width / 2, 0.0), max(0.0, self.world_w - self.width)))
+        top = int(min(max(y - self.height / 2, 0.0), max(0.0, self.world_h - self.height)))
+        if left == self.left and top == self.top:
+            return
+        self.canvas.move("overlay", left - self.left, top - self.top)
+        self.canvas.xview_moveto(left / self.world_w)
+        self.canvas.yview_moveto(top / self.world_h)
+        self.left = left
+        self.top = top
+        self.view.calls += 3
+
+    def visible(self, x: float, y: float, margin: float) -> bool:
+        """Whether anything within `margin` of (x, y) can be on screen."""
+        return (self.left - margin < x < self.left + self.width + margin
+                and self.top - margin < y < self.top + self.height + margin)
@@ -0,0 +1,164 @@
+"""Compact input recordings and deterministic replay.
+
+A race is fully determined by its start state and the INPUT_* bitmask of
+every car on every fixed physics step, plus the partial holds of the few
+steps where a key went down or up part-way through, so that is all a
+recording keeps: two cars per byte per tick, after a small header with the
+seed, start clock and track, then the partial holds. Replaying the inputs
+through a fresh Simulation reproduces the race exactly, either in the window
+at real time or headlessly at full speed.
+"""
+
+import struct
+from array import array
+
+from simulation import PHYSICS_DT, PHYSICS_HZ, Simulation, load_track
+from track import DEFAULT_TRACK
+
+
+RECORDING_MAGIC = b"VRRC"
+RECORDING_VERSION = 4
+# magic, version, cars, physics Hz, seed, ticks, start time, countdown start, track name length,
+# partial hold count; the track name (UTF-8), the inputs and the partial holds follow
+_HEADER = struct.Struct("<4sHHHIIddHI")
+_PARTIAL = struct.Struct("<IHbb")  # tick, car, throttle, steer (see Simulation.step)
+
+
+class Recording:
+    def __init__(self, num_cars: int, seed: int = 0, start_time: float = 0.0,
+                 countdown_start: float = 0.0, physics_hz: int = PHYSICS_HZ, track: str = DEFAULT_TRACK) -> None:
+        self.num_cars = num_cars
+        self.seed = seed
+        self.start_time = start_time
+        self.countdown_start = countdown_start
+        self.physics_hz = physics_hz
+        self.track = track
+        self.stride = (num_cars + 1) // 2  # bytes per tick
+        self.data = array("B")
+        self.ticks = 0
+        self.partial = {}  # tick -> the partial holds it was stepped with, when there were any
+
+    @classmethod
+    def start(cls, sim: Simulation) -> "Recording":
+        """Begin recording `sim` from its current (freshly reset) state."""
+        return cls(len(sim.cars), sim.seed, sim.time, sim.countdown_start, track=sim.track.ref)
+
+    def __len__(self) -> int:
+        return self.ticks
+
+    def append(self, inputs, partial=None) -> None:
+        if partial:
+            self.partial[self.ticks] = dict(partial)
+        data = self.data
+        count = len(inputs)
+        for i in range(0, self.num_cars, 2):
+            low = inputs[i] & 0xF if i < count else 0
+            high = inputs[i + 1] & 0xF if i + 1 < count else 0
+            data.append(low | (high << 4))
+        self.ticks += 1
+
+    def truncate(self, ticks: int) -> None:
+        """Drop everything after the first `ticks` ticks, e.g. after a rewind."""
+        ticks = max(0, ticks)
+        del self.data[ticks * self.stride:]
+        self.ticks = min(self.ticks, ticks)
+        for tick in [tick for tick in self.partial if tick >= ticks]:
+            del self.partial[tick]
+
+    def inputs_at(self, tick: int, out) -> None:
+        """Decode tick `tick` into `out`, a list with one slot per car."""
+        base = tick * self.stride
+        data = self.data
+        for i in range(self.num_cars):
+            byte = data[base + (i >> 1)]
+            out[i] = (byte >> 4) if i & 1 else (byte & 0xF)
+
+    def new_simulation(self) -> Simulation:
+        """A Simulation in the exact state the recording started from."""
+        sim = Simulation(self.num_cars, track=load_track(self.track), seed=self.seed)
+        self.rewind(sim)
+        return sim
+
+    def rewind(self, sim: Simulation) -> None:
+        """Put `sim` back into the state the recording started from."""
+        sim.time = self.start_time
+        sim.reset()
+        sim.countdown_start = self.countdown_start
+
+    def save(self, path: str) -> None:
+        track = self.track.encode()
+        partial = [_PARTIAL.pack(tick, car, *hold)
+                   for tick, holds in sorted(self.partial.items()) for car, hold in sorted(holds.items())]
+        with open(path, "wb") as fh:
+            fh.write(_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, self.num_cars, self.physics_hz,
+                                  self.seed, self.ticks, self.start_time, self.countdown_start, len(track),
+                                  len(partial)))
+            fh.write(track)
+            self.data.tofile(fh)
+            fh.write(b"".join(partial))
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        with open(path, "rb") as fh:
+            header = fh.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError(f"not a race recording: {path}")
+            (magic, version, num_cars, physics_hz, seed, ticks, start_time, countdown_start,
+             track_len, partial_count) = _HEADER.unpack(header)
+            if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+                raise ValueError(f"unsupported race recording: {path}")
+            if physics_hz != PHYSICS_HZ:
+                raise ValueError(f"{path} was recorded at {physics_hz} Hz, physics now runs at {PHYSICS_HZ} Hz")
+            track = fh.read(track_len).decode()
+            recording = cls(num_cars, seed, start_time, countdown_start, physics_hz, track)
+            recording.data.fromfile(fh, ticks * recording.stride)
+            recording.ticks = ticks
+            partial = fh.read(partial_count * _PARTIAL.size)
+            if len(partial) != partial_count * _PARTIAL.size:
+                raise ValueError(f"truncated race recording: {path}")
+            for tick, car, throttle, steer in _PARTIAL.iter_unpack(partial):
+                recording.partial.setdefault(tick, {})[car] = (throttle, steer)
+        return recording
+
+
+class ReplayInputs:
+    """Feeds a recording's inputs back one tick at a time.
+
+    After each `next()`, `partial` holds that tick's partial holds (or None).
+    """
+
+    def __init__(self, recording: Recording) -> None:
+        self.recording = recording
+        self.tick = 0
+        self.inputs = [0] * recording.num_cars
+        self.partial = None
+
+    @property
+    def finished(self) -> bool:
+        return self.tick >= len(self.recording)
+
+    def next(self):
+        if self.finished:
+            for i in range(len(self.inputs)):
+                self.inputs[i] = 0
+            self.partial = None
+        else:
+            self.recording.inputs_at(self.tick, self.inputs)
+            self.partial = self.recording.partial.get(self.tick)
+            self.tick += 1
+        return self.inputs
+
+
+def replay_headless(recording: Recording, telemetry=None) -> Simulation:
+    """Replay a whole recording as fast as the CPU allows; returns the final state.
+
+    Each tick is also passed to `telemetry.record()` when a writer is given.
+    """
+    sim = recording.new_simulation()
+    feed = ReplayInputs(recording)
+    step = sim.step
+    for _ in range(len(recording)):
+        step(PHYSICS_DT, feed.next(), feed.partial)
+        if telemetry is not None:
+            telemetry.record(sim)
+    return sim
@@ -0,0 +1,181 @@
+"""Race-state snapshots in a preallocated ring, for rewinding and rollback.
+
+Everything a Simulation carries from one step to the next is a few numbers
+per car plus the race clock, so a snapshot packs each car's dynamic fields
+into a fixed-size struct record in a buffer allocated up front, one
+`RaceState` per ring slot. Saving and restoring are O(cars): one
+`pack_into`/`unpack_from` per car and no per-snapshot allocation beyond the
+race clock's scalars.
+
+Each slot also keeps the inputs (and partial holds) the step after it was
+taken with, so a late input (say, one a network peer sent a few ticks ago)
+can be corrected by restoring the state at its tick and stepping forward
+again:
+
+    ring = SnapshotRing(sim)
+    ring.save(sim, inputs, partial)     # before every sim.step(PHYSICS_DT, inputs, partial)
+    ring.correct(sim, tick, car, bits)
+
+Only the dict-based Simulation is covered; ArraySimulation keeps its state
+in NumPy arrays.
+"""
+
+import operator
+import struct
+from array import array
+
+from simulation import PHYSICS_DT, PHYSICS_HZ
+
+ROLLBACK_SECONDS = 3
+ROLLBACK_TICKS = ROLLBACK_SECONDS * PHYSICS_HZ  # snapshots kept, one per physics step
+
+# Per-car fields that change as the race runs, and how each is packed.
+# last_lap_duration is kept apart because it may be None.
+CAR_FIELDS = (
+    ("x", "d"),
+    ("y", "d"),
+    ("prev_x", "d"),
+    ("prev_y", "d"),
+    ("angle", "d"),
+    ("prev_angle", "d"),
+    ("vel", "d"),
+    ("laps", "i"),
+    ("last_lap_time", "d"),
+    ("next_line", "i"),
+    ("timed_lap", "?"),
+    ("line_time", "d"),
+    ("last_sector", "i"),
+    ("last_sector_duration", "d"),
+    ("on_overpass", "?"),
+    ("off_track", "?"),
+    ("off_track_time", "d"),
+    ("collisions", "i"),
+    ("contact_tick", "q"),
+    ("station", "i"),
+    ("stations", "q"),
+    ("progress", "d"),
+    ("checkpoint", "q"),
+    ("gap", "d"),
+)
+_CAR = struct.Struct("=" + "".join(code for _, code in CAR_FIELDS))
+_FIELD_NAMES = tuple(name for name, _ in CAR_FIELDS)
+_get_fields = operator.itemgetter(*_FIELD_NAMES)
+
+
+class RaceState:
+    """One snapshot of a race: the clock, running order and every car's record."""
+
+    __slots__ = ("tick", "time", "countdown_start", "race_active", "checkpoint_times",
+                 "checkpoints", "best_sectors", "order", "cars", "durations", "inputs", "partial")
+
+    def __init__(self, num_cars: int) -> None:
+        self.tick = -1  # sim.ticks when taken; -1 while the slot is empty
+        self.time = 0.0
+        self.countdown_start = 0.0
+        self.race_active = False
+        self.checkpoint_times = None
+        self.checkpoints = 0
+        self.best_sectors = None
+        self.order = [0] * num_cars
+        self.cars = bytearray(_CAR.size * num_cars)
+        self.durations = [None] * num_cars
+        self.inputs = bytearray(num_cars)
+        self.partial = None
+
+    def capture(self, sim, inputs, partial=None) -> None:
+        self.tick = sim.ticks
+        self.time = sim.time
+        self.countdown_start = sim.countdown_start
+        self.race_active = sim.race_active
+        # Checkpoint times are only ever appended to, so the array and its
+        # length pin down its contents at this tick.
+        self.checkpoint_times = sim.checkpoint_times
+        self.checkpoints = len(sim.checkpoint_times)
+        if self.best_sectors is None:
+            self.best_sectors = array("d", sim.best_sectors)
+        else:
+            self.best_sectors[:] = sim.best_sectors
+        self.order[:] = sim.order
+        buf = self.cars
+        pack_into = _CAR.pack_into
+        size = _CAR.size
+        durations = self.durations
+        count = len(inputs)
+        for idx, car in enumerate(sim.cars):
+            pack_into(buf, idx * size, *_get_fields(car))
+            durations[idx] = car["last_lap_duration"]
+            self.inputs[idx] = inputs[idx] if idx < count else 0
+        self.partial = dict(partial) if partial else None
+
+    def apply(self, sim) -> None:
+        sim.ticks = self.tick
+        sim.time = self.time
+        sim.countdown_start = self.countdown_start
+        sim.race_active = self.race_active
+        del self.checkpoint_times[self.checkpoints:]
+        sim.checkpoint_times = self.checkpoint_times
+        sim.best_sectors[:] = self.best_sectors
+        sim.order[:] = self.order
+        buf = self.cars
+        unpack_from = _CAR.unpack_from
+        size = _CAR.size
+        durations = self.durations
+        for idx, car in enumerate(sim.cars):
+            car.update(zip(_FIELD_NAMES, unpack_from(buf, idx * size)))
+            car["last_lap_duration"] = durations[idx]
+
+
+class SnapshotRing:
+    """The last `capacity` physics steps of a race, one RaceState per step."""
+
+    def __init__(self, sim, capacity: int = ROLLBACK_TICKS) -> None:
+        self.slots = [RaceState(len(sim.cars)) for _ in range(capacity)]
+        self.newest = -1  # tick of the latest snapshot
+
+    def clear(self) -> None:
+        for slot in self.slots:
+            slot.tick = -1
+        self.newest = -1
+
+    def save(self, sim, inputs, partial=None) -> None:
+        """Snapshot `sim` just before it steps with `inputs` and `partial`."""
+        self.slots[sim.ticks % len(self.slots)].capture(sim, inputs, partial)
+        self.newest = sim.ticks
+
+    def oldest(self) -> int:
+        """Earliest tick that can still be restored, or -1 if none."""
+        if self.newest < 0:
+            return -1
+        tick = max(0, self.newest - len(self.slots) + 1)
+        while self.slots[tick % len(self.slots)].tick != tick:
+            tick += 1  # the ring was cleared since
+        if tick > self.newest:
+            return -1  # what is left was dropped by a restore
+        return tick
+
+    def restore(self, sim, tick: int) -> None:
+        """Put `sim` back to the start of step `tick`; later snapshots are dropped."""
+        slot = self.slots[tick % len(self.slots)]
+        if slot.tick != tick or tick > self.newest:
+            raise KeyError(f"no snapshot of tick {tick}")
+        slot.apply(sim)
+        self.newest = tick - 1
+
+    def correct(self, sim, tick: int, car: int, bits: int) -> None:
+        """Roll back to `tick`, hold `car`'s input at `bits` from then on, and catch up.
+
+        Every other input is replayed as it was first applied, so the race
+        ends up where it would have been had the input arrived on time.
+        """
+        now = sim.ticks
+        slots = self.slots
+        history = [(bytes(slot.inputs), slot.partial)
+                   for slot in (slots[t % len(slots)] for t in range(tick, now))]
+        self.restore(sim, tick)
+        for recorded, partial in history:
+            inputs = list(recorded)
+            inputs[car] = bits
+            if partial and car in partial:
+                partial = {idx: hold for idx, hold in partial.items() if idx != car} or None
+            self.save(sim, inputs, partial)
+            sim.step(PHYSICS_DT, inputs, partial)
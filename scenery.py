@@ -0,0 +1,249 @@
+"""Static scenery: the display list and its baked image layer.
+
+`static_track_items()` describes the grandstands, track and markings as a
+list of primitives. Without Pillow the game creates one canvas item per
+primitive. With Pillow, `load_scenery_frames()` rasterizes the list once
+per crowd animation frame and caches the PNGs under .cache/, keyed by a
+hash of the display list, so the scenery costs a single image item.
+"""
+
+import hashlib
+import math
+import os
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow is optional; the vector path needs nothing extra.
+    Image = None
+
+from simulation import TRACK_MARGIN, WINDOW_H, WINDOW_W
+from track import CACHE_DIR
+
+
+SCENERY_VERSION = 3
+SUPERSAMPLE = 2  # render at 2x and downsample, standing in for Tk's anti-aliasing
+CROWD_GROUPS = 3
+CROWD_COLORS = ("#f3a26b", "#7ad1ff", "#e8e4b3")
+CROWD_PHASES = 2
+
+
+def crowd_color(group: int, phase: int) -> str:
+    """Colour of crowd group `group` (index mod 3) in animation phase `phase`."""
+    return CROWD_COLORS[(group + phase) % CROWD_GROUPS]
+
+
+def static_track_items(track):
+    """Return the scenery round `track` as a list of (kind, coords, options) primitives.
+
+    `kind` is "rect", "line" or "text", and `options` are canvas options.
+    Crowd rectangles carry an extra "crowd" option with their animation
+    group; it is not a canvas option and must be stripped before use.
+    """
+    items = []
+
+    def rect(x0, y0, x1, y1, **options):
+        items.append(("rect", (x0, y0, x1, y1), options))
+
+    def line(points, **options):
+        items.append(("line", tuple(points), options))
+
+    # Scenic background (stands, banners, infield) across the whole world
+    world_w, world_h = track.size
+    rect(0, 0, world_w, world_h, fill="#23402b", outline="")
+    rect(0, 0, world_w, TRACK_MARGIN - 12, fill="#20252b", outline="")
+    rect(0, world_h - (TRACK_MARGIN - 12), world_w, world_h, fill="#20252b", outline="")
+    stand_color = "#3b434c"
+    seat_color = "#4b5661"
+    crowd_count = 0
+    for i in range(int(world_w - 130) // 140 + 1):
+        x0 = 40 + i * 140
+        x1 = x0 + 90
+        rect(x0, 6, x1, TRACK_MARGIN - 18, fill=stand_color, outline="")
+        line((x0 + 6, 16, x1 - 6, 16), fill=seat_color, width=2)
+        line((x0 + 8, 26, x1 - 8, 26), fill=seat_color, width=2)
+        line((x0 + 10, 36, x1 - 10, 36), fill=seat_color, width=2)
+        for r in range(3):
+            for c in range(8):
+                cx = x0 + 10 + c * 10
+                cy = 12 + r * 10
+                color = "#7ad1ff" if (c + r) % 2 == 0 else "#f3a26b"
+                rect(cx, cy, cx + 4, cy + 4, fill=color, outline="", crowd=crowd_count % CROWD_GROUPS)
+                crowd_count += 1
+    for i in range(int(world_w - 150) // 170 + 1):
+        bx0 = 70 + i * 170
+        by0 = TRACK_MARGIN - 34
+        rect(bx0, by0, bx0 + 80, by0 + 16, fill="#d35f4d", outline="")
+        items.append(("text", (bx0 + 40, by0 + 8),
+                      {"text": "F1", "fill": "#1b1f24", "font": ("Helvetica", 9, "bold")}))
+
+    # The road, from the track's baked render geometry. The whole loop goes
+    # down first; every bridge deck is then drawn over its own shadow, so the
+    # road it crosses passes underneath. Barriers go down before the road, so
+    # the ones running under a bridge disappear beneath it, and the parapets
+    # along a bridge go on last.
+    road_color = "#2a2f36"
+    edge_color = "#3a4048"
+    barrier_color = "#c9ced6"
+    width = track.width
+    render = track.render
+    for barrier in render["barriers"]:
+        line(list(barrier), fill=barrier_color, width=3, capstyle="round", joinstyle="round")
+    road = list(render["road"])
+    line(road, fill=edge_color, width=width + 4, smooth=True, capstyle="round", joinstyle="round")
+    line(road, fill=road_color, width=width, smooth=True, capstyle="round", joinstyle="round")
+    for shadow in render["shadows"]:
+        line(list(shadow), fill="#0d0f12", width=width + 10, smooth=True, capstyle="round", joinstyle="round")
+    for bridge in render["bridges"]:
+        # Just the road surface: the edges of the road below show through at the sides.
+        line(list(bridge), fill=road_color, width=width, smooth=True, capstyle="round", joinstyle="round")
+    for dashes in render["dashes"]:
+        line(list(dashes), fill="#ffffff", width=2, dash=(15, 15), smooth=True)
+    for parapet in render["parapets"]:
+        line(list(parapet), fill=barrier_color, width=3, capstyle="round", joinstyle="round")
+
+    # Finish line (vertical checker)
+    finish_x, finish_y = track.finish
+    finish_y0 = finish_y - width / 2
+    finish_y1 = finish_y + width / 2
+    block_h = 10
+    for i, y in enumerate(range(int(finish_y0), int(finish_y1), block_h)):
+        color = "#f2f2f2" if i % 2 == 0 else "#1b1f24"
+        rect(finish_x - 6, y, finish_x + 6, min(y + block_h, finish_y1), fill=color, outline="")
+    # Boxes round the painted grid slots
+    grid_w = 28
+    grid_h = 18
+    for gx, gy, angle in track.grid:
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        corners = []
+        for cx, cy in ((-1, -1), (1, -1), (1, 1), (-1, 1), (-1, -1)):
+            ox = cx * grid_w / 2
+            oy = cy * grid_h / 2
+            corners.extend((round(gx + ox * cos_a - oy * sin_a, 1), round(gy + ox * sin_a + oy * cos_a, 1)))
+        line(corners, fill="#5f6b75", width=2)
+
+    return items
+
+
+def load_scenery_frames(track, cache_dir: str = CACHE_DIR):
+    """Return PNG paths for the baked scenery, or None if it can't be baked.
+
+    Frame 0 is the crowd as first drawn; frame 1 + p is crowd phase p.
+    """
+    if Image is None:
+        return None
+
+    items = static_track_items(track)
+    key = hashlib.sha1(repr((SCENERY_VERSION, SUPERSAMPLE, items)).encode()).hexdigest()[:16]
+    crowd_phases = [None] + list(range(CROWD_PHASES))
+    paths = [os.path.join(cache_dir, f"scenery_{key}_{frame}.png") for frame in range(len(crowd_phases))]
+    if all(os.path.exists(path) for path in paths):
+        return paths
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for path, phase in zip(paths, crowd_phases):
+            image = rasterize(items, phase, track.size)
+            tmp_path = path + ".tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+    except OSError:
+        return None  # Unwritable cache: fall back to vector scenery.
+    return paths
+
+
+def rasterize(items, crowd_phase=None, size=(WINDOW_W, WINDOW_H)):
+    """Draw the display list into a Pillow image of `size` (the world's w, h)."""
+    scale = SUPERSAMPLE
+    image_w, image_h = (int(v) for v in size)
+    image = Image.new("RGB", (image_w * scale, image_h * scale))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    for kind, coords, options in items:
+        if kind == "rect":
+            x0, y0, x1, y1 = (v * scale for v in coords)
+            fill = options.get("fill") or None
+            if crowd_phase is not None and "crowd" in options:
+                fill = crowd_color(options["crowd"], crowd_phase)
+            outline = options.get("outline") or None
+            width = int(options.get("width", 1) * scale)
+            draw.rectangle((x0, y0, x1 - 1, y1 - 1), fill=fill, outline=outline,
+                           width=width if outline else 0)
+        elif kind == "line":
+            points = [v * scale for v in coords]
+            if options.get("smooth"):
+                points = _smooth(points)
+            width = int(options.get("width", 1) * scale)
+            fill = options["fill"]
+            if "dash" in options:
+                on, off = (v * scale for v in options["dash"])
+                for segment in _dash(points, on, off):
+                    draw.line(segment, fill=fill, width=width)
+                continue
+            if options.get("joinstyle") != "round":
+                draw.line(points, fill=fill, width=width)
+                continue
+            # Pillow's wide-line joins leave slivers, so stroke each segment
+            # separately and stamp a disc on every vertex for round joins/caps.
+            r = width / 2
+            for i in range(0, len(points) - 2, 2):
+                draw.line(points[i:i + 4], fill=fill, width=width)
+            for i in range(0, len(points), 2):
+                x, y = points[i], points[i + 1]
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=fill)
+        elif kind == "text":
+            x, y = coords
+            draw.text((x * scale, y * scale), options["text"], fill=options["fill"], font=font, anchor="mm")
+
+    return image.resize((image_w, image_h), Image.LANCZOS)
+
+
+def _smooth(points, steps: int = 8):
+    """Quadratic B-spline through midpoints, like a Tk line with smooth=True."""
+    count = len(points) // 2
+    if count < 3:
+        return points
+    pts = [(points[2 * i], points[2 * i + 1]) for i in range(count)]
+    out = [pts[0][0], pts[0][1]]
+    for i in range(1, count - 1):
+        start = pts[0] if i == 1 else ((pts[i - 1][0] + pts[i][0]) / 2, (pts[i - 1][1] + pts[i][1]) / 2)
+        end = pts[-1] if i == count - 2 else ((pts[i][0] + pts[i + 1][0]) / 2, (pts[i][1] + pts[i + 1][1]) / 2)
+        ctrl = pts[i]
+        for s in range(1, steps + 1):
+            u = s / steps
+            a = (1 - u) * (1 - u)
+            b = 2 * (1 - u) * u
+            c = u * u
+            out.append(a * start[0] + b * ctrl[0] + c * end[0])
+            out.append(a * start[1] + b * ctrl[1] + c * end[1])
+    return out
+
+
+def _dash(points, on: float, off: float):
+    """Split a flat polyline into the "on" pieces of an (on, off) dash pattern."""
+    segments = []
+    current = [points[0], points[1]]
+    drawing = True
+    left = on
+    for i in range(2, len(points), 2):
+        x0, y0 = points[i - 2], points[i - 1]
+        x1, y1 = points[i], points[i + 1]
+        length = math.hypot(x1 - x0, y1 - y0)
+        pos = 0.0
+        while length - pos > left:
+            pos += left
+            px = x0 + (x1 - x0) * pos / length
+            py = y0 + (y1 - y0) * pos / length
+            if drawing:
+                current.extend((px, py))
+                segments.append(current)
+            current = [px, py]
+            drawing = not drawing
+            left = on if drawing else off
+        left -= length - pos
+        if drawing:
+            current.extend((x1, y1))
+    if drawing and len(current) >= 4:
+        segments.append(current)
+    return segments
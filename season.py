@@ -0,0 +1,299 @@
+"""Championship seasons: a series of races with every result kept in SQLite.
+
+    python3 season.py --db season.db --races 6 --cars 6 --laps 3
+    python3 main.py --season season.db --ai 4      # race the rounds yourself
+
+A round ends when the leader completes its laps; the running order at that
+moment is the finishing order, and points go to the top ten. Every completed
+lap, plus each car's finishing position, collisions and off-track time, is
+stored per race. Rounds restarted with Reset Race are kept too, marked as
+not finished.
+
+`RaceLog` watches a Simulation and only copies numbers out of it. The
+database work happens on `SeasonWriter`'s own thread, which writes each race
+in one transaction with `executemany`, so saving a race never holds up a
+frame. Personal bests and standings come from indexed queries:
+
+    python3 season.py --db season.db --standings
+"""
+
+import argparse
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from ai import AIDriver
+from simulation import DEFAULT_LAPS, PHYSICS_DT, Simulation, load_track
+from track import DEFAULT_TRACK
+
+DEFAULT_TIME_LIMIT = 300.0  # simulated seconds before a headless round is called
+POINTS = (25, 18, 15, 12, 10, 8, 6, 4, 2, 1)  # by finishing position
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seasons (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS races (
+    id INTEGER PRIMARY KEY,
+    season_id INTEGER NOT NULL REFERENCES seasons(id),
+    round INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    laps INTEGER NOT NULL,
+    finished INTEGER NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    race_id INTEGER NOT NULL REFERENCES races(id),
+    season_id INTEGER NOT NULL,
+    driver TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    laps INTEGER NOT NULL,
+    best_lap REAL,
+    collisions INTEGER NOT NULL,
+    off_track_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS laps (
+    race_id INTEGER NOT NULL REFERENCES races(id),
+    track TEXT NOT NULL,
+    driver TEXT NOT NULL,
+    lap INTEGER NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_season ON results (season_id, driver, points);
+CREATE INDEX IF NOT EXISTS laps_by_driver ON laps (track, driver, duration);
+"""
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def standings(conn: sqlite3.Connection, season_id: int):
+    """(driver, points, races, wins) for every driver in the season, leader first."""
+    return conn.execute(
+        "SELECT driver, SUM(points), COUNT(*), SUM(position = 1) FROM results"
+        " WHERE season_id = ? GROUP BY driver ORDER BY SUM(points) DESC, SUM(position = 1) DESC",
+        (season_id,),
+    ).fetchall()
+
+
+def personal_bests(conn: sqlite3.Connection, track: str):
+    """(driver, best lap, laps driven) on `track` across every season, fastest first."""
+    return conn.execute(
+        "SELECT driver, MIN(duration), COUNT(*) FROM laps WHERE track = ? GROUP BY driver ORDER BY 2",
+        (track,),
+    ).fetchall()
+
+
+def latest_season(conn: sqlite3.Connection):
+    row = conn.execute("SELECT MAX(id) FROM seasons").fetchone()
+    return row[0]
+
+
+class RaceLog:
+    """One race's laps and finishing order, copied out of the Simulation as it runs."""
+
+    def __init__(self, sim: Simulation, laps: int = DEFAULT_LAPS) -> None:
+        self.target = laps
+        self.start = sim.time  # the round's duration includes the countdown
+        self.seen = [0] * len(sim.cars)
+        self.laps = []  # (car index, lap number, duration)
+
+    def update(self, sim: Simulation) -> bool:
+        """Note any laps completed in the last step; True once the leader has finished."""
+        seen = self.seen
+        done = False
+        for idx, car in enumerate(sim.cars):
+            if car["laps"] != seen[idx]:
+                seen[idx] = car["laps"]
+                if car["laps"] > 0:
+                    self.laps.append((idx, car["laps"], car["last_lap_duration"]))
+                    done = done or car["laps"] >= self.target
+        return done
+
+    def result(self, sim: Simulation, finished: bool) -> dict:
+        """The race as plain data for SeasonWriter.submit()."""
+        cars = sim.cars
+        best = {}
+        for idx, _, duration in self.laps:
+            best[idx] = min(duration, best.get(idx, duration))
+        order = sim.standings()
+        return {
+            "track": sim.track.name,  # the same track whether loaded by name or by path
+            "seed": sim.seed,
+            "laps": self.target,
+            "finished": finished,
+            "duration": sim.time - self.start,
+            "results": [
+                (cars[idx]["name"], position, cars[idx]["laps"], best.get(idx),
+                 cars[idx]["collisions"], cars[idx]["off_track_time"])
+                for position, idx in enumerate(order, 1)
+            ],
+            "lap_times": [(cars[idx]["name"], lap, duration) for idx, lap, duration in self.laps],
+        }
+
+
+class SeasonWriter:
+    """Writes races to the database from a background thread.
+
+    `submit()` only puts the race on a queue; the thread owns the connection
+    and writes each race in a single transaction. A race that fails to write
+    is rolled back and the thread moves on to the next; `close()` waits for
+    every submitted race and then raises the first such error.
+    """
+
+    def __init__(self, path: str, name: str = None) -> None:
+        self.path = path
+        self.name = name or time.strftime("Season %Y-%m-%d %H:%M")
+        self.season_id = None
+        self.rounds = 0
+        self.queue = queue.Queue()
+        self.ready = threading.Event()
+        self.error = None
+        self.failed = 0  # rounds that could not be written
+        self.thread = threading.Thread(target=self._run, name="season-writer", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, race: dict) -> None:
+        self.rounds += 1
+        self.queue.put((self.rounds, race))
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self) -> None:
+        try:
+            conn = open_db(self.path)
+            with conn:
+                self.season_id = conn.execute("INSERT INTO seasons (name, started) VALUES (?, ?)",
+                                              (self.name, time.time())).lastrowid
+        except sqlite3.Error as exc:
+            self.error = exc
+            self.ready.set()
+            return
+        self.ready.set()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                try:
+                    self._write(conn, *item)
+                except Exception as exc:
+                    # Keep draining, so close() still returns, and report it there.
+                    self.failed += 1
+                    if self.error is None:
+                        self.error = exc
+        finally:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, round_no: int, race: dict) -> None:
+        season_id = self.season_id
+        track = race["track"]
+        with conn:
+            race_id = conn.execute(
+                "INSERT INTO races (season_id, round, track, seed, laps, finished, duration)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (season_id, round_no, track, race["seed"], race["laps"], race["finished"], race["duration"]),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO results (race_id, season_id, driver, position, points, laps, best_lap,"
+                " collisions, off_track_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (race_id, season_id, driver, position,
+                     POINTS[position - 1] if race["finished"] and position <= len(POINTS) else 0,
+                     laps, best_lap, collisions, off_track)
+                    for driver, position, laps, best_lap, collisions, off_track in race["results"]
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO laps (race_id, track, driver, lap, duration) VALUES (?, ?, ?, ?, ?)",
+                [(race_id, track, driver, lap, duration) for driver, lap, duration in race["lap_times"]],
+            )
+
+
+def run_round(track, num_cars: int, laps: int, seed: int, time_limit: float = DEFAULT_TIME_LIMIT) -> dict:
+    """Race one headless round with AI in every car; returns RaceLog.result()."""
+    sim = Simulation(num_cars, track=track, seed=seed)
+    sim.skip_countdown()
+    driver = AIDriver(sim)
+    log = RaceLog(sim, laps)
+    inputs = [0] * num_cars
+    finished = False
+    for _ in range(int(time_limit / PHYSICS_DT)):
+        driver.update(sim, inputs)
+        sim.step(PHYSICS_DT, inputs)
+        if log.update(sim):
+            finished = True
+            break
+    return log.result(sim, finished)
+
+
+def print_tables(conn: sqlite3.Connection, season_id: int, track: str) -> None:
+    print(f"{'driver':>12}  {'points':>6}  {'races':>5}  {'wins':>4}")
+    for driver, points, races, wins in standings(conn, season_id):
+        print(f"{driver:>12}  {points:>6}  {races:>5}  {wins:>4}")
+    print(f"\npersonal bests on {track}")
+    for driver, best, laps in personal_bests(conn, track):
+        print(f"{driver:>12}  {best:8.3f}s  ({laps} laps)")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="SQLite database to add the season to")
+    parser.add_argument("--races", type=int, default=6)
+    parser.add_argument("--cars", type=int, default=6)
+    parser.add_argument("--laps", type=int, default=DEFAULT_LAPS)
+    parser.add_argument("--track", default=DEFAULT_TRACK, help="track name under tracks/, or a path")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first round")
+    parser.add_argument("--name", help="season name (default: the date and time)")
+    parser.add_argument("--standings", action="store_true",
+                        help="print the latest season's standings and exit")
+    args = parser.parse_args(argv)
+
+    try:
+        track = load_track(args.track)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+
+    if args.standings:
+        conn = open_db(args.db)
+        season_id = latest_season(conn)
+        if season_id is None:
+            parser.error(f"no seasons in {args.db}")
+        print_tables(conn, season_id, track.name)
+        conn.close()
+        return
+
+    writer = SeasonWriter(args.db, args.name)
+    start = time.perf_counter()
+    try:
+        for round_no in range(args.races):
+            writer.submit(run_round(track, args.cars, args.laps, args.seed + round_no))
+            rate = (round_no + 1) / (time.perf_counter() - start)
+            print(f"\r{round_no + 1}/{args.races} rounds, {rate:.1f}/s", end="", file=sys.stderr, flush=True)
+    finally:
+        writer.close()
+    print(file=sys.stderr)
+
+    conn = open_db(args.db)
+    print_tables(conn, writer.season_id, track.name)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
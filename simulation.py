@@ -0,0 +1,751 @@
+import functools
+import math
+import random
+from array import array
+from time import perf_counter
+
+from profiler import PHASE_COLLISIONS, PHASE_LAPS, PHASE_ON_TRACK, PHASE_PHYSICS, PHASE_PROGRESS, PHASE_START
+from track import BARRIER_TOLERANCE, DEFAULT_TRACK, FIELD_CELL, Track
+
+
+WINDOW_W = 900
+WINDOW_H = 600  # also the world size of tracks that don't set their own
+TRACK_MARGIN = 70
+TRACK_WIDTH = 90  # of the default track; each Track carries its own width
+
+CAR_LENGTH = 28
+CAR_WIDTH = 14
+CAR_SPEED = 340.0  # pixels per second
+TURN_SPEED = 2.6   # radians per second
+FRICTION = 0.95
+COLLISION_DAMPING = 0.85
+OFF_TRACK_FRICTION = 0.72
+COLLISION_DIST = CAR_LENGTH * 0.75  # centre distance at which two cars touch
+BARRIER_RADIUS = CAR_WIDTH * 0.75  # a car is a disc this size against the barriers; at most BARRIER_REACH
+# A car moving further than this in one step is integrated in substeps and
+# swept against the other cars, so nothing tunnels through at speed.
+SAFE_TRAVEL = CAR_LENGTH * 0.25
+# FRICTION and OFF_TRACK_FRICTION were tuned at one application per 60 Hz
+# frame; steps of any other length scale them so handling stays the same.
+FRICTION_REFERENCE_HZ = 60
+PHYSICS_HZ = 120
+PHYSICS_DT = 1.0 / PHYSICS_HZ
+COUNTDOWN_SECONDS = 5
+DEFAULT_LAPS = 3  # of a race that is run to a finish (batch runs, season rounds)
+FLAG_SECONDS = 1.6
+
+CHECKPOINTS_PER_LAP = 64  # timing points used for the gaps between cars
+RELOCATE_DIST = TRACK_WIDTH  # a car this far from its tracked station is searched for afresh
+
+# Handling constants a Simulation can override per instance, e.g. for sweeps.
+DEFAULT_PARAMS = {
+    "car_speed": CAR_SPEED,
+    "turn_speed": TURN_SPEED,
+    "friction": FRICTION,
+    "off_track_friction": OFF_TRACK_FRICTION,
+    "collision_damping": COLLISION_DAMPING,
+}
+
+# Per-car inputs passed to Simulation.step, one bitmask per car
+INPUT_UP = 1
+INPUT_DOWN = 2
+INPUT_LEFT = 4
+INPUT_RIGHT = 8
+# A control held for only part of a step is applied for that share of it,
+# rounded to whole HOLD_STEPS-ths so replays stay exact.
+HOLD_STEPS = 16
+
+# The two keyboard-driven cars; any further cars get a generated livery.
+CAR_STYLES = [
+    {
+        "controls": {"up": "w", "down": "s", "left": "a", "right": "d"},
+        "fill": "#3fb8ff",
+        "outline": "#102733",
+        "wing": "#1c6a9e",
+        "name": "Blue",
+    },
+    {
+        "controls": {"up": "up", "down": "down", "left": "left", "right": "right"},
+        "fill": "#ffd166",
+        "outline": "#3d2c0f",
+        "wing": "#c5932f",
+        "name": "Yellow",
+    },
+]
+EXTRA_CAR_FILLS = ["#ef6f6c", "#7bd389", "#c792ea", "#f4a259", "#5ad2c8", "#e8e4b3"]
+GRID_ROW_GAP = 26  # arc distance between grid slots behind the pole
+
+
+def grid_slot(track: Track, index: int, num_cars: int):
+    """Return (x, y, angle, on_overpass) of a starting slot on `track`.
+
+    The first slots are the painted grid boxes from the track file. Later
+    slots step back along the centreline from pole and alternate either side
+    of it, so large fields still start on the road facing the right way.
+    """
+    line = track.line
+    count = line.count
+    if index < len(track.grid):
+        x, y, angle = track.grid[index]
+        return x, y, angle, bool(track.on_bridge[line.nearest(x, y, angle)])
+
+    # Keep the whole field within 75% of a lap so the back never meets the front.
+    gap = min(GRID_ROW_GAP, 0.75 * line.length / num_cars)
+    gx, gy, _ = track.grid[0]
+    pole = line.nearest(gx, gy)
+    heading = line.headings[pole]
+    along = pole + ((gx - line.xs[pole]) * math.cos(heading) + (gy - line.ys[pole]) * math.sin(heading)) / line.spacing
+    at = along - gap * index / line.spacing
+    i = math.floor(at)
+    u = at - i
+    a = i % count
+    b = (i + 1) % count
+    x = line.xs[a] + (line.xs[b] - line.xs[a]) * u
+    y = line.ys[a] + (line.ys[b] - line.ys[a]) * u
+    angle = math.atan2(line.ys[b] - line.ys[a], line.xs[b] - line.xs[a])
+    side = -16 if index % 2 == 0 else 16
+    return x - math.sin(angle) * side, y + math.cos(angle) * side, angle, bool(track.on_bridge[a])
+
+
+def make_car(index: int, now: float, slot) -> dict:
+    """A fresh car on the starting slot `slot` from grid_slot()."""
+    grid_x, grid_y, grid_angle, grid_overpass = slot
+    if index < len(CAR_STYLES):
+        style = dict(CAR_STYLES[index])
+    else:
+        style = {
+            "controls": None,
+            "fill": EXTRA_CAR_FILLS[index % len(EXTRA_CAR_FILLS)],
+            "outline": "#1b1f24",
+            "wing": "#30363d",
+            "name": f"Car {index + 1}",
+        }
+    car = {
+        "grid_x": grid_x,
+        "grid_y": grid_y,
+        "grid_angle": grid_angle,
+        "grid_overpass": grid_overpass,
+        "x": grid_x,
+        "y": grid_y,
+        "prev_x": grid_x,
+        "prev_y": grid_y,
+        "angle": grid_angle,
+        "prev_angle": grid_angle,
+        "vel": 0.0,
+        "laps": 0,
+        "last_lap_time": now,
+        "last_lap_duration": None,
+        # Timing, set by Simulation: the next timing line, whether the car has
+        # crossed the finish since the start (so its next crossing is a lap),
+        # when it crossed its last line (NaN if it didn't start the sector
+        # there) and its last sector time (sector -1 before the first).
+        "next_line": 0,
+        "timed_lap": False,
+        "line_time": math.nan,
+        "last_sector": -1,
+        "last_sector_duration": 0.0,
+        "on_overpass": grid_overpass,  # Track which path car is on at crossing
+        "off_track": False,
+        "off_track_time": 0.0,
+        "collisions": 0,  # separate contacts; a long scrape counts once
+        "contact_tick": -2,
+        # Track progress, set by Simulation: laps travelled since the start line
+        # (negative on the grid), plus the last checkpoint and the gap to the
+        # first car through it.
+        "station": 0,
+        "stations": 0,
+        "progress": 0.0,
+        "checkpoint": 0,
+        "gap": 0.0,
+    }
+    car.update(style)
+    return car
+
+
+# Neighbouring hash cells checked from each cell, chosen so every pair of
+# adjacent cells is visited exactly once.
+_NEIGHBOUR_CELLS = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def collision_pairs(xs, ys, cell: float = COLLISION_DIST):
+    """Broadphase: index pairs (i < j) of cars that might be touching.
+
+    Cars are bucketed into a uniform spatial hash with cells of the contact
+    distance, so touching cars always share a cell or sit in adjacent ones
+    and only those buckets are compared. Pairs come back sorted to keep
+    resolution order deterministic.
+    """
+    if len(xs) == 2:
+        return [(0, 1)]  # Hashing two cars costs more than just testing them.
+
+    buckets = {}
+    for idx in range(len(xs)):
+        key = (int(xs[idx] // cell), int(ys[idx] // cell))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [idx]
+        else:
+            bucket.append(idx)
+
+    pairs = []
+    for (cx, cy), members in buckets.items():
+        count = len(members)
+        for i in range(count):
+            for j in range(i + 1, count):
+                pairs.append((members[i], members[j]))
+        for ox, oy in _NEIGHBOUR_CELLS:
+            others = buckets.get((cx + ox, cy + oy))
+            if others is None:
+                continue
+            for a in members:
+                for b in others:
+                    pairs.append((a, b) if a < b else (b, a))
+    pairs.sort()
+    return pairs
+
+
+def barrier_response(x: float, y: float, angle: float, vel: float, new_x: float, new_y: float):
+    """(x, y, vel) of a car pushed off a barrier from (x, y) to (new_x, new_y).
+
+    Speed is lost in proportion to how squarely the car's heading met the
+    wall, taking the push as the wall's normal.
+    """
+    nx = new_x - x
+    ny = new_y - y
+    depth = math.sqrt(nx * nx + ny * ny)
+    if depth > 0.0:
+        facing = (math.cos(angle) * nx + math.sin(angle) * ny) / depth
+        if facing * vel < 0.0:
+            vel *= 1.0 - abs(facing)
+    return new_x, new_y, vel
+
+
+@functools.lru_cache(maxsize=None)
+def load_track(ref: str = DEFAULT_TRACK, source: bytes = None) -> Track:
+    """A track by name or path (or the JSON `source` of one), baked or read from the cache once per process."""
+    if source is not None:
+        return Track.from_source(ref, source, WINDOW_W, WINDOW_H)
+    return Track.load(ref, WINDOW_W, WINDOW_H)
+
+
+def resort(order, keys):
+    """Insertion-sort `order` (indices into `keys`) by descending key, in place.
+
+    Meant for an order that is already nearly right, where it runs in O(n).
+    """
+    for i in range(1, len(order)):
+        idx = order[i]
+        key = keys[idx]
+        j = i - 1
+        while j >= 0 and keys[order[j]] < key:
+            order[j + 1] = order[j]
+            j -= 1
+        order[j + 1] = idx
+    return order
+
+
+class Simulation:
+    """Race physics, lap logic and collisions with no display attached.
+
+    The caller owns the clock: every `step(dt, inputs)` advances the race by
+    `dt` seconds of simulated time, so it runs as fast as the CPU allows.
+    `inputs` holds one INPUT_* bitmask per car; missing entries mean no input.
+    `partial` optionally maps a car index to (throttle, steer) in HOLD_STEPS-ths
+    of full lock, from -HOLD_STEPS to HOLD_STEPS, for cars whose controls were
+    only down for part of the step; those replace what the car's bits say.
+    Callers are expected to use a fixed `dt` (normally PHYSICS_DT); `prev_x`,
+    `prev_y` and `prev_angle` keep the previous step's pose for interpolation.
+    `params` overrides any of DEFAULT_PARAMS for this race only, and `track`
+    is a Track from load_track() (the default track if not given).
+    """
+
+    def __init__(self, num_cars: int = 2, track: Track = None, seed: int = 0,
+                 params: dict = None) -> None:
+        if track is None:
+            track = load_track()
+        self.track = track
+        self.world_w, self.world_h = track.size
+        self.track_field = track.field
+        self.line = track.line
+        self.crossings = track.crossings
+        self.on_bridge = track.on_bridge
+        self.barriers = track.barriers
+        # Cars on the road or just off it can't reach a barrier, so only those
+        # further out than this (or inside a crossing zone) are tested.
+        self.barrier_clear = track.runoff - BARRIER_RADIUS - BARRIER_TOLERANCE - FIELD_CELL
+        self.params = dict(DEFAULT_PARAMS)
+        if params:
+            unknown = set(params) - set(DEFAULT_PARAMS)
+            if unknown:
+                raise ValueError(f"unknown physics parameters: {', '.join(sorted(unknown))}")
+            self.params.update(params)
+        self.profiler = None  # a profiler.FrameProfiler to time each phase of step()
+        finish_x, finish_y = track.finish
+        self.timing = track.timing
+
+        # All randomness in a race must come from self.rng so replays stay exact.
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.time = 0.0
+        self.ticks = 0
+        self.countdown_start = self.time
+        self.race_active = False
+
+        self.cars = [make_car(i, self.time, grid_slot(track, i, num_cars)) for i in range(num_cars)]
+
+        self.finish_station = self.line.nearest(finish_x, finish_y, 0.0)
+        self.checkpoint_times = array("d")  # when the first car passed each checkpoint
+        self.best_sectors = array("d", [math.inf] * len(self.timing))  # fastest time through each sector
+        self.order = list(range(num_cars))  # running order, see standings()
+        for car in self.cars:
+            self._place_on_line(car)
+
+    def step(self, dt: float, inputs, partial=None) -> None:
+        self.time += dt
+        self.ticks += 1
+        now = self.time
+        prof = self.profiler
+
+        if prof is not None:
+            start = perf_counter()
+        self._update_start_sequence(now)
+        if prof is not None:
+            prof.add(PHASE_START, start)
+            physics_start = perf_counter()
+        params = self.params
+        accel = params["car_speed"] * dt
+        turn = params["turn_speed"] * dt
+        friction = params["friction"] ** (dt * FRICTION_REFERENCE_HZ)
+        off_track_friction = params["off_track_friction"] ** (dt * FRICTION_REFERENCE_HZ)
+
+        for idx, car in enumerate(self.cars):
+            car["prev_x"] = car["x"]
+            car["prev_y"] = car["y"]
+            car["prev_angle"] = car["angle"]
+
+            if self.race_active:
+                bits = inputs[idx] if idx < len(inputs) else 0
+                hold = partial.get(idx) if partial else None
+                if hold is not None:
+                    throttle = hold[0] / HOLD_STEPS
+                    steer = hold[1] / HOLD_STEPS
+                substeps = 1
+                step_dt = dt
+                car_accel = accel
+                car_turn = turn
+                car_friction = friction
+                car_off_track_friction = off_track_friction
+                travel = abs(car["vel"]) * dt
+                if travel > SAFE_TRAVEL:
+                    # Only this car pays for the shorter steps.
+                    substeps = math.ceil(travel / SAFE_TRAVEL)
+                    step_dt = dt / substeps
+                    car_accel = params["car_speed"] * step_dt
+                    car_turn = params["turn_speed"] * step_dt
+                    car_friction = params["friction"] ** (step_dt * FRICTION_REFERENCE_HZ)
+                    car_off_track_friction = params["off_track_friction"] ** (step_dt * FRICTION_REFERENCE_HZ)
+
+                for _ in range(substeps):
+                    if hold is not None:
+                        car["vel"] += throttle * car_accel
+                        car["angle"] += steer * car_turn
+                    else:
+                        if bits & INPUT_UP:
+                            car["vel"] += car_accel
+                        if bits & INPUT_DOWN:
+                            car["vel"] -= car_accel
+
+                        if bits & INPUT_LEFT:
+                            car["angle"] -= car_turn
+                        if bits & INPUT_RIGHT:
+                            car["angle"] += car_turn
+
+                    car["vel"] *= car_friction
+
+                    car["x"] += math.cos(car["angle"]) * car["vel"] * step_dt
+                    car["y"] += math.sin(car["angle"]) * car["vel"] * step_dt
+
+                    if prof is not None:
+                        start = perf_counter()
+                    off_track = car["off_track"] = self._is_off_track(car)
+                    if off_track:
+                        car["vel"] *= car_off_track_friction
+                        car["off_track_time"] += step_dt
+                    if prof is not None:
+                        prof.add(PHASE_ON_TRACK, start)
+
+                    self._clamp_to_track(car)
+                    self._hit_barriers(car)
+            else:
+                car["vel"] = 0.0
+
+            # Update which path (overpass/underpass) the car is on
+            self._update_car_path(car)
+
+        if prof is not None:
+            prof.add(PHASE_PHYSICS, physics_start)
+            start = perf_counter()
+        for car in self.cars:
+            self._update_progress(car, now)
+        if prof is not None:
+            prof.add(PHASE_PROGRESS, start)
+            start = perf_counter()
+        if self.race_active:
+            # Timing interpolates along each car's whole move, so one test covers every substep.
+            for car in self.cars:
+                self._check_timing(car, now, dt)
+        if prof is not None:
+            prof.add(PHASE_LAPS, start)
+            start = perf_counter()
+        self._resolve_collisions()
+        if prof is not None:
+            prof.add(PHASE_COLLISIONS, start)
+
+    def skip_countdown(self) -> None:
+        """Start the race on the next step instead of after the countdown."""
+        self.countdown_start = self.time - COUNTDOWN_SECONDS
+
+    def countdown_value(self):
+        """Seconds left on the start countdown, or None once it has finished."""
+        elapsed = self.time - self.countdown_start
+        if elapsed < COUNTDOWN_SECONDS:
+            return COUNTDOWN_SECONDS - int(elapsed)
+        return None
+
+    def flag_time(self):
+        """Time since the green flag while it is still waving, otherwise None."""
+        elapsed = self.time - self.countdown_start - COUNTDOWN_SECONDS
+        if 0.0 <= elapsed < FLAG_SECONDS:
+            return elapsed
+        return None
+
+    def current_lap_time(self, car) -> float:
+        return 0.0 if not self.race_active else self.time - car["last_lap_time"]
+
+    def _update_start_sequence(self, now: float) -> None:
+        if self.race_active or now - self.countdown_start < COUNTDOWN_SECONDS:
+            return
+
+        self.race_active = True
+        for car in self.cars:
+            car["last_lap_time"] = now
+            car["last_lap_duration"] = None
+
+    def reset(self) -> None:
+        now = self.time
+        self.countdown_start = now
+        self.race_active = False
+        for car in self.cars:
+            car["x"] = car["grid_x"]
+            car["y"] = car["grid_y"]
+            car["prev_x"] = car["x"]
+            car["prev_y"] = car["y"]
+            car["angle"] = car["grid_angle"]
+            car["prev_angle"] = car["angle"]
+            car["vel"] = 0.0
+            car["laps"] = 0
+            car["last_lap_time"] = now
+            car["last_lap_duration"] = None
+            car["on_overpass"] = car["grid_overpass"]
+            car["off_track"] = False
+            car["off_track_time"] = 0.0
+            car["collisions"] = 0
+            car["contact_tick"] = -2
+            self._place_on_line(car)
+        self.checkpoint_times = array("d")
+        self.best_sectors = array("d", [math.inf] * len(self.timing))
+        self.order = list(range(len(self.cars)))
+
+    def standings(self):
+        """Car indices in running order, leader first.
+
+        The order is kept between calls and fixed up with an insertion sort,
+        which costs O(n) when nobody has changed places.
+        """
+        return resort(self.order, [car["progress"] for car in self.cars])
+
+    def _nearest_station(self, car) -> int:
+        """Full search for the car's station, on its own level at the crossing."""
+        line = self.line
+        on_bridge = self.on_bridge
+        x = car["x"]
+        y = car["y"]
+        on_overpass = car["on_overpass"]
+        best = 0
+        best_dist = math.inf
+        for i in range(line.count):
+            sx = line.xs[i]
+            sy = line.ys[i]
+            if on_bridge[i] != on_overpass and self._in_crossing_zone(sx, sy):
+                continue
+            dist = (sx - x) ** 2 + (sy - y) ** 2
+            if dist < best_dist:
+                best = i
+                best_dist = dist
+        return best
+
+    def _place_on_line(self, car) -> None:
+        line = self.line
+        station = self._nearest_station(car)
+        half = line.count // 2
+        car["station"] = station
+        car["stations"] = (station - self.finish_station + half) % line.count - half
+        car["progress"] = self._progress(car)
+        car["checkpoint"] = math.floor(car["progress"] * CHECKPOINTS_PER_LAP)
+        car["gap"] = 0.0
+        car["next_line"] = self.timing.next_line(car["progress"] % 1.0 * line.count)
+        car["timed_lap"] = False
+        car["line_time"] = math.nan
+        car["last_sector"] = -1
+        car["last_sector_duration"] = 0.0
+
+    def _progress(self, car) -> float:
+        line = self.line
+        station = car["station"]
+        heading = line.headings[station]
+        along = (car["x"] - line.xs[station]) * math.cos(heading) + (car["y"] - line.ys[station]) * math.sin(heading)
+        return (car["stations"] + along / line.spacing) / line.count
+
+    def _update_progress(self, car, now: float) -> None:
+        """Advance the car's track progress from its previous station."""
+        line = self.line
+        station = line.track(car["station"], car["x"], car["y"])
+        if (line.xs[station] - car["x"]) ** 2 + (line.ys[station] - car["y"]) ** 2 > RELOCATE_DIST ** 2:
+            station = self._nearest_station(car)
+        step = station - car["station"]
+        half = line.count // 2
+        if step > half:
+            step -= line.count
+        elif step < -half:
+            step += line.count
+        car["station"] = station
+        car["stations"] += step
+        car["progress"] = progress = self._progress(car)
+
+        checkpoint = math.floor(progress * CHECKPOINTS_PER_LAP)
+        if checkpoint > car["checkpoint"]:
+            car["checkpoint"] = checkpoint
+            if checkpoint >= 0:
+                times = self.checkpoint_times
+                while len(times) <= checkpoint:
+                    times.append(now)  # nobody has been here yet
+                car["gap"] = now - times[checkpoint]
+
+    def _update_car_path(self, car) -> None:
+        """Update which path (overpass/underpass) the car is on from its station.
+
+        Stations the track file marks as bridge are the overpass. Only update
+        when the car is NOT near a crossing, so it keeps the level it arrived on.
+        """
+        if self._in_crossing_zone(car["x"], car["y"]):
+            return  # Keep current path assignment when near crossing
+        car["on_overpass"] = bool(self.on_bridge[car["station"]])
+
+    def _in_crossing_zone(self, x: float, y: float) -> bool:
+        for cx, cy, zone in self.crossings:
+            if abs(x - cx) < zone and abs(y - cy) < zone:
+                return True
+        return False
+
+    def is_near_crossing(self, x: float, y: float) -> bool:
+        """Check if position is near a crossing"""
+        crossing_radius = self.track.width * 1.0
+        for cx, cy, _ in self.crossings:
+            if abs(x - cx) < crossing_radius and abs(y - cy) < crossing_radius:
+                return True
+        return False
+
+    def should_hide_car(self, car) -> bool:
+        """Determine if car should be hidden (under the overpass)"""
+        if not self.is_near_crossing(car["x"], car["y"]):
+            return False  # Only hide near the crossing
+
+        # Hide if on underpass path (not on overpass)
+        return not car["on_overpass"]
+
+    def _check_timing(self, car, now: float, dt: float) -> None:
+        """Time the car over the timing line ahead of it, or back over the one behind.
+
+        The crossing time is interpolated along the car's move over the step,
+        so splits don't depend on the physics rate.
+        """
+        timing = self.timing
+        station = car["station"]
+        ahead = car["next_line"]
+        if timing.near(ahead, station):
+            hit = timing.crossing(ahead, car["prev_x"], car["prev_y"], car["x"], car["y"])
+            if hit is not None and hit[1]:
+                self._cross_line(car, ahead, now - dt * (1.0 - hit[0]))
+                return
+        behind = (ahead - 1) % len(timing)
+        if timing.near(behind, station):
+            hit = timing.crossing(behind, car["prev_x"], car["prev_y"], car["x"], car["y"])
+            if hit is not None and not hit[1]:
+                # Reversed over it: the line has to be crossed again, and the
+                # sector that follows can't be timed.
+                car["next_line"] = behind
+                car["line_time"] = math.nan
+                if behind == 0:
+                    car["timed_lap"] = False
+
+    def _cross_line(self, car, k: int, when: float) -> None:
+        """Car crossed timing line `k` forwards at time `when`."""
+        lines = len(self.timing)
+        car["next_line"] = (k + 1) % lines
+        duration = when - car["line_time"]
+        car["line_time"] = when
+        if duration == duration:  # NaN when the car didn't start the sector on its line
+            sector = (k - 1) % lines
+            car["last_sector"] = sector
+            car["last_sector_duration"] = duration
+            if duration < self.best_sectors[sector]:
+                self.best_sectors[sector] = duration
+        if k != 0:
+            return
+        # Lines are only ever crossed in order, so a car that has been over
+        # the finish before has done every sector since.
+        if car["timed_lap"]:
+            car["laps"] += 1
+            car["last_lap_duration"] = when - car["last_lap_time"]
+            car["last_lap_time"] = when
+        car["timed_lap"] = True
+
+    def _resolve_collisions(self) -> None:
+        """Push apart every pair of touching cars and knock them back.
+
+        Each pair is judged from where the cars ended the step, and a car's
+        pushes are summed before any is applied, so the outcome doesn't depend
+        on the order pairs are visited in; ArraySimulation does the same sums
+        over arrays. A pair with a car that moved far enough to pass straight
+        through the other is swept instead, and both cars are backed up to
+        where they met.
+        """
+        cars = self.cars
+        if len(cars) < 2:
+            return
+
+        xs = [car["x"] for car in cars]
+        ys = [car["y"] for car in cars]
+        travel = [abs(car["x"] - car["prev_x"]) + abs(car["y"] - car["prev_y"]) for car in cars]
+        fastest = max(travel)
+        # A fast mover widens the broadphase by how far two cars could have closed this step.
+        cell = COLLISION_DIST if fastest <= SAFE_TRAVEL else COLLISION_DIST + 2.0 * fastest
+        met = {}  # car -> earliest fraction of its move at which it met another
+        shift_x = {}
+        shift_y = {}
+        hit = []
+        for a, b in collision_pairs(xs, ys, cell):
+            car_a = cars[a]
+            car_b = cars[b]
+            if self._on_different_levels(car_a, car_b):
+                continue
+            if travel[a] > SAFE_TRAVEL or travel[b] > SAFE_TRAVEL:
+                contact = self._sweep(car_a, car_b)
+                if contact is None:
+                    continue
+                t, dx, dy = contact
+                if t < 1.0:
+                    met[a] = min(t, met.get(a, 1.0))
+                    met[b] = min(t, met.get(b, 1.0))
+            else:
+                t = 1.0
+                dx = xs[b] - xs[a]
+                dy = ys[b] - ys[a]
+            dist = math.sqrt(dx * dx + dy * dy)
+            if dist == 0.0 or (t == 1.0 and dist >= COLLISION_DIST):
+                continue
+            overlap = max(0.0, COLLISION_DIST - dist)
+            push_x = dx / dist * overlap * 0.5
+            push_y = dy / dist * overlap * 0.5
+            shift_x[a] = shift_x.get(a, 0.0) - push_x
+            shift_y[a] = shift_y.get(a, 0.0) - push_y
+            shift_x[b] = shift_x.get(b, 0.0) + push_x
+            shift_y[b] = shift_y.get(b, 0.0) + push_y
+            hit.append(a)
+            hit.append(b)
+
+        for idx, t in met.items():
+            car = cars[idx]
+            car["x"] = car["prev_x"] + (car["x"] - car["prev_x"]) * t
+            car["y"] = car["prev_y"] + (car["y"] - car["prev_y"]) * t
+        if not hit:
+            return
+        damping = self.params["collision_damping"]
+        tick = self.ticks
+        for idx in hit:
+            cars[idx]["vel"] *= -damping  # once per pair the car was in
+        for idx in shift_x:
+            car = cars[idx]
+            car["x"] += shift_x[idx]
+            car["y"] += shift_y[idx]
+            self._clamp_to_track(car)
+            if car["contact_tick"] < tick - 1:
+                car["collisions"] += 1
+            car["contact_tick"] = tick
+
+    def _on_different_levels(self, car_a, car_b) -> bool:
+        """True when one car is on the bridge and the other underneath it."""
+        return (car_a["on_overpass"] != car_b["on_overpass"] and self._in_crossing_zone(car_a["x"], car_a["y"])
+                and self._in_crossing_zone(car_b["x"], car_b["y"]))
+
+    @staticmethod
+    def _sweep(car_a, car_b):
+        """Continuous test of two cars' straight-line moves over the last step.
+
+        Returns (t, dx, dy): the first fraction of the step at which they
+        touched, or 1.0 if they were moving apart and only the end positions
+        count, and b's offset from a at that moment. None if they never met.
+        """
+        # b's start and motion relative to a, so a sits still at the origin.
+        px = car_b["prev_x"] - car_a["prev_x"]
+        py = car_b["prev_y"] - car_a["prev_y"]
+        vx = (car_b["x"] - car_b["prev_x"]) - (car_a["x"] - car_a["prev_x"])
+        vy = (car_b["y"] - car_b["prev_y"]) - (car_a["y"] - car_a["prev_y"])
+        closing = px * vx + py * vy
+        if closing >= 0.0:
+            return 1.0, car_b["x"] - car_a["x"], car_b["y"] - car_a["y"]
+
+        # First t in [0, 1] with |p + v t| == COLLISION_DIST, or 0 if touching already.
+        t = 0.0
+        gap = px * px + py * py - COLLISION_DIST * COLLISION_DIST
+        if gap > 0.0:
+            vv = vx * vx + vy * vy
+            disc = closing * closing - vv * gap
+            if disc < 0.0:
+                return None  # the paths never come within touching distance
+            t = (-closing - math.sqrt(disc)) / vv
+            if t >= 1.0:
+                return None
+        return t, px + vx * t, py + vy * t
+
+    def _is_off_track(self, car) -> bool:
+        return not self._is_on_track(car["x"], car["y"])
+
+    def _is_on_track(self, x: float, y: float) -> bool:
+        """Check if point is on the track"""
+        return self.track_field.is_on_track(x, y)
+
+    def _hit_barriers(self, car) -> None:
+        """Push the car off any barrier it is touching, losing the speed it hit with.
+
+        Driving straight into a wall stops the car dead; scraping along one
+        costs little.
+        """
+        x = car["x"]
+        y = car["y"]
+        if self.track_field.distance(x, y) < self.barrier_clear and not self._in_crossing_zone(x, y):
+            return
+        pushed = self.barriers.push_out(x, y, BARRIER_RADIUS, car["on_overpass"])
+        if pushed is None:
+            return
+        car["x"], car["y"], car["vel"] = barrier_response(x, y, car["angle"], car["vel"], *pushed)
+
+    def _clamp_to_track(self, car) -> None:
+        # Keep the car inside the world; off-track is handled by friction.
+        outer_min_x = CAR_WIDTH
+        outer_min_y = CAR_WIDTH
+        outer_max_x = self.world_w - CAR_WIDTH
+        outer_max_y = self.world_h - CAR_WIDTH
+
+        car["x"] = max(outer_min_x, min(outer_max_x, car["x"]))
+        car["y"] = max(outer_min_y, min(outer_max_y, car["y"]))
@@ -0,0 +1,230 @@
+"""Per-tick car telemetry streamed into a memory-mapped ring buffer.
+
+The writer preallocates the whole file up front and maps it, so recording a
+tick is a handful of stores into the page cache: nothing is allocated and
+nothing waits on the disk. The file is columnar, one fixed-size column per
+field, each holding `capacity` ticks of `num_cars` values, tick-major:
+
+    header (64 bytes) | time[capacity] | x[capacity][cars] | y[...] | ...
+
+The header carries the number of ticks written so far, stored after the tick
+itself, so another process can map the same file read-only and tail it live:
+
+    python3 telemetry.py race.tlm            # follow speeds as they arrive
+
+`TelemetryReader.column()` returns memoryviews straight onto the mapping (and
+NumPy can wrap those with `np.asarray` without copying).
+"""
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+
+from simulation import PHYSICS_HZ
+
+
+TELEMETRY_MAGIC = b"VRTL"
+TELEMETRY_VERSION = 1
+DEFAULT_SECONDS = 120  # of racing kept before the ring wraps
+HEADER_SIZE = 64
+# magic, version, cars, physics Hz, capacity in ticks; the tick count follows at COUNT_OFFSET
+_HEADER = struct.Struct("<4sHHHxxI")
+COUNT_OFFSET = 16
+
+# (name, array typecode); "time" has one value per tick, the rest one per car.
+COLUMNS = (
+    ("time", "d"),
+    ("x", "f"),
+    ("y", "f"),
+    ("angle", "f"),
+    ("vel", "f"),
+    ("last_lap", "f"),  # NaN until the first lap is completed
+    ("laps", "H"),
+    ("on_overpass", "B"),
+    ("off_track", "B"),
+)
+
+
+def column_layout(num_cars: int, capacity: int):
+    """Return ({name: (offset, typecode, values per tick)}, file size)."""
+    layout = {}
+    offset = HEADER_SIZE
+    for name, code in COLUMNS:
+        width = 1 if name == "time" else num_cars
+        layout[name] = (offset, code, width)
+        offset += struct.calcsize(code) * width * capacity
+        offset = (offset + 7) & ~7  # keep every column 8-byte aligned
+    return layout, offset
+
+
+class _TelemetryFile:
+    def _map_columns(self) -> None:
+        self.layout, self.size = column_layout(self.num_cars, self.capacity)
+        view = memoryview(self.map)
+        self._count = view[COUNT_OFFSET:COUNT_OFFSET + 8].cast("Q")
+        self.columns = {}
+        for name, (offset, code, width) in self.layout.items():
+            length = struct.calcsize(code) * width * self.capacity
+            self.columns[name] = view[offset:offset + length].cast(code)
+
+    @property
+    def count(self) -> int:
+        """Ticks written since the file was created (not capped at capacity)."""
+        return self._count[0]
+
+    def close(self) -> None:
+        self._count.release()
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.map.close()
+
+
+class TelemetryWriter(_TelemetryFile):
+    def __init__(self, path: str, num_cars: int, capacity: int = PHYSICS_HZ * DEFAULT_SECONDS) -> None:
+        self.path = path
+        self.num_cars = num_cars
+        self.capacity = capacity
+        _, size = column_layout(num_cars, capacity)
+        with open(path, "wb") as fh:
+            fh.truncate(size)
+        with open(path, "r+b") as fh:
+            if hasattr(os, "posix_fallocate"):
+                # Reserve the blocks now rather than on first touch mid-race.
+                os.posix_fallocate(fh.fileno(), 0, size)
+            self.map = mmap.mmap(fh.fileno(), size)
+        if hasattr(mmap, "MADV_WILLNEED"):
+            self.map.madvise(mmap.MADV_WILLNEED)
+        _HEADER.pack_into(self.map, 0, TELEMETRY_MAGIC, TELEMETRY_VERSION, num_cars, PHYSICS_HZ, capacity)
+        self._map_columns()
+        self._np_columns = None
+
+    def record(self, sim) -> None:
+        """Append the current state of every car as one tick."""
+        tick = self._count[0]
+        slot = tick % self.capacity
+        columns = self.columns
+        columns["time"][slot] = sim.time
+        xs = columns["x"]
+        ys = columns["y"]
+        angles = columns["angle"]
+        vels = columns["vel"]
+        last_laps = columns["last_lap"]
+        laps = columns["laps"]
+        overpass = columns["on_overpass"]
+        off_track = columns["off_track"]
+        cars = sim.cars
+        base = slot * self.num_cars
+        for i in range(self.num_cars):
+            car = cars[i]
+            at = base + i
+            xs[at] = car["x"]
+            ys[at] = car["y"]
+            angles[at] = car["angle"]
+            vels[at] = car["vel"]
+            last_lap = car["last_lap_duration"]
+            last_laps[at] = math.nan if last_lap is None else last_lap
+            laps[at] = car["laps"]
+            overpass[at] = car["on_overpass"]
+            off_track[at] = car["off_track"]
+        # Publish only once the tick is complete.
+        self._count[0] = tick + 1
+
+    def record_arrays(self, sim) -> None:
+        """`record()` for an ArraySimulation, copying straight from its arrays."""
+        import numpy as np
+
+        if self._np_columns is None:
+            self._np_columns = {
+                name: np.asarray(column).reshape(self.capacity, -1) for name, column in self.columns.items()
+            }
+        tick = self._count[0]
+        slot = tick % self.capacity
+        columns = self._np_columns
+        columns["time"][slot] = sim.time
+        for name, values in (("x", sim.x), ("y", sim.y), ("angle", sim.angle), ("vel", sim.vel),
+                             ("last_lap", sim.last_lap_duration), ("laps", sim.laps),
+                             ("on_overpass", sim.on_overpass), ("off_track", sim.off_track)):
+            columns[name][slot] = values[:self.num_cars]
+        self._count[0] = tick + 1
+
+    def close(self) -> None:
+        self._np_columns = None
+        self.map.flush()
+        super().close()
+
+
+class TelemetryReader(_TelemetryFile):
+    """Read-only view of a telemetry file, safe to use while it is being written."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as fh:
+            self.map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_cars, physics_hz, capacity = _HEADER.unpack_from(self.map, 0)
+        if magic != TELEMETRY_MAGIC or version != TELEMETRY_VERSION:
+            self.map.close()
+            raise ValueError(f"unsupported telemetry file: {path}")
+        self.num_cars = num_cars
+        self.physics_hz = physics_hz
+        self.capacity = capacity
+        self._map_columns()
+
+    def available(self):
+        """range() of the ticks still held in the ring."""
+        count = self.count
+        return range(max(0, count - self.capacity), count)
+
+    def column(self, name: str) -> memoryview:
+        """The whole column as a (capacity, values per tick) view onto the file.
+
+        Rows are ring slots: tick `t` lives in row `t % capacity`.
+        """
+        _, _, width = self.layout[name]
+        return self.columns[name].cast("B").cast(self.columns[name].format, (self.capacity, width))
+
+    def value(self, name: str, tick: int, car: int = 0):
+        """One value for `tick`, or None if the writer has already overwritten it."""
+        _, _, width = self.layout[name]
+        value = self.columns[name][(tick % self.capacity) * width + car]
+        if self.count - tick > self.capacity:
+            return None
+        return value
+
+
+def follow(path: str, interval: float = 0.25) -> None:
+    """Print each car's speed as the telemetry file grows, until interrupted."""
+    reader = TelemetryReader(path)
+    shown = reader.count
+    try:
+        while True:
+            ticks = reader.available()
+            if ticks and ticks[-1] >= shown:
+                tick = ticks[-1]
+                speeds = [reader.value("vel", tick, car) for car in range(reader.num_cars)]
+                if None not in speeds:
+                    elapsed = reader.value("time", tick)
+                    print(f"tick {tick:>8} t={elapsed:8.2f}s  " + "  ".join(f"{speed:7.1f}" for speed in speeds))
+                shown = tick + 1
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Tail a telemetry file written by main.py --telemetry")
+    parser.add_argument("path")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between updates")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.path):
+        parser.error(f"no such file: {args.path}")
+    follow(args.path, args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import batch
+from ai import AIDriver
+from simulation import INPUT_LEFT, INPUT_UP
+
+
+class VeerAfterFinish(AIDriver):
+    """Races like the AI, then steers off the track once a lap is done."""
+
+    def update(self, sim, inputs) -> None:
+        super().update(sim, inputs)
+        for idx, car in enumerate(sim.cars):
+            if car["laps"] >= 1:
+                inputs[idx] = INPUT_UP | INPUT_LEFT
+
+
+def test_finished_cars_stop_counting(monkeypatch):
+    monkeypatch.setattr(batch, "AIDriver", VeerAfterFinish)
+    batch._track = None
+    batch._init_worker({"cars": 3, "laps": 1, "time_limit": 60.0, "track": "figure8"})
+    result = batch.run_race((0, {}, 0))
+    assert all(car["finished"] and len(car["lap_times"]) == 1 for car in result["cars"])
+    assert all(car["off_track_time"] == 0.0 and car["collisions"] == 0 for car in result["cars"])
+
+    batch._init_worker({"cars": 3, "laps": 2, "time_limit": 60.0, "track": "figure8"})
+    result = batch.run_race((0, {}, 0))
+    assert not any(car["finished"] for car in result["cars"])
+    assert all(car["off_track_time"] > 0.0 for car in result["cars"])
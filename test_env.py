@@ -0,0 +1,32 @@
+import random
+
+import pytest
+
+from simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_UP, PHYSICS_DT, SAFE_TRAVEL, load_track
+
+np = pytest.importorskip("numpy")
+from env import RaceEnv  # noqa: E402
+from vectorized import ArraySimulation  # noqa: E402
+
+
+@pytest.mark.parametrize("params", [None, {"car_speed": 6000.0}], ids=["normal", "fast"])
+def test_each_race_drives_like_a_one_car_simulation(params):
+    track = load_track("figure8")
+    num_envs = 6
+    env = RaceEnv(num_envs, track, params=params, laps=100, max_steps=10 ** 6, action_repeat=1)
+    env.reset()
+    sims = [ArraySimulation(1, track, params=params) for _ in range(num_envs)]
+    for sim in sims:
+        sim.skip_countdown()
+    rng = random.Random(0)
+    substepped = False
+    for _ in range(1500):
+        actions = [INPUT_UP | rng.choice((0, 0, 0, INPUT_LEFT, INPUT_RIGHT)) for _ in range(num_envs)]
+        substepped = substepped or bool((np.abs(env.vel) * PHYSICS_DT > SAFE_TRAVEL).any())
+        env.step(np.array(actions))
+        for idx, sim in enumerate(sims):
+            sim.step(PHYSICS_DT, actions[idx:idx + 1])
+            assert (env.x[idx], env.y[idx], env.angle[idx], env.vel[idx]) == (
+                sim.x[0], sim.y[0], sim.angle[0], sim.vel[0])
+            assert env.off_track[idx] == sim.off_track[0]
+    assert substepped == (params is not None)
@@ -0,0 +1,42 @@
+import pytest
+
+from simulation import HOLD_STEPS, INPUT_LEFT, INPUT_UP, PHYSICS_DT, Simulation
+
+pytest.importorskip("tkinter")
+from game import InputQueue  # noqa: E402
+
+
+def queue() -> InputQueue:
+    return InputQueue(Simulation(2).cars)
+
+
+def test_a_press_part_way_through_a_step_counts_for_its_share():
+    inputs = queue()
+    inputs.press("w", PHYSICS_DT / 4)
+    assert inputs.take(0.0, PHYSICS_DT) == ([INPUT_UP, 0], {0: (HOLD_STEPS * 3 // 4, 0)})
+    assert inputs.take(PHYSICS_DT, 2 * PHYSICS_DT) == ([INPUT_UP, 0], None)
+
+
+def test_a_short_release_keeps_the_rest_of_the_step():
+    inputs = queue()
+    inputs.press("a", 0.0)
+    inputs.take(0.0, PHYSICS_DT)
+    inputs.release("a", PHYSICS_DT * 1.125)
+    inputs.press("a", PHYSICS_DT * 1.375)
+    assert inputs.take(PHYSICS_DT, 2 * PHYSICS_DT) == ([INPUT_LEFT, 0], {0: (0, -HOLD_STEPS * 3 // 4)})
+
+
+def test_a_tap_inside_one_step_still_moves_the_car():
+    inputs = queue()
+    inputs.press("w", PHYSICS_DT * 0.5)
+    inputs.release("w", PHYSICS_DT * 0.501)
+    bits, partial = inputs.take(0.0, PHYSICS_DT)
+    assert bits == [INPUT_UP, 0]
+    assert partial == {0: (1, 0)}
+
+
+def test_whole_step_presses_need_no_partial_holds():
+    inputs = queue()
+    inputs.press("w", 0.0)
+    inputs.press("left", 0.0)
+    assert inputs.take(0.0, PHYSICS_DT) == ([INPUT_UP, INPUT_LEFT], None)
@@ -0,0 +1,140 @@
+import asyncio
+import random
+
+import pytest
+
+from ai import AIDriver
+from netplay import (
+    _FRAME, FIELD_COUNT, INTERP_DELAY, NO_BASE, RaceClient, RaceServer, decode_snapshot, encode_snapshot,
+    quantize,
+)
+from simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_UP, PHYSICS_DT, PHYSICS_HZ, Simulation, load_track
+from track import track_path
+
+
+def race(ticks: int, num_cars: int = 4, seed: int = 0) -> Simulation:
+    sim = Simulation(num_cars, seed=seed)
+    sim.skip_countdown()
+    rng = random.Random(seed)
+    for _ in range(ticks):
+        sim.step(PHYSICS_DT, [INPUT_UP | rng.choice((0, INPUT_LEFT, INPUT_RIGHT)) for _ in sim.cars])
+    return sim
+
+
+def payload(frame: bytes) -> bytes:
+    (length,) = _FRAME.unpack_from(frame)
+    assert length == len(frame) - _FRAME.size
+    return frame[_FRAME.size:]
+
+
+def test_full_and_delta_snapshots_decode_to_the_same_state():
+    sim = race(120)
+    base = quantize(sim.cars)
+    full = encode_snapshot(120, NO_BASE, sim.time, sim.countdown_start, sim.race_active, base,
+                           [0] * len(base))
+    tick, race_time, countdown_start, race_active, state = decode_snapshot(payload(full), {})
+    assert (tick, race_time, countdown_start, race_active, state) == (
+        120, sim.time, sim.countdown_start, True, base)
+
+    for _ in range(4):
+        sim.step(PHYSICS_DT, [INPUT_UP] * len(sim.cars))
+    moved = quantize(sim.cars)
+    delta = encode_snapshot(124, 120, sim.time, sim.countdown_start, sim.race_active, moved, base)
+    assert len(delta) < len(full)
+    assert decode_snapshot(payload(delta), {120: base})[4] == moved
+
+
+def test_unchanged_cars_cost_one_byte_each():
+    state = quantize(race(60).cars)
+    frame = encode_snapshot(60, 0, 0.5, 0.0, True, state, state)
+    assert len(payload(frame)) == len(payload(encode_snapshot(60, 0, 0.5, 0.0, True, [], []))) + 4
+
+
+def test_large_and_negative_differences_round_trip():
+    base = [0] * FIELD_COUNT
+    state = ([1 << 40, -(1 << 40), 1, -1, 0, 63, -64, 64, -65] * 2)[:FIELD_COUNT]
+    frame = encode_snapshot(1, 0, 0.0, 0.0, False, state, base)
+    assert decode_snapshot(payload(frame), {0: base})[4] == state
+
+
+def test_client_mirrors_laps_and_sectors():
+    sim = Simulation(3)
+    sim.skip_countdown()
+    driver = AIDriver(sim)
+    inputs = [0] * 3
+    for _ in range(25 * PHYSICS_HZ):
+        driver.update(sim, inputs)
+        sim.step(PHYSICS_DT, inputs)
+    assert min(car["last_sector"] for car in sim.cars) >= 0
+
+    client = RaceClient()
+    client.snapshots = [(sim.time, sim.countdown_start, sim.race_active, quantize(sim.cars))]
+    client.clock_offset = sim.time + INTERP_DELAY
+    mirror = Simulation(3)
+    client.apply(mirror, now=0.0)
+    for car, shown in zip(sim.cars, mirror.cars):
+        assert shown["laps"] == car["laps"]
+        assert shown["last_sector"] == car["last_sector"]
+        assert shown["last_sector_duration"] == pytest.approx(car["last_sector_duration"], abs=0.001)
+        assert shown["x"] == pytest.approx(car["x"], abs=1 / 64)
+
+
+@pytest.mark.parametrize("damage", ["unknown base", "truncated", "wrong type", "short header"])
+def test_malformed_snapshots_raise_value_error(damage):
+    state = quantize(race(30).cars)
+    good = payload(encode_snapshot(30, 0, 0.25, 0.0, True, state, [0] * len(state)))
+    bases = {0: [0] * len(state)}
+    if damage == "unknown base":
+        bases = {}
+    elif damage == "truncated":
+        good = good[:-1]
+    elif damage == "wrong type":
+        good = bytes([1]) + good[1:]
+    else:
+        good = good[:5]
+    with pytest.raises(ValueError):
+        decode_snapshot(good, bases)
+
+
+def test_client_drops_a_bad_snapshot_and_keeps_receiving():
+    async def run():
+        server = RaceServer(Simulation(2), player_slots=1)
+        await server.start("127.0.0.1", 0)
+        client = RaceClient()
+        try:
+            await client.connect("127.0.0.1", server.port)
+            server.sim.skip_countdown()
+            garbage = b"\x02\x00"
+            server.players[0].writer.write(_FRAME.pack(len(garbage)) + garbage)
+            await server.run(0.25)
+            return client.dropped, len(client.snapshots), client.task.done()
+        finally:
+            await client.close()
+            await server.close()
+
+    dropped, snapshots, stopped = asyncio.run(run())
+    assert dropped == 1
+    assert snapshots > 0
+    assert not stopped
+
+
+def test_clients_get_the_server_track_by_name_or_as_a_file(tmp_path):
+    own = tmp_path / "own.json"
+    own.write_bytes(open(track_path("figure8"), "rb").read().replace(b"Figure Eight", b"Our Eight"))
+
+    async def run(ref):
+        server = RaceServer(Simulation(2, track=load_track(ref)), player_slots=1)
+        await server.start("127.0.0.1", 0)
+        client = RaceClient()
+        try:
+            await client.connect("127.0.0.1", server.port)
+            return client.track, client.load_track()
+        finally:
+            await client.close()
+            await server.close()
+
+    assert asyncio.run(run(track_path("figure8"))) == ("figure8", load_track("figure8"))
+    name, track = asyncio.run(run(str(own)))
+    assert name is None
+    assert track.name == "Our Eight"
+    assert list(track.line.xs) == list(load_track("figure8").line.xs)
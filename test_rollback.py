@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from ai import AIDriver
+from rollback import SnapshotRing
+from simulation import HOLD_STEPS, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, PHYSICS_DT, PHYSICS_HZ, Simulation
+
+
+def race_state(sim: Simulation):
+    """Everything a step carries forward, with NaN made comparable."""
+    cars = [{key: "nan" if value != value else value for key, value in car.items()} for car in sim.cars]
+    return (sim.ticks, sim.time, sim.countdown_start, sim.race_active, list(sim.checkpoint_times),
+            list(sim.best_sectors), list(sim.order), cars)
+
+
+def driven_inputs(seed: int, num_cars: int, ticks: int):
+    rng = random.Random(seed)
+    return [[INPUT_UP | rng.choice((0, 0, INPUT_LEFT, INPUT_RIGHT)) for _ in range(num_cars)]
+            for _ in range(ticks)]
+
+
+def ai_race(num_cars: int, ticks: int):
+    """A Simulation and its AI's inputs for `ticks` steps; AI cars complete sectors quickly."""
+    sim = Simulation(num_cars, seed=5)
+    sim.skip_countdown()
+    driver = AIDriver(sim)
+    history = []
+    for _ in range(ticks):
+        inputs = [0] * num_cars
+        driver.update(sim, inputs)
+        history.append(inputs)
+        sim.step(PHYSICS_DT, inputs)
+    return history
+
+
+def test_restore_puts_back_every_field():
+    sim = Simulation(4, seed=2)
+    sim.skip_countdown()
+    driver = AIDriver(sim)
+    ring = SnapshotRing(sim)
+    states = {}
+    for tick in range(20 * PHYSICS_HZ):
+        inputs = [0] * len(sim.cars)
+        driver.update(sim, inputs)
+        if tick % 97 == 0:
+            states[sim.ticks] = race_state(sim)
+        ring.save(sim, inputs)
+        sim.step(PHYSICS_DT, inputs)
+    assert any(sector < float("inf") for sector in sim.best_sectors)
+    restored = 0
+    for tick in sorted(states, reverse=True):
+        if tick < ring.oldest():
+            break
+        ring.restore(sim, tick)
+        assert race_state(sim) == states[tick]
+        restored += 1
+    assert restored >= 3
+
+
+def test_restore_refuses_ticks_it_no_longer_has():
+    sim = Simulation(2)
+    ring = SnapshotRing(sim, capacity=8)
+    for row in driven_inputs(0, 2, 20):
+        ring.save(sim, row)
+        sim.step(PHYSICS_DT, row)
+    assert ring.oldest() == 12
+    with pytest.raises(KeyError):
+        ring.restore(sim, 11)
+    ring.restore(sim, 15)
+    with pytest.raises(KeyError):
+        ring.restore(sim, 16)  # dropped by the restore
+
+
+def test_correct_matches_a_race_that_had_the_input_on_time():
+    num_cars = 3
+    inputs = ai_race(num_cars, 20 * PHYSICS_HZ)
+    late_tick = len(inputs) - PHYSICS_HZ
+    late_bits = INPUT_UP | INPUT_LEFT
+
+    sim = Simulation(num_cars, seed=5)
+    sim.skip_countdown()
+    ring = SnapshotRing(sim)
+    on_time = Simulation(num_cars, seed=5)
+    on_time.skip_countdown()
+    for tick, row in enumerate(inputs):
+        # Keys held for part of a step are replayed too, except the corrected car's.
+        partial = {0: (HOLD_STEPS // 2, 0), 1: (HOLD_STEPS, 3)} if tick % 10 == 0 else None
+        ring.save(sim, row, partial)
+        sim.step(PHYSICS_DT, row, partial)
+        if tick >= late_tick:
+            row = list(row)
+            row[1] = late_bits
+            if partial is not None:
+                del partial[1]
+        on_time.step(PHYSICS_DT, row, partial)
+    assert race_state(sim) != race_state(on_time)
+
+    ring.correct(sim, late_tick, 1, late_bits)
+    assert race_state(sim) == race_state(on_time)
+
+
+def test_restoring_the_oldest_snapshot_twice_in_a_row():
+    sim = Simulation(2)
+    ring = SnapshotRing(sim, capacity=8)
+    for row in driven_inputs(0, 2, 20):
+        ring.save(sim, row)
+        sim.step(PHYSICS_DT, row)
+    ring.restore(sim, ring.oldest())
+    assert sim.ticks == 12
+    assert ring.oldest() == -1  # nothing older is left to go back to
+    ring.save(sim, [0, 0])
+    sim.step(PHYSICS_DT, [0, 0])
+    assert ring.oldest() == 12
@@ -0,0 +1,37 @@
+import pytest
+
+from season import SeasonWriter, open_db, personal_bests, run_round
+from simulation import load_track
+from track import track_path
+
+
+def test_tracks_are_keyed_the_same_by_name_or_path(tmp_path):
+    db = str(tmp_path / "season.db")
+    writer = SeasonWriter(db)
+    laps = 0
+    for seed, ref in enumerate(("figure8", track_path("figure8"))):
+        race = run_round(load_track(ref), 2, 1, seed)
+        laps += len(race["lap_times"])
+        writer.submit(race)
+    writer.close()
+
+    conn = open_db(db)
+    name = load_track("figure8").name
+    assert conn.execute("SELECT DISTINCT track FROM races").fetchall() == [(name,)]
+    assert sum(count for _, _, count in personal_bests(conn, name)) == laps
+    conn.close()
+
+
+def test_a_race_that_fails_to_write_is_reported_by_close(tmp_path):
+    db = str(tmp_path / "season.db")
+    writer = SeasonWriter(db)
+    good = run_round(load_track("figure8"), 2, 1, 0)
+    writer.submit({"track": "broken"})
+    writer.submit(good)
+    with pytest.raises(KeyError):
+        writer.close()
+    assert writer.failed == 1
+
+    conn = open_db(db)
+    assert conn.execute("SELECT COUNT(*) FROM races").fetchone() == (1,)
+    conn.close()
@@ -0,0 +1,55 @@
+import json
+import math
+import random
+
+import pytest
+
+from simulation import load_track
+from track import FIELD_CELL, catmull_rom, track_path
+
+# Samples of the spline for the brute-force reference, and how far the baked
+# field may stray from it within EDGE_BAND of the road edge, in pixels. The
+# worst case is the inside of the tightest bends, where bilinear
+# interpolation rounds off the crease in the distance.
+REFERENCE_SAMPLES = 16384
+EDGE_BAND = 15.0
+TOLERANCE = FIELD_CELL / 4
+
+
+def reference_distance(points, x: float, y: float) -> float:
+    """Distance from (x, y) to the densely sampled centreline."""
+    return math.sqrt(min((px - x) ** 2 + (py - y) ** 2 for px, py in points))
+
+
+@pytest.mark.parametrize("name", ["figure8", "grand_loop"])
+def test_field_matches_sampled_centreline_near_the_edge(name):
+    track = load_track(name)
+    with open(track_path(name)) as fh:
+        controls = [(float(x), float(y)) for x, y in json.load(fh)["points"]]
+    curve = catmull_rom(controls)
+    period = len(controls)
+    points = [curve(period * i / REFERENCE_SAMPLES)[:2] for i in range(REFERENCE_SAMPLES)]
+    half_width = track.width / 2
+    line = track.line
+    field = track.field
+
+    rng = random.Random(1)
+    for _ in range(300):
+        i = rng.randrange(line.count)
+        side = rng.choice((-1.0, 1.0))
+        offset = half_width + rng.uniform(-EDGE_BAND, EDGE_BAND)
+        heading = line.headings[i]
+        x = line.xs[i] - math.sin(heading) * offset * side
+        y = line.ys[i] + math.cos(heading) * offset * side
+        expected = reference_distance(points, x, y) - half_width
+        if abs(expected) > EDGE_BAND:
+            continue  # near the other branch at the crossing
+        assert abs(field.distance(x, y) - expected) <= TOLERANCE, (x, y)
+        if abs(expected) > TOLERANCE:
+            assert field.is_on_track(x, y) == (expected <= 0.0), (x, y)
+
+
+def test_field_reads_far_off_the_grid():
+    field = load_track("figure8").field
+    assert field.distance(-10.0, 50.0) == field.far
+    assert not field.is_on_track(1e6, 1e6)
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from ai import AIDriver
+from simulation import (
+    HOLD_STEPS, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, PHYSICS_DT, PHYSICS_HZ, Simulation, collision_pairs,
+    load_track,
+)
+
+np = pytest.importorskip("numpy")
+from vectorized import ALL_PAIRS_UP_TO, ArraySimulation, collision_candidates  # noqa: E402
+
+# Every per-car field both paths keep; they must agree exactly, not approximately.
+FIELDS = ("x", "y", "angle", "vel", "laps", "last_lap_duration", "next_line", "timed_lap", "last_sector",
+          "last_sector_duration", "on_overpass", "off_track", "off_track_time", "collisions", "station",
+          "stations", "progress", "checkpoint", "gap")
+
+
+def race_both(num_cars: int, ticks: int, track: str = "figure8", params: dict = None):
+    track = load_track(track)
+    dict_sim = Simulation(num_cars, track, params=params)
+    array_sim = ArraySimulation(num_cars, track, params=params)
+    dict_sim.skip_countdown()
+    array_sim.skip_countdown()
+    rng = random.Random(num_cars)
+    for _ in range(ticks):
+        inputs = [INPUT_UP | rng.choice((0, INPUT_LEFT, INPUT_RIGHT)) for _ in range(num_cars)]
+        # Now and then a car holds its controls for only part of the step.
+        partial = {idx: (rng.randint(0, HOLD_STEPS), rng.randint(-HOLD_STEPS, HOLD_STEPS))
+                   for idx in range(num_cars) if rng.random() < 0.1}
+        dict_sim.step(PHYSICS_DT, inputs, partial)
+        array_sim.step(PHYSICS_DT, inputs, partial)
+    array_sim.sync_cars()
+    return dict_sim, array_sim
+
+
+@pytest.mark.parametrize("num_cars", [2, 12, ALL_PAIRS_UP_TO + 8])
+@pytest.mark.parametrize("params", [None, {"car_speed": 3000.0}], ids=["normal", "fast"])
+def test_array_path_matches_dict_path(num_cars, params):
+    dict_sim, array_sim = race_both(num_cars, 1200, params=params)
+    if num_cars > 2:
+        assert sum(car["collisions"] for car in dict_sim.cars) > 0  # the narrow phase had work
+    for dict_car, array_car in zip(dict_sim.cars, array_sim.cars):
+        for field in FIELDS:
+            assert dict_car[field] == array_car[field], field
+    assert dict_sim.standings() == array_sim.standings()
+    assert list(dict_sim.best_sectors) == array_sim.best_sectors.tolist()
+
+
+def test_array_path_matches_dict_path_on_a_scrolling_track():
+    dict_sim, array_sim = race_both(6, 1200, track="grand_loop")
+    for dict_car, array_car in zip(dict_sim.cars, array_sim.cars):
+        for field in FIELDS:
+            assert dict_car[field] == array_car[field], field
+
+
+def test_array_path_walks_the_same_stations_every_tick():
+    # A station off by one for a tick can move a checkpoint, and with it every later gap.
+    track = load_track("figure8")
+    params = {"car_speed": 3000.0}
+    dict_sim = Simulation(40, track, params=params)
+    array_sim = ArraySimulation(40, track, params=params)
+    dict_sim.skip_countdown()
+    array_sim.skip_countdown()
+    rng = random.Random(0)
+    for _ in range(400):
+        inputs = [INPUT_UP | rng.choice((0, INPUT_LEFT, INPUT_RIGHT)) for _ in range(40)]
+        dict_sim.step(PHYSICS_DT, inputs)
+        array_sim.step(PHYSICS_DT, inputs)
+        assert [car["station"] for car in dict_sim.cars] == array_sim.station.tolist()
+
+
+def test_array_path_times_laps_like_dict_path():
+    # Random inputs rarely get round; the AI driving the dict race completes laps and sectors.
+    track = load_track("figure8")
+    dict_sim = Simulation(6, track)
+    array_sim = ArraySimulation(6, track)
+    dict_sim.skip_countdown()
+    array_sim.skip_countdown()
+    driver = AIDriver(dict_sim)
+    inputs = [0] * 6
+    for _ in range(45 * PHYSICS_HZ):
+        driver.update(dict_sim, inputs)
+        dict_sim.step(PHYSICS_DT, inputs)
+        array_sim.step(PHYSICS_DT, inputs)
+    array_sim.sync_cars()
+    assert min(car["laps"] for car in dict_sim.cars) >= 1
+    for dict_car, array_car in zip(dict_sim.cars, array_sim.cars):
+        for field in FIELDS + ("last_lap_time",):
+            assert dict_car[field] == array_car[field], field
+    assert list(dict_sim.best_sectors) == array_sim.best_sectors.tolist()
+
+
+@pytest.mark.parametrize("reach", [21.0, 60.0])
+def test_collision_candidates_cover_every_close_pair(reach):
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(14.0, 300.0, 300)
+    ys = rng.uniform(14.0, 200.0, 300)
+    a, b = collision_candidates(xs, ys, reach)
+    pairs = list(zip(a.tolist(), b.tolist()))
+    assert pairs == sorted(set(pairs))
+    close = {(i, j) for i, j in collision_pairs(xs.tolist(), ys.tolist(), reach)
+             if (xs[i] - xs[j]) ** 2 + (ys[i] - ys[j]) ** 2 <= reach * reach}
+    assert close <= set(pairs)
@@ -0,0 +1,729 @@
+import hashlib
+import json
+import math
+import os
+import struct
+from array import array
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+TRACKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracks")
+DEFAULT_TRACK = "figure8"
+FIELD_CELL = 6.0  # grid spacing of the baked distance field, in pixels
+TRACK_MAGIC = b"VRTK"
+TRACK_VERSION = 4
+_TRACK_HEADER = struct.Struct("<4sHI")  # magic, version, length of the JSON metadata that follows
+RENDER_STRIDE = 4  # stations between render polyline points; drawn with smooth=True
+BRIDGE_SHADOW = 6  # offset of the shadow a bridge casts on the road below, in pixels
+BARRIER_RUNOFF = 30.0  # grass between the road edge and the barrier, unless the track file sets "runoff"
+BARRIER_STRIDE = 2  # stations between barrier vertices
+BARRIER_TOLERANCE = 4.0  # how far a barrier vertex may stray into another stretch's runoff, in pixels
+BARRIER_CELL = 32.0  # grid spacing of the barrier lookup, in pixels
+BARRIER_REACH = 16.0  # largest radius that may be tested against the barriers
+DEFAULT_SECTORS = (1 / 3, 2 / 3)  # sector lines, as fractions of a lap past the finish
+TIMING_REACH = 160.0  # arc length either side of a timing line over which cars test it, in pixels
+
+# Which cars a barrier segment stops. Inside a crossing zone the two levels
+# overlap, so the bridge parapets only stop cars up on the bridge and the
+# walls of the road underneath only stop cars down there.
+BARRIER_ALL = 0
+BARRIER_OVER = 1
+BARRIER_UNDER = 2
+
+
+class TrackField:
+    """Signed distance to the track edge, baked onto a regular grid.
+
+    Each node stores (distance to the centreline - half track width), so
+    values are negative on the road and positive off it. Lookups are O(1)
+    with bilinear interpolation; anything further than `max_dist` from the
+    centreline, or outside the grid, reads as `max_dist - half_width`.
+    """
+
+    def __init__(self, cols: int, rows: int, cell: float, max_dist: float, half_width: float, values) -> None:
+        self.cols = cols
+        self.rows = rows
+        self.cell = cell
+        self.max_dist = max_dist
+        self.half_width = half_width
+        self.far = max_dist - half_width
+        self.values = values
+
+    @classmethod
+    def bake(cls, points, half_width: float, width: float, height: float,
+             cell: float = FIELD_CELL, max_dist: float = None) -> "TrackField":
+        """Bake the field from a flat list of centreline samples.
+
+        Samples should be no further apart than `cell`. Instead of testing
+        every node against every sample, each sample only updates the nodes
+        within `max_dist` of it.
+        """
+        if max_dist is None:
+            max_dist = half_width * 3
+        cols = int(math.ceil(width / cell)) + 1
+        rows = int(math.ceil(height / cell)) + 1
+        far2 = max_dist * max_dist
+        best = [far2] * (cols * rows)
+        reach = int(max_dist / cell) + 1
+
+        for k in range(0, len(points), 2):
+            px = points[k]
+            py = points[k + 1]
+            c_mid = int(px / cell)
+            r_mid = int(py / cell)
+            c0 = max(0, c_mid - reach)
+            c1 = min(cols - 1, c_mid + reach + 1)
+            r0 = max(0, r_mid - reach)
+            r1 = min(rows - 1, r_mid + reach + 1)
+            for r in range(r0, r1 + 1):
+                dy = r * cell - py
+                dy2 = dy * dy
+                if dy2 >= far2:
+                    continue
+                base = r * cols
+                for c in range(c0, c1 + 1):
+                    dx = c * cell - px
+                    d2 = dx * dx + dy2
+                    if d2 < best[base + c]:
+                        best[base + c] = d2
+
+        values = array("f", (math.sqrt(d2) - half_width for d2 in best))
+        return cls(cols, rows, cell, max_dist, half_width, values)
+
+    def distance(self, x: float, y: float) -> float:
+        """Signed distance from (x, y) to the nearest track edge."""
+        fx = x / self.cell
+        fy = y / self.cell
+        if fx < 0.0 or fy < 0.0:
+            return self.far
+        c = int(fx)
+        r = int(fy)
+        cols = self.cols
+        if c >= cols - 1 or r >= self.rows - 1:
+            return self.far
+        tx = fx - c
+        ty = fy - r
+        v = self.values
+        i = r * cols + c
+        top = v[i] + (v[i + 1] - v[i]) * tx
+        bottom = v[i + cols] + (v[i + cols + 1] - v[i + cols]) * tx
+        return top + (bottom - top) * ty
+
+    def is_on_track(self, x: float, y: float) -> bool:
+        return self.distance(x, y) <= 0.0
+
+
+class Barriers:
+    """The wall segments along both track edges, with a grid for finding nearby ones.
+
+    `segments` holds (x0, y0, x1, y1) per wall segment and `levels` one
+    BARRIER_* tag each. Every segment is listed in each grid cell that its
+    bounding box, grown by BARRIER_REACH, overlaps, stored flat: the segments
+    in cell `k` are `items[cells[k]:cells[k + 1]]`. A disc of up to that
+    radius only ever needs the segments in the one cell holding its centre,
+    a handful out of the whole outline.
+    """
+
+    def __init__(self, cols: int, rows: int, cell: float, segments, levels, cells, items) -> None:
+        self.cols = cols
+        self.rows = rows
+        self.cell = cell
+        self.segments = segments
+        self.levels = levels
+        self.cells = cells
+        self.items = items
+
+    @classmethod
+    def build(cls, segments, levels, width: float, height: float, cell: float = BARRIER_CELL) -> "Barriers":
+        cols = int(math.ceil(width / cell)) + 1
+        rows = int(math.ceil(height / cell)) + 1
+        buckets = [[] for _ in range(cols * rows)]
+        for i in range(len(levels)):
+            x0, y0, x1, y1 = segments[4 * i:4 * i + 4]
+            c0 = max(0, int((min(x0, x1) - BARRIER_REACH) // cell))
+            c1 = min(cols - 1, int((max(x0, x1) + BARRIER_REACH) // cell))
+            r0 = max(0, int((min(y0, y1) - BARRIER_REACH) // cell))
+            r1 = min(rows - 1, int((max(y0, y1) + BARRIER_REACH) // cell))
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    buckets[r * cols + c].append(i)
+        cells = array("I", [0])
+        items = array("I")
+        for bucket in buckets:
+            items.extend(bucket)
+            cells.append(len(items))
+        return cls(cols, rows, cell, segments, levels, cells, items)
+
+    def near(self, x: float, y: float):
+        """Indices of the segments that might be within BARRIER_REACH of (x, y)."""
+        c = int(x // self.cell)
+        r = int(y // self.cell)
+        if c < 0 or r < 0 or c >= self.cols or r >= self.rows:
+            return ()
+        k = r * self.cols + c
+        return self.items[self.cells[k]:self.cells[k + 1]]
+
+    def push_out(self, x: float, y: float, radius: float, on_overpass: bool):
+        """Move a disc at (x, y) clear of every wall on its level.
+
+        Returns the new (x, y), or None when nothing was touched.
+        """
+        skip = BARRIER_UNDER if on_overpass else BARRIER_OVER
+        segments = self.segments
+        levels = self.levels
+        r2 = radius * radius
+        moved = False
+        for i in self.near(x, y):
+            if levels[i] == skip:
+                continue
+            k = 4 * i
+            x0 = segments[k]
+            y0 = segments[k + 1]
+            dx = segments[k + 2] - x0
+            dy = segments[k + 3] - y0
+            t = ((x - x0) * dx + (y - y0) * dy) / (dx * dx + dy * dy)
+            t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+            ox = x - (x0 + dx * t)
+            oy = y - (y0 + dy * t)
+            d2 = ox * ox + oy * oy
+            if d2 >= r2 or d2 == 0.0:
+                continue
+            scale = radius / math.sqrt(d2)
+            x = x0 + dx * t + ox * scale
+            y = y0 + dy * t + oy * scale
+            moved = True
+        return (x, y) if moved else None
+
+
+LINE_SPACING = 4.0  # arc length between CentreLine stations, in pixels
+LINE_OVERSAMPLE = 16  # parameter samples per station when measuring arc length
+
+
+class CentreLine:
+    """A track's centreline resampled at even arc-length spacing.
+
+    Station `i` sits `i * spacing` pixels along the lap from its start, with its
+    heading and signed curvature precomputed, so "where along the lap is this
+    car" and "what does the road do next" are table lookups. Stations run in
+    the direction of travel and wrap at `count`.
+    """
+
+    def __init__(self, xs, ys, headings, curvatures, spacing: float) -> None:
+        self.xs = xs
+        self.ys = ys
+        self.headings = headings
+        self.curvatures = curvatures
+        self.count = len(xs)
+        self.spacing = spacing
+        self.length = spacing * self.count
+
+    @classmethod
+    def from_curve(cls, curve, period: float, spacing: float = LINE_SPACING):
+        """Resample a closed parametric curve; returns (line, parameter of each station).
+
+        `curve(t)` gives (x, y, dx/dt, dy/dt, d2x/dt2, d2y/dt2) for t in
+        [0, period), and the stations run in the direction of increasing t.
+        """
+        # Measure the lap finely in t, then walk it placing a station every `spacing` pixels.
+        rough = 0.0
+        px, py = curve(0.0)[:2]
+        for i in range(1, 257):
+            x, y = curve(period * i / 256 % period)[:2]
+            rough += math.hypot(x - px, y - py)
+            px, py = x, y
+        dense = int(rough / spacing + 1) * LINE_OVERSAMPLE
+        ts = [period * i / dense for i in range(dense + 1)]
+        lengths = [0.0]
+        px, py = curve(0.0)[:2]
+        for t in ts[1:]:
+            x, y = curve(t % period)[:2]
+            lengths.append(lengths[-1] + math.hypot(x - px, y - py))
+            px, py = x, y
+        count = int(round(lengths[-1] / spacing))
+        spacing = lengths[-1] / count
+
+        xs = array("d")
+        ys = array("d")
+        headings = array("d")
+        curvatures = array("d")
+        params = array("d")
+        k = 0
+        for i in range(count):
+            s = i * spacing
+            while lengths[k + 1] < s:
+                k += 1
+            t = ts[k] + (ts[k + 1] - ts[k]) * (s - lengths[k]) / (lengths[k + 1] - lengths[k])
+            x, y, dx, dy, ddx, ddy = curve(t)
+            xs.append(x)
+            ys.append(y)
+            headings.append(math.atan2(dy, dx))
+            curvatures.append((dx * ddy - dy * ddx) / (dx * dx + dy * dy) ** 1.5)
+            params.append(t)
+        return cls(xs, ys, headings, curvatures, spacing), params
+
+    def nearest(self, x: float, y: float, heading: float = None) -> int:
+        """Closest station by full search, for placing a car the first time.
+
+        With `heading`, stations facing more than 45 degrees away from it are
+        skipped, which picks the right branch at the crossing (the two
+        branches meet at nearly 80 degrees).
+        """
+        best = 0
+        best_dist = math.inf
+        for i in range(self.count):
+            if heading is not None and math.cos(self.headings[i] - heading) < math.sqrt(0.5):
+                continue
+            dist = (self.xs[i] - x) ** 2 + (self.ys[i] - y) ** 2
+            if dist < best_dist:
+                best = i
+                best_dist = dist
+        return best
+
+    def track(self, index: int, x: float, y: float) -> int:
+        """Closest station to (x, y), found by walking from a previous `index`.
+
+        A car moves at most a station or two per tick, so this costs a few
+        distance checks. Walking rather than searching also keeps a car on
+        its own branch as it passes through the crossing.
+        """
+        xs = self.xs
+        ys = self.ys
+        count = self.count
+        best = (xs[index] - x) ** 2 + (ys[index] - y) ** 2
+        for step in (1, -1):
+            while True:
+                i = (index + step) % count
+                dist = (xs[i] - x) ** 2 + (ys[i] - y) ** 2
+                if dist >= best:
+                    break
+                index = i
+                best = dist
+        return index
+
+
+class TimingLines:
+    """The finish and the sector lines after it, in lap order, for timing cars across them.
+
+    Line 0 is the finish, the vertical line through `finish` that cars cross
+    left to right; sector line `k` lies square to the centreline
+    `fractions[k - 1]` of a lap past it, crossed the way the lap runs. Each
+    reaches `half` pixels either side of the middle of the road.
+
+    Lines are kept in lap order with the station each sits on, so a car only
+    needs the line before and after it, and only tests them while its own
+    station is within TIMING_REACH of theirs. That also keeps the two
+    branches of a crossing from seeing each other's lines.
+    """
+
+    def __init__(self, line: CentreLine, finish, fractions, half: float) -> None:
+        count = line.count
+        finish_x, finish_y = finish
+        finish_station = line.nearest(finish_x, finish_y, 0.0)
+        self.half = half
+        self.window = int(TIMING_REACH / line.spacing)
+        self.laps = count  # stations per lap
+        self.stations = array("i", [finish_station])
+        self.positions = array("d", [0.0])  # stations past the finish
+        self.xs = array("d", [finish_x])
+        self.ys = array("d", [finish_y])
+        self.dir_x = array("d", [1.0])
+        self.dir_y = array("d", [0.0])
+        for fraction in fractions:
+            position = fraction * count
+            i = (finish_station + int(round(position))) % count
+            self.stations.append(i)
+            self.positions.append(position)
+            self.xs.append(line.xs[i])
+            self.ys.append(line.ys[i])
+            self.dir_x.append(math.cos(line.headings[i]))
+            self.dir_y.append(math.sin(line.headings[i]))
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def next_line(self, position: float) -> int:
+        """The first line ahead of a car `position` stations past the finish (mod a lap)."""
+        for k in range(1, len(self.positions)):
+            if self.positions[k] > position:
+                return k
+        return 0
+
+    def near(self, k: int, station: int) -> bool:
+        gap = (station - self.stations[k]) % self.laps
+        return gap <= self.window or gap >= self.laps - self.window
+
+    def crossing(self, k: int, x0: float, y0: float, x1: float, y1: float):
+        """Where the move from (x0, y0) to (x1, y1) crosses line `k`, if it does.
+
+        Returns (fraction of the move, True if crossed forwards), or None.
+        """
+        cx = self.xs[k]
+        cy = self.ys[k]
+        dx = self.dir_x[k]
+        dy = self.dir_y[k]
+        a0 = (x0 - cx) * dx + (y0 - cy) * dy
+        a1 = (x1 - cx) * dx + (y1 - cy) * dy
+        if a0 < 0.0 <= a1:
+            forward = True
+        elif a1 < 0.0 <= a0:
+            forward = False
+        else:
+            return None
+        t = a0 / (a0 - a1)
+        px = x0 + (x1 - x0) * t
+        py = y0 + (y1 - y0) * t
+        if abs((py - cy) * dx - (px - cx) * dy) > self.half:
+            return None
+        return t, forward
+
+
+def catmull_rom(points):
+    """Closed uniform Catmull-Rom spline through `points`, a list of (x, y).
+
+    Returns `curve(t)` for t in [0, len(points)), passing through point `i`
+    at t = i, in the form CentreLine.from_curve expects.
+    """
+    count = len(points)
+
+    def curve(t):
+        i = int(t) % count
+        u = t - int(t)
+        x0, y0 = points[i - 1]
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % count]
+        x3, y3 = points[(i + 2) % count]
+        # 0.5 * (2 p1 + b u + c u^2 + d u^3)
+        bx, by = x2 - x0, y2 - y0
+        cx, cy = 2 * x0 - 5 * x1 + 4 * x2 - x3, 2 * y0 - 5 * y1 + 4 * y2 - y3
+        dx, dy = 3 * (x1 - x2) + x3 - x0, 3 * (y1 - y2) + y3 - y0
+        return (
+            x1 + 0.5 * u * (bx + u * (cx + u * dx)),
+            y1 + 0.5 * u * (by + u * (cy + u * dy)),
+            0.5 * bx + u * (cx + 1.5 * u * dx),
+            0.5 * by + u * (cy + 1.5 * u * dy),
+            cx + 3 * u * dx,
+            cy + 3 * u * dy,
+        )
+
+    return curve
+
+
+def track_path(ref: str) -> str:
+    """Path of a track given either a file path or a name under tracks/."""
+    if os.path.exists(ref):
+        return ref
+    return os.path.join(TRACKS_DIR, f"{ref}.json")
+
+
+def builtin_name(ref: str):
+    """The name of the track under tracks/ that `ref` refers to, or None for any other file."""
+    path = os.path.abspath(track_path(ref))
+    if os.path.dirname(path) != TRACKS_DIR:
+        return None
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _runs(flags):
+    """(start, end) station ranges, end exclusive, where `flags` is set on a closed lap.
+
+    A run through station 0 comes back as one range with end past the count.
+    """
+    count = len(flags)
+    if all(flags):
+        return [(0, count)]
+    first = next(i for i in range(count) if not flags[i])
+    runs = []
+    start = None
+    for k in range(first, first + count + 1):
+        on = k < first + count and flags[k % count]
+        if on and start is None:
+            start = k
+        elif not on and start is not None:
+            runs.append((start % count, start % count + k - start))
+            start = None
+    return runs
+
+
+class Track:
+    """A track loaded from a JSON file under tracks/, plus everything derived from it.
+
+    The file gives the centreline as control points of a closed Catmull-Rom
+    spline, in driving order, along with the road width, the finish, the
+    painted grid slots as (x, y, heading), any crossings and optionally the
+    size of the world round the track (the window size if not given) and
+    where the sector lines fall, as fractions of a lap from the finish:
+
+        {"name": "...", "width": 90, "points": [[x, y], ...],
+         "finish": [x, y], "grid": [[x, y, angle], ...],
+         "crossings": [{"centre": [x, y], "zone": 135, "bridge": [i, j]}],
+         "size": [w, h], "runoff": 30, "sectors": [0.33, 0.67]}
+
+    `bridge` is the range of control points (wrapping past the last one if
+    i > j) carried over the crossing; inside the square `zone` pixels either
+    side of `centre` cars keep the level they arrived on. The finish is a
+    vertical line crossed left to right. Barriers run `runoff` pixels outside
+    both edges of the road, except where they would cut into another stretch
+    of it.
+
+    Baking the arc-length table, the distance field, the barriers and the render geometry
+    takes a while in pure Python, so `load()` keeps the result in a binary
+    cache keyed by a hash of the track file and the bake settings.
+    """
+
+    def __init__(self, ref: str, meta: dict, line: CentreLine, on_bridge, field: TrackField,
+                 barriers: Barriers, render: dict) -> None:
+        self.ref = ref
+        self.name = meta["name"]
+        self.width = meta["width"]
+        self.size = tuple(meta["size"])  # (w, h) of the world, which may be larger than the window
+        self.finish = tuple(meta["finish"])
+        self.grid = [tuple(slot) for slot in meta["grid"]]
+        self.crossings = [tuple(crossing) for crossing in meta["crossings"]]  # (x, y, zone)
+        self.line = line
+        self.on_bridge = on_bridge  # 1 for each station carried over a crossing
+        self.field = field
+        self.runoff = meta["runoff"]
+        self.sectors = list(meta["sectors"])
+        self.timing = TimingLines(line, self.finish, self.sectors, self.width / 2 + self.runoff)
+        self.barriers = barriers
+        self.render = render
+
+    @classmethod
+    def load(cls, ref: str, width: float, height: float, cache_dir: str = CACHE_DIR) -> "Track":
+        """Load a track by name or path, from the baked cache when it is current.
+
+        `width` and `height` are the world size for files that don't give one.
+        """
+        with open(track_path(ref), "rb") as fh:
+            source = fh.read()
+        return cls.from_source(ref, source, width, height, cache_dir)
+
+    @classmethod
+    def from_source(cls, ref: str, source: bytes, width: float, height: float,
+                    cache_dir: str = CACHE_DIR) -> "Track":
+        """Like load(), for the JSON text of a track file already in hand."""
+        key = hashlib.sha1(
+            source + struct.pack("<Hddd", TRACK_VERSION, width, height, FIELD_CELL)
+            + struct.pack("<d", LINE_SPACING)
+        ).hexdigest()[:16]
+        stem = os.path.splitext(os.path.basename(ref))[0]
+        cache_path = os.path.join(cache_dir, f"track_{stem}_{key}.bin")
+        try:
+            return cls._load_baked(ref, cache_path)
+        except (OSError, ValueError, EOFError, KeyError):
+            pass
+
+        track = cls.bake(ref, source, width, height)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            track.save(cache_path)
+        except OSError:
+            pass  # A read-only checkout just bakes on every launch.
+        return track
+
+    @classmethod
+    def bake(cls, ref: str, source: bytes, width: float, height: float) -> "Track":
+        """Build every derived structure from the JSON text of a track file."""
+        try:
+            data = json.loads(source)
+            points = [(float(x), float(y)) for x, y in data["points"]]
+            meta = {
+                "name": str(data.get("name", ref)),
+                "width": float(data["width"]),
+                "size": [float(v) for v in data.get("size", (width, height))],
+                "finish": [float(v) for v in data["finish"]],
+                "grid": [[float(x), float(y), float(angle)] for x, y, angle in data["grid"]],
+                "crossings": [[float(c["centre"][0]), float(c["centre"][1]), float(c["zone"])]
+                              for c in data.get("crossings", ())],
+                "runoff": float(data.get("runoff", BARRIER_RUNOFF)),
+                "sectors": [float(v) for v in data.get("sectors", DEFAULT_SECTORS)],
+            }
+            bridges = [(int(c["bridge"][0]), int(c["bridge"][1])) for c in data.get("crossings", ())]
+        except (KeyError, TypeError, IndexError, ValueError) as exc:
+            raise ValueError(f"bad track file {ref}: {exc!r}") from None
+        if len(points) < 4 or not meta["grid"]:
+            raise ValueError(f"bad track file {ref}: needs at least 4 control points and a grid slot")
+        bounds = [0.0] + meta["sectors"] + [1.0]
+        if not all(a < b for a, b in zip(bounds, bounds[1:])):
+            raise ValueError(f"bad track file {ref}: sectors must be increasing fractions of a lap")
+
+        line, params = CentreLine.from_curve(catmull_rom(points), len(points))
+        count = line.count
+        on_bridge = array("B", bytes(count))
+        for first, last in bridges:
+            for i in range(count):
+                t = params[i]
+                if (first <= t <= last) if first <= last else (t >= first or t <= last):
+                    on_bridge[i] = 1
+
+        half_width = meta["width"] / 2
+        flat = [v for i in range(count) for v in (line.xs[i], line.ys[i])]
+        field = TrackField.bake(flat, half_width, *meta["size"])
+        barriers, walls = cls._bake_barriers(meta, line, on_bridge, field)
+        render = cls._render_geometry(meta, line, on_bridge)
+        render.update(walls)
+        return cls(ref, meta, line, on_bridge, field, barriers, render)
+
+    @staticmethod
+    def _bake_barriers(meta: dict, line: CentreLine, on_bridge, field: TrackField):
+        """The barriers along both road edges, and their polylines for drawing.
+
+        A wall vertex is dropped wherever it would sit closer than `runoff` to
+        the road: on the inside of bends tighter than the offset, and where
+        two stretches of track run close enough to share their runoff. At a
+        crossing the other level's road is expected to pass under or over the
+        wall, so there only nearby stations of the same branch count, and the
+        segments are tagged with their level.
+        """
+        count = line.count
+        xs = line.xs
+        ys = line.ys
+        half_width = meta["width"] / 2
+        offset = half_width + meta["runoff"]
+        clear = offset - BARRIER_TOLERANCE
+        reach = int(2 * offset / line.spacing) + 1
+
+        def in_zone(x, y):
+            return any(abs(x - cx) < zone and abs(y - cy) < zone for cx, cy, zone in meta["crossings"])
+
+        segments = array("f")
+        levels = array("B")
+        walls = {"barriers": [], "parapets": []}
+        stations = range(0, count, BARRIER_STRIDE)
+        for side in (-1.0, 1.0):
+            vertices = []
+            for i in stations:
+                heading = line.headings[i]
+                x = xs[i] - math.sin(heading) * offset * side
+                y = ys[i] + math.cos(heading) * offset * side
+                if in_zone(x, y):
+                    level = BARRIER_OVER if on_bridge[i] else BARRIER_UNDER
+                    near = min(math.hypot(xs[j % count] - x, ys[j % count] - y) for j in range(i - reach, i + reach + 1))
+                else:
+                    level = BARRIER_ALL
+                    near = field.distance(x, y) + half_width
+                vertices.append((x, y, level) if near >= clear else None)
+
+            # One entry per gap between neighbouring vertices: its level, or None with no wall there.
+            spans = []
+            for k, start in enumerate(vertices):
+                end = vertices[(k + 1) % len(vertices)]
+                if start is None or end is None or (start[0], start[1]) == (end[0], end[1]):
+                    spans.append(None)
+                    continue
+                level = max(start[2], end[2])
+                segments.extend((start[0], start[1], end[0], end[1]))
+                levels.append(level)
+                spans.append(level)
+
+            # Join the spans into polylines, parapets apart so they can be drawn over the bridge.
+            kinds = [None if level is None else "parapets" if level == BARRIER_OVER else "barriers"
+                     for level in spans]
+            first = next((k for k in range(len(kinds)) if kinds[k] != kinds[k - 1]), 0)
+            flat = None
+            for k in range(first, first + len(kinds)):
+                kind = kinds[k % len(kinds)]
+                if kind is None:
+                    flat = None
+                    continue
+                if flat is None or kind != kinds[(k - 1) % len(kinds)]:
+                    start = vertices[k % len(vertices)]
+                    flat = array("f", (start[0], start[1]))
+                    walls[kind].append(flat)
+                end = vertices[(k + 1) % len(vertices)]
+                flat.extend((end[0], end[1]))
+
+        barriers = Barriers.build(segments, levels, *meta["size"])
+        return barriers, walls
+
+    @staticmethod
+    def _render_geometry(meta: dict, line: CentreLine, on_bridge) -> dict:
+        """Flat polylines for drawing: the road loop, bridge decks, their shadows and the dashes."""
+        count = line.count
+        xs = line.xs
+        ys = line.ys
+
+        def polyline(start, end, shift=0.0):
+            flat = array("f")
+            for k in list(range(start, end, RENDER_STRIDE)) + [end]:
+                flat.append(xs[k % count] + shift)
+                flat.append(ys[k % count] + shift)
+            return flat
+
+        def within(i, reach=None):
+            return any(math.hypot(xs[i] - cx, ys[i] - cy) < (zone if reach is None else reach)
+                       for cx, cy, zone in meta["crossings"])
+
+        bridge_runs = _runs(on_bridge)
+        shaded = [on_bridge[i] and within(i) for i in range(count)]
+        # Dashes on the lower level stop short of the crossing; the deck's own dashes cover it.
+        dashed = [not on_bridge[i] and not within(i, meta["width"] * 0.6) for i in range(count)]
+        return {
+            "road": polyline(0, count),
+            # One station past each end so a deck overlaps the road it joins.
+            "bridges": [polyline(start - 1, end) for start, end in bridge_runs],
+            "shadows": [polyline(start, end - 1, BRIDGE_SHADOW) for start, end in _runs(shaded)],
+            "dashes": ([polyline(start, end - 1) for start, end in _runs(dashed)]
+                       + [polyline(start - 1, end) for start, end in bridge_runs]),
+        }
+
+    def save(self, path: str) -> None:
+        field = self.field
+        arrays = [("xs", self.line.xs), ("ys", self.line.ys), ("headings", self.line.headings),
+                  ("curvatures", self.line.curvatures), ("on_bridge", self.on_bridge), ("field", field.values),
+                  ("road", self.render["road"])]
+        barriers = self.barriers
+        arrays += [("barrier_segments", barriers.segments), ("barrier_levels", barriers.levels),
+                   ("barrier_cells", barriers.cells), ("barrier_items", barriers.items)]
+        for kind in ("bridges", "shadows", "dashes", "barriers", "parapets"):
+            arrays += [(kind, flat) for flat in self.render[kind]]
+        meta = {
+            "name": self.name,
+            "width": self.width,
+            "size": list(self.size),
+            "finish": list(self.finish),
+            "grid": [list(slot) for slot in self.grid],
+            "crossings": [list(crossing) for crossing in self.crossings],
+            "runoff": self.runoff,
+            "sectors": self.sectors,
+            "spacing": self.line.spacing,
+            "field": [field.cols, field.rows, field.cell, field.max_dist, field.half_width],
+            "barriers": [barriers.cols, barriers.rows, barriers.cell],
+            "arrays": [[name, values.typecode, len(values)] for name, values in arrays],
+        }
+        blob = json.dumps(meta).encode()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(_TRACK_HEADER.pack(TRACK_MAGIC, TRACK_VERSION, len(blob)))
+            fh.write(blob)
+            for _, values in arrays:
+                values.tofile(fh)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _load_baked(cls, ref: str, path: str) -> "Track":
+        with open(path, "rb") as fh:
+            header = fh.read(_TRACK_HEADER.size)
+            if len(header) != _TRACK_HEADER.size:
+                raise ValueError(f"truncated track cache: {path}")
+            magic, version, meta_len = _TRACK_HEADER.unpack(header)
+            if magic != TRACK_MAGIC or version != TRACK_VERSION:
+                raise ValueError(f"stale track cache: {path}")
+            meta = json.loads(fh.read(meta_len))
+            render = {"bridges": [], "shadows": [], "dashes": [], "barriers": [], "parapets": []}
+            arrays = {}
+            for name, code, length in meta["arrays"]:
+                values = array(code)
+                values.fromfile(fh, length)
+                if name in render:
+                    render[name].append(values)
+                elif name in ("xs", "ys", "headings", "curvatures", "on_bridge", "field", "barrier_segments",
+                              "barrier_levels", "barrier_cells", "barrier_items"):
+                    arrays[name] = values
+                else:
+                    render[name] = values
+        line = CentreLine(arrays["xs"], arrays["ys"], arrays["headings"], arrays["curvatures"], meta["spacing"])
+        field = TrackField(*meta["field"], arrays["field"])
+        barriers = Barriers(*meta["barriers"], arrays["barrier_segments"], arrays["barrier_levels"],
+                            arrays["barrier_cells"], arrays["barrier_items"])
+        return cls(ref, meta, line, arrays["on_bridge"], field, barriers, render)
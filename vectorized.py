@@ -0,0 +1,752 @@
+"""Struct-of-arrays car state with batched NumPy physics for large fields.
+
+NumPy is optional: everything else in the game runs without it, and only
+`ArraySimulation` (plus the helpers here) needs it installed.
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+from simulation import (
+    BARRIER_RADIUS,
+    CAR_WIDTH,
+    COLLISION_DIST,
+    COUNTDOWN_SECONDS,
+    CHECKPOINTS_PER_LAP,
+    FRICTION_REFERENCE_HZ,
+    HOLD_STEPS,
+    INPUT_DOWN,
+    INPUT_LEFT,
+    INPUT_RIGHT,
+    INPUT_UP,
+    RELOCATE_DIST,
+    SAFE_TRAVEL,
+    Simulation,
+    barrier_response,
+    resort,
+)
+from track import BARRIER_OVER, BARRIER_UNDER
+
+
+PUSH_ONE_BY_ONE = 24  # push_off_barriers calls push_out per car for this many cars or fewer
+ALL_PAIRS_UP_TO = 32  # fields this small test every pair rather than sort the cars
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("the vectorized car store needs numpy: pip install numpy")
+
+
+def field_distance(field, xs, ys):
+    """Batched TrackField.distance for arrays of positions."""
+    grid = getattr(field, "_np_values", None)
+    if grid is None:
+        grid = np.frombuffer(field.values, dtype=np.float32).reshape(field.rows, field.cols)
+        field._np_values = grid
+
+    fx = xs / field.cell
+    fy = ys / field.cell
+    inside = (fx >= 0.0) & (fy >= 0.0) & (fx < field.cols - 1) & (fy < field.rows - 1)
+    c = np.clip(fx.astype(np.intp), 0, field.cols - 2)
+    r = np.clip(fy.astype(np.intp), 0, field.rows - 2)
+    tx = fx - c
+    ty = fy - r
+    top = grid[r, c] + (grid[r, c + 1] - grid[r, c]) * tx
+    bottom = grid[r + 1, c] + (grid[r + 1, c + 1] - grid[r + 1, c]) * tx
+    return np.where(inside, top + (bottom - top) * ty, field.far)
+
+
+def drive(field, params: dict, dt: float, x, y, angle, vel, throttle, steer, off_track, off_track_time):
+    """Simulation.step's handling for arrays of cars, in place, in one step of `dt`.
+
+    `throttle` and `steer` run from -1 to 1 per car. Leaves `off_track` set
+    for the cars that ended up off the road, adds `dt` to their
+    `off_track_time`, and returns the field distance at every car (before
+    any clamping), for the caller's barrier test.
+    """
+    vel += throttle * (params["car_speed"] * dt)
+    angle += steer * (params["turn_speed"] * dt)
+    vel *= params["friction"] ** (dt * FRICTION_REFERENCE_HZ)
+
+    x += np.cos(angle) * vel * dt
+    y += np.sin(angle) * vel * dt
+
+    distance = field_distance(field, x, y)
+    np.greater(distance, 0.0, out=off_track)
+    vel[off_track] *= params["off_track_friction"] ** (dt * FRICTION_REFERENCE_HZ)
+    off_track_time[off_track] += dt
+    return distance
+
+
+def walk_stations(line_x, line_y, stations, xs, ys):
+    """Batched CentreLine.track: the closest station to each (x, y), walking from `stations`.
+
+    Each car walks forwards while the next station is closer, then
+    backwards, exactly as the dict path does, so it keeps to its own branch
+    through a crossing however far it moved. The walk is replayed on the
+    distances to a small window of stations round the last one; the rare
+    car that walks off the end of it carries on a station at a time.
+    Returns (stations, squared distances).
+    """
+    count = len(line_x)
+    rows = np.arange(len(stations))
+    window = (stations[:, None] + np.arange(-2, 4)) % count  # the last station is column 2
+    dist = (line_x[window] - xs[:, None]) ** 2 + (line_y[window] - ys[:, None]) ** 2
+    # Steps taken: while each station is closer than the one before it.
+    # Having moved forwards, the station behind is the one it left, so it
+    # can't walk back.
+    closer = dist[:, 1:] < dist[:, :-1]  # station k + 1 closer than station k
+    further = dist[:, :-1] < dist[:, 1:]  # station k closer than station k + 1
+    ahead1 = closer[:, 2]
+    ahead2 = ahead1 & closer[:, 3]
+    ahead3 = ahead2 & closer[:, 4]
+    behind1 = further[:, 1] & ~ahead1
+    behind2 = behind1 & further[:, 0]
+    pick = 2 + ahead1.astype(np.intp) + ahead2 + ahead3 - behind1 - behind2
+    found = window[rows, pick]
+    best = dist[rows, pick]
+    for step, edge in ((1, ahead3), (-1, behind2)):
+        cars = np.flatnonzero(edge)
+        while len(cars):
+            i = (found[cars] + step) % count
+            next_dist = (line_x[i] - xs[cars]) ** 2 + (line_y[i] - ys[cars]) ** 2
+            nearer = next_dist < best[cars]
+            cars = cars[nearer]
+            found[cars] = i[nearer]
+            best[cars] = next_dist[nearer]
+    return found, best
+
+
+def _barrier_table(barriers):
+    """The barrier grid as arrays: a padded (cells + 1, most per cell) table of
+    segment indices with -1 for none (the last row is for points off the
+    grid), the segments as float64 rows and their levels."""
+    table = getattr(barriers, "_np_table", None)
+    if table is None:
+        cells = np.frombuffer(barriers.cells, dtype=np.uint32).astype(np.intp)
+        counts = np.diff(cells)
+        items = np.frombuffer(barriers.items, dtype=np.uint32)
+        index = np.full((len(counts) + 1, max(1, int(counts.max(initial=0)))), -1, dtype=np.intp)
+        for k in np.flatnonzero(counts).tolist():
+            index[k, :counts[k]] = items[cells[k]:cells[k + 1]]
+        segments = np.frombuffer(barriers.segments, dtype=np.float32).astype(float).reshape(-1, 4)
+        levels = np.frombuffer(barriers.levels, dtype=np.uint8)
+        table = barriers._np_table = (index, segments, levels)
+    return table
+
+
+def _segment_offsets(segments, column, xs, ys):
+    """Closest points of segments[column] to (xs, ys), and the offsets from them, as push_out works them out."""
+    seg = segments[column]
+    x0 = seg[..., 0]
+    y0 = seg[..., 1]
+    dx = seg[..., 2] - x0
+    dy = seg[..., 3] - y0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = ((xs - x0) * dx + (ys - y0) * dy) / (dx * dx + dy * dy)
+    t = np.clip(t, 0.0, 1.0)
+    px = x0 + dx * t
+    py = y0 + dy * t
+    return px, py, xs - px, ys - py
+
+
+def push_off_barriers(barriers, xs, ys, overpass, angles, vels, radius: float):
+    """Batched Barriers.push_out and barrier_response: (xs, ys, vels) after the push.
+
+    Up to PUSH_ONE_BY_ONE cars simply go through push_out one at a time,
+    which costs less than the fixed price of the NumPy calls below. Of more,
+    cars touching no wall where they stand can't be pushed at all, which one
+    test over every segment near every car settles. A few cars that are go
+    through push_out itself; more take the segments of their grid cell
+    column by column, in the same order as push_out, so the results match
+    the per-car code exactly either way.
+    """
+    index, segments, levels = _barrier_table(barriers)
+    xs = xs.copy()
+    ys = ys.copy()
+    vels = vels.copy()
+    if not len(segments):
+        return xs, ys, vels
+    if len(xs) <= PUSH_ONE_BY_ONE:
+        return _push_one_by_one(barriers, range(len(xs)), xs, ys, overpass, angles, vels, radius)
+    c = np.floor_divide(xs, barriers.cell).astype(np.intp)
+    r = np.floor_divide(ys, barriers.cell).astype(np.intp)
+    inside = (c >= 0) & (r >= 0) & (c < barriers.cols) & (r < barriers.rows)
+    index = index[np.where(inside, r * barriers.cols + c, len(index) - 1)]
+    skip = np.where(overpass, BARRIER_UNDER, BARRIER_OVER)[:, None]
+    r2 = radius * radius
+
+    _, _, ox, oy = _segment_offsets(segments, index, xs[:, None], ys[:, None])
+    d2 = ox * ox + oy * oy
+    touching = (index >= 0) & (levels[index] != skip) & (d2 < r2) & (d2 != 0.0)
+    cars = np.flatnonzero(touching.any(axis=1))
+    if len(cars) <= PUSH_ONE_BY_ONE:
+        return _push_one_by_one(barriers, cars.tolist(), xs, ys, overpass, angles, vels, radius)
+
+    index = index[cars]
+    skip = skip[cars, 0]
+    x = xs[cars]
+    y = ys[cars]
+    for column in index[:, :int((index >= 0).sum(axis=1).max())].T:
+        px, py, ox, oy = _segment_offsets(segments, column, x, y)
+        d2 = ox * ox + oy * oy
+        hit = (column >= 0) & (levels[column] != skip) & (d2 < r2) & (d2 != 0.0)
+        if hit.any():
+            scale = radius / np.sqrt(np.where(hit, d2, 1.0))
+            x = np.where(hit, px + ox * scale, x)
+            y = np.where(hit, py + oy * scale, y)
+
+    # barrier_response for the cars that were pushed.
+    nx = x - xs[cars]
+    ny = y - ys[cars]
+    depth = np.sqrt(nx * nx + ny * ny)
+    angle = angles[cars]
+    vel = vels[cars]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        facing = (np.cos(angle) * nx + np.sin(angle) * ny) / depth
+    slow = (depth > 0.0) & (facing * vel < 0.0)
+    vels[cars] = np.where(slow, vel * (1.0 - np.abs(facing)), vel)
+    xs[cars] = x
+    ys[cars] = y
+    return xs, ys, vels
+
+
+def _push_one_by_one(barriers, cars, xs, ys, overpass, angles, vels, radius: float):
+    """push_off_barriers for the cars at indices `cars`, one call to push_out each; updates the arrays in place."""
+    push_out = barriers.push_out
+    for car in cars:
+        x = float(xs[car])
+        y = float(ys[car])
+        pushed = push_out(x, y, radius, bool(overpass[car]))
+        if pushed is not None:
+            xs[car], ys[car], vels[car] = barrier_response(x, y, float(angles[car]), float(vels[car]), *pushed)
+    return xs, ys, vels
+
+
+def collision_candidates(xs, ys, reach: float):
+    """Array broadphase: index arrays (a, b), a < b, of cars within `reach` of each other on x and on y.
+
+    Sweep and prune: after sorting the cars by x, each one pairs with the
+    run of cars after it that start within `reach`, found with one binary
+    search for the whole field, so the work grows with the number of cars
+    plus the number of pairs found. Pairs come back sorted by (a, b), the
+    order collision_pairs() gives them in.
+    """
+    order = np.argsort(xs, kind="stable")
+    sorted_x = xs[order]
+    counts = np.searchsorted(sorted_x, sorted_x + reach, "right") - np.arange(1, len(xs) + 1)
+    total = int(counts.sum())
+    # Sorted position i pairs with positions i + 1 .. i + counts[i].
+    first = np.repeat(np.arange(len(xs)), counts)
+    second = first + 1 + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    first = order[first]
+    second = order[second]
+    keep = np.abs(ys[second] - ys[first]) <= reach
+    a = np.minimum(first[keep], second[keep])
+    b = np.maximum(first[keep], second[keep])
+    pairs = np.argsort(a * len(xs) + b, kind="stable")
+    return a[pairs], b[pairs]
+
+
+class ArraySimulation(Simulation):
+    """Simulation whose per-car state lives in NumPy arrays.
+
+    Acceleration, steering, friction, integration, off-track friction,
+    clamping, barriers, path tracking, lap and sector timing and collisions
+    run as whole-array operations, with Python loops left only for the few
+    cars that need one each tick (fast movers and relocated cars), so large
+    fields cost far less per car than the dict path. With only a few cars
+    the fixed cost of each NumPy call dominates and the dict path is faster.
+    The car dicts in `self.cars` still hold names and liveries; call
+    `sync_cars()` to copy the dynamic state back into them when something
+    needs to read it.
+    """
+
+    def __init__(self, num_cars: int = 2, track=None, seed: int = 0, params: dict = None) -> None:
+        require_numpy()
+        super().__init__(num_cars, track, seed, params)
+        cars = self.cars
+        self.grid_x = np.array([car["x"] for car in cars])
+        self.grid_y = np.array([car["y"] for car in cars])
+        self.grid_angle = np.array([car["grid_angle"] for car in cars])
+        self.x = self.grid_x.copy()
+        self.y = self.grid_y.copy()
+        self.prev_x = self.x.copy()
+        self.prev_y = self.y.copy()
+        self.angle = self.grid_angle.copy()
+        self.prev_angle = self.angle.copy()
+        self.vel = np.zeros(len(cars))
+        self.laps = np.zeros(len(cars), dtype=np.int32)
+        self.last_lap_time = np.full(len(cars), self.time)
+        self.last_lap_duration = np.full(len(cars), np.nan)  # NaN = no lap yet
+        self.next_line = np.zeros(len(cars), dtype=np.int64)
+        self.timed_lap = np.zeros(len(cars), dtype=bool)
+        self.line_time = np.full(len(cars), np.nan)
+        self.last_sector = np.full(len(cars), -1, dtype=np.int64)
+        self.last_sector_duration = np.zeros(len(cars))
+        self.grid_overpass = np.array([car["on_overpass"] for car in cars], dtype=bool)
+        self.on_overpass = self.grid_overpass.copy()
+        self.off_track = np.zeros(len(cars), dtype=bool)
+        self.off_track_time = np.zeros(len(cars))
+        self.collisions = np.zeros(len(cars), dtype=np.int32)
+        self.contact_tick = np.full(len(cars), -2, dtype=np.int64)
+        self._bits = np.zeros(len(cars), dtype=np.int32)
+
+        line = self.line
+        self._line_x = np.asarray(line.xs)
+        self._line_y = np.asarray(line.ys)
+        self._line_cos = np.cos(np.asarray(line.headings))
+        self._line_sin = np.sin(np.asarray(line.headings))
+        self._line_bridge = np.frombuffer(self.on_bridge, dtype=np.uint8).astype(bool)
+        timing = self.timing
+        self._timing_x = np.asarray(timing.xs)
+        self._timing_y = np.asarray(timing.ys)
+        self._timing_dir_x = np.asarray(timing.dir_x)
+        self._timing_dir_y = np.asarray(timing.dir_y)
+        self._timing_station = np.asarray(timing.stations, dtype=np.int64)
+        self._all_pairs = np.triu_indices(len(cars), 1)
+        self.station = np.zeros(len(cars), dtype=np.int64)
+        self.stations = np.zeros(len(cars), dtype=np.int64)
+        self.progress = np.zeros(len(cars))
+        self.checkpoint = np.zeros(len(cars), dtype=np.int64)
+        self.gap = np.zeros(len(cars))
+        self._load_progress()
+
+    def step(self, dt: float, inputs, partial=None) -> None:
+        self.time += dt
+        self.ticks += 1
+        now = self.time
+
+        self._update_start_sequence(now)
+
+        self.prev_x[:] = self.x
+        self.prev_y[:] = self.y
+        self.prev_angle[:] = self.angle
+
+        if self.race_active:
+            bits = self._bits
+            bits[:] = 0
+            count = min(len(inputs), len(bits))
+            bits[:count] = inputs[:count]
+
+            throttle = (bits & INPUT_UP != 0).astype(float) - (bits & INPUT_DOWN != 0)
+            steer = (bits & INPUT_RIGHT != 0).astype(float) - (bits & INPUT_LEFT != 0)
+            if partial:
+                for idx, (car_throttle, car_steer) in partial.items():
+                    if idx < len(bits):
+                        throttle[idx] = car_throttle / HOLD_STEPS
+                        steer[idx] = car_steer / HOLD_STEPS
+            # Cars about to move too far for one step are redone in substeps below.
+            fast = np.flatnonzero(np.abs(self.vel) * dt > SAFE_TRAVEL)
+            if len(fast):
+                start_state = (self.x[fast].tolist(), self.y[fast].tolist(), self.angle[fast].tolist(),
+                               self.vel[fast].tolist(), self.off_track_time[fast].tolist())
+            distance = drive(self.track_field, self.params, dt, self.x, self.y, self.angle, self.vel,
+                             throttle, steer, self.off_track, self.off_track_time)
+            if len(fast):
+                self._substep(fast.tolist(), start_state, dt, partial)
+
+            self._clamp_all()
+            self._hit_barriers_all(fast, distance)
+        else:
+            self.vel[:] = 0.0
+
+        self._update_paths()
+        self._update_progress(now)
+        if self.race_active:
+            self._check_timing_all(now, dt)
+        self._resolve_collisions()
+
+    def _substep(self, fast, start_state, dt: float, partial=None) -> None:
+        """Integrate the cars at indices `fast` again from `start_state`, in short substeps.
+
+        Mirrors the substep loop in Simulation.step one car at a time; there
+        are rarely more than a few such cars.
+        """
+        params = self.params
+        bits = self._bits
+        is_on_track = self.track_field.is_on_track
+        distance = self.track_field.distance
+        push_out = self.barriers.push_out
+        clear = self.barrier_clear
+        max_x = self.world_w - CAR_WIDTH
+        max_y = self.world_h - CAR_WIDTH
+        for i, idx in enumerate(fast):
+            x, y, angle, vel, off_track_time = (column[i] for column in start_state)
+            substeps = math.ceil(abs(vel) * dt / SAFE_TRAVEL)
+            step_dt = dt / substeps
+            accel = params["car_speed"] * step_dt
+            turn = params["turn_speed"] * step_dt
+            friction = params["friction"] ** (step_dt * FRICTION_REFERENCE_HZ)
+            off_track_friction = params["off_track_friction"] ** (step_dt * FRICTION_REFERENCE_HZ)
+            car_bits = int(bits[idx])
+            hold = partial.get(idx) if partial else None
+            if hold is not None:
+                throttle = hold[0] / HOLD_STEPS
+                steer = hold[1] / HOLD_STEPS
+            on_overpass = bool(self.on_overpass[idx])
+            for _ in range(substeps):
+                if hold is not None:
+                    vel += throttle * accel
+                    angle += steer * turn
+                else:
+                    if car_bits & INPUT_UP:
+                        vel += accel
+                    if car_bits & INPUT_DOWN:
+                        vel -= accel
+                    if car_bits & INPUT_LEFT:
+                        angle -= turn
+                    if car_bits & INPUT_RIGHT:
+                        angle += turn
+                vel *= friction
+                x += math.cos(angle) * vel * step_dt
+                y += math.sin(angle) * vel * step_dt
+                off_track = not is_on_track(x, y)
+                if off_track:
+                    vel *= off_track_friction
+                    off_track_time += step_dt
+                x = max(CAR_WIDTH, min(max_x, x))
+                y = max(CAR_WIDTH, min(max_y, y))
+                if distance(x, y) >= clear or self._in_crossing_zone(x, y):
+                    pushed = push_out(x, y, BARRIER_RADIUS, on_overpass)
+                    if pushed is not None:
+                        x, y, vel = barrier_response(x, y, angle, vel, *pushed)
+            self.x[idx] = x
+            self.y[idx] = y
+            self.angle[idx] = angle
+            self.vel[idx] = vel
+            self.off_track[idx] = off_track
+            self.off_track_time[idx] = off_track_time
+
+    def _update_start_sequence(self, now: float) -> None:
+        if self.race_active or now - self.countdown_start < COUNTDOWN_SECONDS:
+            return
+
+        self.race_active = True
+        self.last_lap_time[:] = now
+        self.last_lap_duration[:] = np.nan
+
+    def reset(self) -> None:
+        super().reset()
+        self.x[:] = self.grid_x
+        self.y[:] = self.grid_y
+        self.prev_x[:] = self.x
+        self.prev_y[:] = self.y
+        self.angle[:] = self.grid_angle
+        self.prev_angle[:] = self.angle
+        self.vel[:] = 0.0
+        self.laps[:] = 0
+        self.last_lap_time[:] = self.time
+        self.last_lap_duration[:] = np.nan
+        self.on_overpass[:] = self.grid_overpass
+        self.off_track[:] = False
+        self.off_track_time[:] = 0.0
+        self.collisions[:] = 0
+        self.contact_tick[:] = -2
+        self._load_progress()
+
+    def _load_progress(self) -> None:
+        """Copy the progress Simulation placed into the car dicts into the arrays."""
+        for idx, car in enumerate(self.cars):
+            self.station[idx] = car["station"]
+            self.stations[idx] = car["stations"]
+            self.progress[idx] = car["progress"]
+            self.checkpoint[idx] = car["checkpoint"]
+            self.gap[idx] = car["gap"]
+            self.next_line[idx] = car["next_line"]
+            self.timed_lap[idx] = car["timed_lap"]
+            self.line_time[idx] = car["line_time"]
+            self.last_sector[idx] = car["last_sector"]
+            self.last_sector_duration[idx] = car["last_sector_duration"]
+
+    def standings(self):
+        return resort(self.order, self.progress.tolist())
+
+    def sync_cars(self) -> None:
+        """Copy the array state back into the per-car dicts."""
+        for idx, car in enumerate(self.cars):
+            car["x"] = float(self.x[idx])
+            car["y"] = float(self.y[idx])
+            car["prev_x"] = float(self.prev_x[idx])
+            car["prev_y"] = float(self.prev_y[idx])
+            car["angle"] = float(self.angle[idx])
+            car["prev_angle"] = float(self.prev_angle[idx])
+            car["vel"] = float(self.vel[idx])
+            car["laps"] = int(self.laps[idx])
+            car["last_lap_time"] = float(self.last_lap_time[idx])
+            duration = self.last_lap_duration[idx]
+            car["last_lap_duration"] = None if np.isnan(duration) else float(duration)
+            car["next_line"] = int(self.next_line[idx])
+            car["timed_lap"] = bool(self.timed_lap[idx])
+            car["line_time"] = float(self.line_time[idx])
+            car["last_sector"] = int(self.last_sector[idx])
+            car["last_sector_duration"] = float(self.last_sector_duration[idx])
+            car["on_overpass"] = bool(self.on_overpass[idx])
+            car["off_track"] = bool(self.off_track[idx])
+            car["off_track_time"] = float(self.off_track_time[idx])
+            car["collisions"] = int(self.collisions[idx])
+            car["station"] = int(self.station[idx])
+            car["stations"] = int(self.stations[idx])
+            car["progress"] = float(self.progress[idx])
+            car["checkpoint"] = int(self.checkpoint[idx])
+            car["gap"] = float(self.gap[idx])
+
+    def _clamp_all(self) -> None:
+        np.clip(self.x, CAR_WIDTH, self.world_w - CAR_WIDTH, out=self.x)
+        np.clip(self.y, CAR_WIDTH, self.world_h - CAR_WIDTH, out=self.y)
+
+    def _hit_barriers_all(self, fast, distance) -> None:
+        """Simulation._hit_barriers for every car but the `fast` ones, which _substep has done.
+
+        `distance` is the off-track test's field distance from before the
+        clamp to the world; the clearance the test leaves covers the difference.
+        """
+        x = self.x
+        y = self.y
+        near = distance >= self.barrier_clear
+        for cx, cy, zone in self.crossings:
+            near |= (np.abs(x - cx) < zone) & (np.abs(y - cy) < zone)
+        near[fast] = False
+        near = np.flatnonzero(near)
+        if len(near):
+            x[near], y[near], self.vel[near] = push_off_barriers(
+                self.barriers, x[near], y[near], self.on_overpass[near], self.angle[near], self.vel[near],
+                BARRIER_RADIUS)
+
+    def _check_timing_all(self, now: float, dt: float) -> None:
+        """Simulation._check_timing for every car, on arrays.
+
+        A cheap side-of-line test picks out the cars whose move ended on the
+        other side of the line ahead of or behind them; only those take the
+        full crossing test, and only the best sector times are updated in Python.
+        """
+        lines = len(self.timing)
+        ahead = self.next_line
+        behind = (ahead - 1) % lines
+        moved = np.zeros(len(self.x), dtype=bool)
+        for line in (ahead, behind):
+            cx = self._timing_x[line]
+            cy = self._timing_y[line]
+            dx = self._timing_dir_x[line]
+            dy = self._timing_dir_y[line]
+            a0 = (self.prev_x - cx) * dx + (self.prev_y - cy) * dy
+            a1 = (self.x - cx) * dx + (self.y - cy) * dy
+            moved |= (a0 < 0.0) != (a1 < 0.0)
+        cars = np.flatnonzero(moved)
+        if not len(cars):
+            return
+
+        ahead = ahead[cars]
+        behind = behind[cars]
+        hit, forward, t = self._line_crossings(cars, ahead)
+        crossed = hit & forward
+        hit, forward, _ = self._line_crossings(cars, behind)
+        backed = hit & ~forward & ~crossed
+        if backed.any():
+            # Reversed over the line behind: it has to be crossed again, and
+            # the sector that follows can't be timed.
+            idx = cars[backed]
+            line = behind[backed]
+            self.next_line[idx] = line
+            self.line_time[idx] = np.nan
+            self.timed_lap[idx[line == 0]] = False
+        if crossed.any():
+            self._cross_lines(cars[crossed], ahead[crossed], now - dt * (1.0 - t[crossed]))
+
+    def _line_crossings(self, cars, lines):
+        """TimingLines.near and .crossing for the moves of `cars`, each against one of `lines`.
+
+        Returns (hit, forward, t) arrays: whether the move crossed the line
+        within its reach, whether forwards, and at what fraction of the move.
+        """
+        timing = self.timing
+        gap = (self.station[cars] - self._timing_station[lines]) % timing.laps
+        near = (gap <= timing.window) | (gap >= timing.laps - timing.window)
+        cx = self._timing_x[lines]
+        cy = self._timing_y[lines]
+        dx = self._timing_dir_x[lines]
+        dy = self._timing_dir_y[lines]
+        x0 = self.prev_x[cars]
+        y0 = self.prev_y[cars]
+        x1 = self.x[cars]
+        y1 = self.y[cars]
+        a0 = (x0 - cx) * dx + (y0 - cy) * dy
+        a1 = (x1 - cx) * dx + (y1 - cy) * dy
+        forward = a0 < 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = a0 / (a0 - a1)  # only used where the signs differ
+        px = x0 + (x1 - x0) * t
+        py = y0 + (y1 - y0) * t
+        hit = near & (forward != (a1 < 0.0)) & (np.abs((py - cy) * dx - (px - cx) * dy) <= timing.half)
+        return hit, forward, t
+
+    def _cross_lines(self, cars, lines, when) -> None:
+        """Simulation._cross_line for each of `cars`, over its line in `lines` at its time in `when`."""
+        count = len(self.timing)
+        self.next_line[cars] = (lines + 1) % count
+        duration = when - self.line_time[cars]
+        self.line_time[cars] = when
+        timed = duration == duration  # NaN when the car didn't start the sector on its line
+        if timed.any():
+            sectors = (lines[timed] - 1) % count
+            durations = duration[timed]
+            self.last_sector[cars[timed]] = sectors
+            self.last_sector_duration[cars[timed]] = durations
+            best = self.best_sectors
+            for sector, sector_time in zip(sectors.tolist(), durations.tolist()):
+                if sector_time < best[sector]:
+                    best[sector] = sector_time
+        finish = lines == 0
+        if finish.any():
+            # Lines are only ever crossed in order, so a car that has been
+            # over the finish before has done every sector since.
+            idx = cars[finish]
+            lapped = self.timed_lap[idx]
+            done = idx[lapped]
+            when = when[finish][lapped]
+            self.laps[done] += 1
+            self.last_lap_duration[done] = when - self.last_lap_time[done]
+            self.last_lap_time[done] = when
+            self.timed_lap[idx] = True
+
+    def _update_paths(self) -> None:
+        """Array version of Simulation._update_car_path."""
+        away = np.ones(len(self.x), dtype=bool)
+        for cx, cy, zone in self.crossings:
+            away &= (np.abs(self.x - cx) >= zone) | (np.abs(self.y - cy) >= zone)
+        self.on_overpass[away] = self._line_bridge[self.station[away]]
+
+    def _update_progress(self, now: float) -> None:
+        """Array version of Simulation._update_progress."""
+        line = self.line
+        count = line.count
+        station, dist = walk_stations(self._line_x, self._line_y, self.station, self.x, self.y)
+        for idx in np.nonzero(dist > RELOCATE_DIST ** 2)[0].tolist():
+            probe = {"x": float(self.x[idx]), "y": float(self.y[idx]), "on_overpass": bool(self.on_overpass[idx])}
+            station[idx] = self._nearest_station(probe)
+
+        half = count // 2
+        self.stations += (station - self.station + half) % count - half
+        self.station[:] = station
+        along = (self.x - self._line_x[station]) * self._line_cos[station]
+        along += (self.y - self._line_y[station]) * self._line_sin[station]
+        np.divide(self.stations + along / line.spacing, count, out=self.progress)
+
+        checkpoint = np.floor(self.progress * CHECKPOINTS_PER_LAP).astype(np.int64)
+        passed = np.nonzero(checkpoint > self.checkpoint)[0]
+        if len(passed):
+            times = self.checkpoint_times
+            for idx in passed.tolist():
+                reached = int(checkpoint[idx])
+                self.checkpoint[idx] = reached
+                if reached >= 0:
+                    while len(times) <= reached:
+                        times.append(now)
+                    self.gap[idx] = now - times[reached]
+
+    def _resolve_collisions(self) -> None:
+        """Simulation._resolve_collisions over arrays of candidate pairs.
+
+        The per-pair tests, the backing up of swept pairs and the summed
+        pushes are the same float operations in the same order as the dict
+        path, so both end up in exactly the same place.
+        """
+        num_cars = len(self.x)
+        if num_cars < 2:
+            return
+
+        x = self.x
+        y = self.y
+        prev_x = self.prev_x
+        prev_y = self.prev_y
+        travel = np.abs(x - prev_x)
+        travel += np.abs(y - prev_y)
+        fastest = float(travel.max())
+        cell = COLLISION_DIST if fastest <= SAFE_TRAVEL else COLLISION_DIST + 2.0 * fastest
+        if num_cars <= ALL_PAIRS_UP_TO:
+            a, b = self._all_pairs
+        else:
+            a, b = collision_candidates(x, y, cell)
+        dx = x[b] - x[a]
+        dy = y[b] - y[a]
+        # Only pairs that end the step within `cell` of each other can have touched.
+        keep = np.flatnonzero(dx * dx + dy * dy <= cell * cell)
+        if self.crossings and len(keep):
+            # Drop pairs with one car on the bridge and the other underneath.
+            ka = a[keep]
+            kb = b[keep]
+            apart = self.on_overpass[ka] != self.on_overpass[kb]
+            for cx, cy, size in self.crossings:
+                apart &= ((np.abs(x[ka] - cx) < size) & (np.abs(y[ka] - cy) < size)
+                          & (np.abs(x[kb] - cx) < size) & (np.abs(y[kb] - cy) < size))
+            keep = keep[~apart]
+        if not len(keep):
+            return
+        a = a[keep]
+        b = b[keep]
+        dx = dx[keep]
+        dy = dy[keep]
+
+        met = None
+        if fastest > SAFE_TRAVEL:
+            swept = np.flatnonzero((travel[a] > SAFE_TRAVEL) | (travel[b] > SAFE_TRAVEL))
+            sa = a[swept]
+            sb = b[swept]
+            px = prev_x[sb] - prev_x[sa]
+            py = prev_y[sb] - prev_y[sa]
+            vx = (x[sb] - prev_x[sb]) - (x[sa] - prev_x[sa])
+            vy = (y[sb] - prev_y[sb]) - (y[sa] - prev_y[sa])
+            closing = px * vx + py * vy
+            gap = px * px + py * py - COLLISION_DIST * COLLISION_DIST
+            vv = vx * vx + vy * vy
+            disc = closing * closing - vv * gap
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.where(gap > 0.0, (-closing - np.sqrt(disc)) / vv, 0.0)
+            # Pairs closing in are judged where they first touched, and
+            # dropped if they never did; the rest by where they ended up.
+            closing_in = closing < 0.0
+            touched = (gap <= 0.0) | ((disc >= 0.0) & (t < 1.0))
+            missed = swept[closing_in & ~touched]
+            closing_in &= touched
+            met = np.zeros(len(a), dtype=bool)
+            met[swept] = closing_in
+            t = t[closing_in]
+            dx[met] = px[closing_in] + vx[closing_in] * t
+            dy[met] = py[closing_in] + vy[closing_in] * t
+
+            if len(t):
+                first = np.ones(num_cars)
+                np.minimum.at(first, a[met], t)
+                np.minimum.at(first, b[met], t)
+                back = np.flatnonzero(first < 1.0)
+                x[back] = prev_x[back] + (x[back] - prev_x[back]) * first[back]
+                y[back] = prev_y[back] + (y[back] - prev_y[back]) * first[back]
+
+        dist = np.sqrt(dx * dx + dy * dy)
+        touch = dist < COLLISION_DIST
+        if met is not None:
+            touch |= met
+            touch[missed] = False
+        touch &= dist != 0.0
+        touch = np.flatnonzero(touch)
+        if not len(touch):
+            return
+        dist = dist[touch]
+        overlap = np.maximum(0.0, COLLISION_DIST - dist)
+        push_x = dx[touch] / dist * overlap * 0.5
+        push_y = dy[touch] / dist * overlap * 0.5
+        # Pair by pair, a then b: bincount adds in that order, as the dict path does.
+        cars = np.column_stack((a[touch], b[touch])).ravel()
+        shift_x = np.bincount(cars, np.column_stack((-push_x, push_x)).ravel(), num_cars)
+        shift_y = np.bincount(cars, np.column_stack((-push_y, push_y)).ravel(), num_cars)
+
+        np.multiply.at(self.vel, cars, -self.params["collision_damping"])
+        hit = np.unique(cars)
+        x[hit] = np.minimum(np.maximum(x[hit] + shift_x[hit], CAR_WIDTH), self.world_w - CAR_WIDTH)
+        y[hit] = np.minimum(np.maximum(y[hit] + shift_y[hit], CAR_WIDTH), self.world_h - CAR_WIDTH)
+        self.collisions[hit[self.contact_tick[hit] < self.ticks - 1]] += 1
+        self.contact_tick[hit] = self.ticks